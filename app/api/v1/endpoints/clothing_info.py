@@ -1,21 +1,530 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.schemas.image_analysis import ClothingAnalysisResponse
-from app.services.image_analysis import analyze_clothing
+from typing import List, Literal, Optional, Tuple
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from app.schemas.image_analysis import ClothingAnalysisResponse, BatchItemResult
+from app.schemas.jobs import BatchStatus, BatchSubmission, JobStatus, JobSubmission
+from app.schemas.results import StoredAnalysis
+from app.services.image_analysis import analyze_clothing, analyze_clothing_stream, postprocess_outputs
+from app.services.batch_analysis import analyze_batch, extract_archive_images, is_archive, is_image
+from app.services.video_analysis import analyze_frames, extract_video_frames, is_video, sample_frame_sequence
+from app.services.job_queue import FINISHED_STATES, NewJob, get_job_queue
+from app.services.result_cache import result_cache
+from app.services.result_store import ResultQuery, get_result_store
+from app.services.admission import Priority, get_admission_controller
+from app.services.ollama_client import get_pool
+from app.services.micro_batcher import get_micro_batcher
+from app.services.framing import get_framing_analyzer
+from app.services.trace import AnalysisTrace
+from app.core.config import settings
+from app.core.prompts import prompts
+import asyncio
+import json
+import uuid
 
 router = APIRouter()
 
+# Uploads are read in chunks so oversized files are rejected without buffering them whole
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def _read_upload(file: UploadFile, limit: Optional[int] = None) -> bytes:
+    """
+    Read an uploaded file into memory, enforcing a size limit.
+
+    Args:
+        file (UploadFile): The uploaded file
+        limit (Optional[int]): Maximum size in bytes, `settings.max_upload_bytes` by default;
+            callers sharing a request budget pass what is left of it
+
+    Raises:
+        HTTPException: 413 if the upload exceeds the limit, or the budget is used up
+    """
+    if limit is None:
+        limit = settings.max_upload_bytes
+    if limit <= 0:
+        raise HTTPException(
+            status_code=413,
+            detail=f"No byte budget left for {file.filename or 'the upload'}; the request is too large"
+        )
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(_UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{file.filename or 'Upload'} exceeds the {limit} byte limit"
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
+
 @router.post("/analyze", response_model=ClothingAnalysisResponse)
-async def analyze_image_endpoint(file: UploadFile = File(...)):
+async def analyze_image_endpoint(
+    response: Response,
+    file: UploadFile = File(...),
+    no_cache: bool = Query(False, description="Skip the result cache and run the model"),
+    priority: Optional[Priority] = Query(None, description="Admission class: interactive (default) or bulk"),
+    cache_control: Optional[str] = Header(None),
+    x_priority: Optional[Priority] = Header(None)
+):
     """
     Endpoint to analyze an image using VLM model.
     Accepts an image file and returns a detailed description of its contents.
+    Send `?no_cache=true` or `Cache-Control: no-cache` to bypass cached results,
+    and `?priority=bulk` or `X-Priority: bulk` for non-interactive traffic.
+    When the analysis queue is full the endpoint answers 429 with `Retry-After`.
+    Per-stage timings are returned in the `Server-Timing` header and the prompt
+    version that produced the result in `X-Prompt-Version`.
     """
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    use_cache = not no_cache and "no-cache" not in (cache_control or "").lower()
+    trace = AnalysisTrace()
     try:
-        image = await file.read()
-        result = await analyze_clothing(image, file.filename)
+        with trace.stage("upload_read"):
+            image = await _read_upload(file)
+        result = await analyze_clothing(
+            image, file.filename, use_cache=use_cache, trace=trace, priority=priority or x_priority or "interactive"
+        )
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Prompt-Version"] = prompts.version
         return result
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _format_event(event: dict, stream_format: str) -> str:
+    """Serialise a streamed analysis event as an NDJSON line or a server-sent event."""
+    if stream_format == "sse":
+        return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+    return json.dumps(event) + "\n"
+
+@router.post(
+    "/analyze/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}, "text/event-stream": {}}}}
+)
+async def analyze_stream_endpoint(
+    file: UploadFile = File(...),
+    format: Literal["ndjson", "sse"] = Query("ndjson", description="Stream format: NDJSON lines or server-sent events"),
+    no_cache: bool = Query(False, description="Skip the result cache and run the model"),
+    priority: Optional[Priority] = Query(None, description="Admission class: interactive (default) or bulk"),
+    cache_control: Optional[str] = Header(None),
+    x_priority: Optional[Priority] = Header(None)
+):
+    """
+    Endpoint to analyze an image and stream partial results as they become available.
+    Emits `clothing_info` as soon as the main pass is parsed, then `eyewear` if
+    it was refined and `description_delta` events carrying the description
+    text as it is generated (these two interleave), and finally the complete
+    `result`. Each NDJSON line (or SSE
+    event) carries an `event` name and its `data`. Errors before the first
+    event are answered with a normal HTTP error status; later ones end the
+    stream with an `error` event.
+    """
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    use_cache = not no_cache and "no-cache" not in (cache_control or "").lower()
+    trace = AnalysisTrace()
+    with trace.stage("upload_read"):
+        image = await _read_upload(file)
+    events = analyze_clothing_stream(
+        image, file.filename, use_cache=use_cache, trace=trace, priority=priority or x_priority or "interactive"
+    )
+    # Wait for the first event so admission and validation failures get a real status code
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="Analysis produced no result")
+
+    async def stream_events():
+        try:
+            yield _format_event(first, format)
+            async for event in events:
+                yield _format_event(event, format)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"X-Prompt-Version": prompts.version, "Cache-Control": "no-cache"}
+    )
+
+async def _collect_batch_uploads(files: List[UploadFile]) -> Tuple[List[Tuple[str, bytes]], List[BatchItemResult]]:
+    """
+    Read the images of a batch upload, unpacking zip/tar archives.
+
+    Args:
+        files (List[UploadFile]): Uploaded images and archives
+
+    Returns:
+        Tuple[List[Tuple[str, bytes]], List[BatchItemResult]]: (filename, image) pairs
+            and error records for uploads that are neither images nor archives
+
+    Raises:
+        HTTPException: 413 if the batch exceeds the size or image count limit
+    """
+    items = []
+    rejected = []
+    total_bytes = 0
+    for file in files:
+        content_type = file.content_type or ""
+        if is_archive(file.filename, content_type):
+            data = await _read_upload(file, settings.batch_max_total_bytes - total_bytes)
+            members = await asyncio.to_thread(
+                extract_archive_images, data, file.filename,
+                max_bytes=settings.batch_max_total_bytes - total_bytes,
+                max_items=settings.batch_max_items - len(items)
+            )
+            items.extend(members)
+            total_bytes += sum(len(image) for _, image in members)
+        elif is_image(file.filename, content_type):
+            image = await _read_upload(
+                file, min(settings.max_upload_bytes, settings.batch_max_total_bytes - total_bytes)
+            )
+            items.append((file.filename, image))
+            total_bytes += len(image)
+        else:
+            rejected.append(BatchItemResult(
+                filename=file.filename or "",
+                status="error",
+                error="File must be an image or a zip/tar archive of images",
+                status_code=400
+            ))
+        if total_bytes > settings.batch_max_total_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch exceeds the {settings.batch_max_total_bytes} byte limit"
+            )
+        if len(items) > settings.batch_max_items:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch exceeds the {settings.batch_max_items} image limit"
+            )
+    return items, rejected
+
+@router.post(
+    "/analyze/batch",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}}
+)
+async def analyze_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    no_cache: bool = Query(False, description="Skip the result cache and run the model"),
+    cache_control: Optional[str] = Header(None)
+):
+    """
+    Endpoint to analyze many images in one request.
+    Accepts image files and/or zip/tar archives of images and streams back one
+    NDJSON `BatchItemResult` line per image as soon as it finishes.
+    """
+    use_cache = not no_cache and "no-cache" not in (cache_control or "").lower()
+    items, rejected = await _collect_batch_uploads(files)
+
+    async def stream_results():
+        for record in rejected:
+            yield record.model_dump_json() + "\n"
+        async for record in analyze_batch(items, use_cache=use_cache):
+            yield record.model_dump_json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@router.post(
+    "/analyze/video",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}}
+)
+async def analyze_video_endpoint(
+    files: List[UploadFile] = File(...),
+    sample_fps: Optional[float] = Query(None, gt=0, description="Frames per second to sample (default: VIDEO_SAMPLE_FPS)"),
+    source_fps: Optional[float] = Query(
+        None,
+        gt=0,
+        description="Frame rate of an uploaded frame sequence; without it every uploaded frame is considered"
+    ),
+    no_cache: bool = Query(False, description="Skip the result cache and run the model"),
+    priority: Optional[Priority] = Query(None, description="Admission class: interactive (default) or bulk"),
+    cache_control: Optional[str] = Header(None),
+    x_priority: Optional[Priority] = Header(None)
+):
+    """
+    Endpoint to analyze a short video or an ordered sequence of frames.
+    Accepts one video file (decoded with ffmpeg; animated GIF/WebP also work),
+    several image files in playback order, or a zip/tar archive of frames
+    (ordered by name). Frames are sampled at `sample_fps` and the model only
+    runs when the scene changes; other frames reuse the last result. Streams
+    back one NDJSON `FrameAnalysisResult` line per sampled frame, in order.
+    """
+    use_cache = not no_cache and "no-cache" not in (cache_control or "").lower()
+    sample_fps = sample_fps or settings.video_sample_fps
+    if len(files) == 1 and not is_archive(files[0].filename, files[0].content_type or ""):
+        file = files[0]
+        if not (is_video(file.filename, file.content_type or "") or is_image(file.filename, file.content_type or "")):
+            raise HTTPException(status_code=400, detail="File must be a video or an image")
+        data = await _read_upload(file, settings.video_max_bytes)
+        frames = await asyncio.to_thread(
+            extract_video_frames, data, file.filename, sample_fps, settings.video_max_frames
+        )
+    else:
+        images = []
+        total_bytes = 0
+        for file in files:
+            content_type = file.content_type or ""
+            if is_archive(file.filename, content_type):
+                data = await _read_upload(file, settings.video_max_bytes - total_bytes)
+                members = await asyncio.to_thread(
+                    extract_archive_images, data, file.filename,
+                    max_bytes=settings.video_max_bytes - total_bytes,
+                    max_items=settings.video_max_input_frames - len(images)
+                )
+                images.extend(sorted(members))
+                total_bytes += sum(len(image) for _, image in members)
+            elif is_image(file.filename, content_type):
+                if len(images) >= settings.video_max_input_frames:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Frame sequence exceeds the {settings.video_max_input_frames} frame limit"
+                    )
+                image = await _read_upload(file, settings.video_max_bytes - total_bytes)
+                images.append((file.filename, image))
+                total_bytes += len(image)
+            else:
+                raise HTTPException(status_code=400, detail=f"{file.filename} is not an image or an archive of images")
+        frames = sample_frame_sequence(images, source_fps, sample_fps, settings.video_max_frames)
+    if not frames:
+        raise HTTPException(status_code=400, detail="No frames to analyze")
+
+    async def stream_results():
+        async for record in analyze_frames(frames, use_cache=use_cache, priority=priority or x_priority or "interactive"):
+            yield record.model_dump_json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+# Seconds between keep-alive comments on an idle job event stream
+_JOB_EVENTS_HEARTBEAT = 15.0
+
+def _job_url(job_id: str) -> str:
+    return f"/api/{settings.api_version}/jobs/{job_id}"
+
+@router.post("/jobs", response_model=JobSubmission, status_code=202)
+async def submit_job_endpoint(
+    file: UploadFile = File(...),
+    no_cache: bool = Query(False, description="Skip the result cache and run the model"),
+    priority: Optional[Priority] = Query(None, description="Admission class: interactive (default) or bulk"),
+    cache_control: Optional[str] = Header(None),
+    x_priority: Optional[Priority] = Header(None)
+):
+    """
+    Endpoint to queue an image for analysis and return immediately.
+    The job is run by a worker; poll `status_url` (optionally with `?wait=`
+    seconds to long-poll) or subscribe to `events_url` for its result.
+    """
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    use_cache = not no_cache and "no-cache" not in (cache_control or "").lower()
+    image = await _read_upload(file)
+    [status] = await get_job_queue().submit([NewJob(
+        image=image, filename=file.filename, use_cache=use_cache, priority=priority or x_priority or "interactive"
+    )])
+    return JobSubmission(
+        job_id=status.job_id,
+        status=status.status,
+        status_url=_job_url(status.job_id),
+        events_url=f"{_job_url(status.job_id)}/events"
+    )
+
+@router.post("/jobs/batch", response_model=BatchSubmission, status_code=202)
+async def submit_batch_job_endpoint(
+    files: List[UploadFile] = File(...),
+    no_cache: bool = Query(False, description="Skip the result cache and run the model"),
+    priority: Priority = Query("bulk", description="Admission class of the batch's jobs"),
+    cache_control: Optional[str] = Header(None)
+):
+    """
+    Endpoint to queue many images at once, as image files and/or zip/tar archives.
+    Each image becomes one job of the returned batch. With a sqlite or redis
+    job queue, queued batches survive API restarts. Answers 400 when none of
+    the uploads holds an image that could be queued.
+    """
+    use_cache = not no_cache and "no-cache" not in (cache_control or "").lower()
+    items, rejected = await _collect_batch_uploads(files)
+    if not items:
+        reasons = "; ".join(f"{record.filename}: {record.error}" for record in rejected)
+        raise HTTPException(status_code=400, detail=f"No image could be queued{': ' + reasons if reasons else ''}")
+    batch_id = uuid.uuid4().hex
+    statuses = await get_job_queue().submit([
+        NewJob(image=image, filename=filename, use_cache=use_cache, priority=priority, batch_id=batch_id)
+        for filename, image in items
+    ])
+    return BatchSubmission(
+        batch_id=batch_id,
+        job_ids=[status.job_id for status in statuses],
+        rejected=rejected,
+        status_url=f"/api/{settings.api_version}/jobs/batches/{batch_id}"
+    )
+
+@router.get("/jobs/batches/{batch_id}", response_model=BatchStatus)
+async def batch_job_status_endpoint(batch_id: str):
+    """
+    Endpoint returning the progress of a batch: job counts per state and every job's status.
+    """
+    jobs = await get_job_queue().batch(batch_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    counts = {state: 0 for state in ("queued", "running", "done", "failed")}
+    for job in jobs:
+        counts[job.status] += 1
+    return BatchStatus(batch_id=batch_id, counts=counts, jobs=jobs)
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def job_status_endpoint(
+    job_id: str,
+    wait: float = Query(0.0, ge=0, le=60, description="Seconds to wait for the job to finish before answering")
+):
+    """
+    Endpoint returning a job's state and, once done, its result.
+    """
+    queue = get_job_queue()
+    status = await queue.get(job_id)
+    while status is not None and wait > 0 and status.status not in FINISHED_STATES:
+        started = asyncio.get_running_loop().time()
+        status = await queue.wait(job_id, wait, since=status.status)
+        wait -= asyncio.get_running_loop().time() - started
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@router.get(
+    "/jobs/{job_id}/events",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}}
+)
+async def job_events_endpoint(job_id: str):
+    """
+    Endpoint streaming a job's state changes as server-sent events.
+    Sends a `status` event with the full `JobStatus` on every change and
+    closes the stream once the job is done or failed.
+    """
+    queue = get_job_queue()
+    status = await queue.get(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream_events():
+        current = status
+        yield _format_event({"event": "status", "data": current.model_dump(mode="json")}, "sse")
+        while current.status not in FINISHED_STATES:
+            latest = await queue.wait(job_id, _JOB_EVENTS_HEARTBEAT, since=current.status)
+            if latest is None:
+                yield _format_event({"event": "error", "data": {"detail": "Job expired", "status_code": 404}}, "sse")
+                return
+            if latest.status == current.status:
+                yield ": keep-alive\n\n"
+                continue
+            current = latest
+            yield _format_event({"event": "status", "data": current.model_dump(mode="json")}, "sse")
+
+    return StreamingResponse(stream_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _result_query(
+    image_sha256: Optional[str] = Query(None, pattern="^[0-9a-fA-F]{64}$", description="SHA-256 of the image"),
+    since: Optional[float] = Query(None, description="Only analyses finished at or after this time (Unix seconds)"),
+    until: Optional[float] = Query(None, description="Only analyses finished before this time (Unix seconds)"),
+    model_name: Optional[str] = Query(None, description="Only analyses by this model"),
+    prompt_version: Optional[str] = Query(None, description="Only analyses with this prompt version")
+) -> ResultQuery:
+    if not settings.result_store_enabled:
+        raise HTTPException(status_code=404, detail="Result store is disabled")
+    return ResultQuery(
+        image_sha256=image_sha256.lower() if image_sha256 else None,
+        since=since,
+        until=until,
+        model_name=model_name,
+        prompt_version=prompt_version
+    )
+
+@router.get("/results", response_model=List[StoredAnalysis])
+async def stored_results_endpoint(
+    query: ResultQuery = Depends(_result_query),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of analyses, newest first"),
+    include_outputs: bool = Query(False, description="Attach the raw output of each pass")
+):
+    """
+    Endpoint returning stored analyses, filtered by image hash, time, model or prompt version.
+    """
+    return await asyncio.to_thread(get_result_store().find, query, limit=limit, include_outputs=include_outputs)
+
+@router.get("/results/stats")
+async def stored_results_stats_endpoint(query: ResultQuery = Depends(_result_query)):
+    """
+    Endpoint returning aggregate statistics over stored analyses: counts per model and
+    prompt version, average and maximum seconds per stage, and the distribution of
+    every clothing attribute.
+    """
+    return await asyncio.to_thread(get_result_store().aggregate, query)
+
+@router.post(
+    "/results/replay",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}}
+)
+async def replay_results_endpoint(
+    query: ResultQuery = Depends(_result_query),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of analyses to replay, oldest first"),
+    changed_only: bool = Query(False, description="Only return analyses whose result changed")
+):
+    """
+    Endpoint re-running the current post-processing on stored raw pass outputs,
+    without calling the model. Streams one NDJSON `ReplayedAnalysis` line per
+    stored analysis, listing the fields that differ from the stored result.
+    """
+    def stream_results():
+        # A plain generator: the response iterates it in a worker thread
+        for record in get_result_store().replay(query, postprocess_outputs, limit=limit):
+            if not changed_only or record.changed or record.status == "error":
+                yield record.model_dump_json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@router.get("/queue/stats")
+async def queue_stats_endpoint():
+    """
+    Endpoint returning analysis queue depth, in-flight count and wait times.
+    """
+    return get_admission_controller().stats()
+
+@router.get("/backends/stats")
+async def backend_stats_endpoint():
+    """
+    Endpoint returning load, health and circuit breaker state of each Ollama server.
+    """
+    return get_pool().stats()
+
+@router.get("/cache/stats")
+async def cache_stats_endpoint():
+    """
+    Endpoint returning result cache hit/miss counters.
+    """
+    return result_cache.stats()
+
+@router.get("/micro-batch/stats")
+async def micro_batch_stats_endpoint():
+    """
+    Endpoint returning micro-batching counters: calls, batches and average batch size.
+    """
+    return {"enabled": settings.micro_batch_enabled, **get_micro_batcher().stats()}
+
+@router.get("/framing/stats")
+async def framing_stats_endpoint():
+    """
+    Endpoint returning framing pre-analysis counters: faces found, and how often
+    the eyewear pass was skipped or run on a face crop.
+    """
+    return {"enabled": settings.framing_enabled, **get_framing_analyzer().stats()}
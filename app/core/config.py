@@ -1,10 +1,8 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import List
+from typing import List, Literal, Optional
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Settings(BaseSettings):
@@ -14,11 +12,163 @@ class Settings(BaseSettings):
     api_version: str = Field(default="v1", description="API version")
     host: str = Field(default="127.0.0.1", description="Host to run the application on")
     port: int = Field(default=8000, description="Port to run the application on")
+    log_level: str = Field(default="INFO", description="Logging level for the application")
     
     # Model settings
     model_name: str = Field(default="llava", description="Name of the Ollama model to use")
     model_temperature: float = Field(default=0.0, description="Temperature for model generation")
-    
+    model_warm_up_enabled: bool = Field(
+        default=True,
+        description="Load the model on startup, and again whenever Ollama unloads it, so requests don't pay the load time"
+    )
+    model_warm_up_timeout: float = Field(default=300.0, gt=0, description="Timeout in seconds for loading the model during warm-up")
+
+    # Ollama client settings
+    ollama_host: Optional[str] = Field(default=None, description="Ollama server URL (defaults to OLLAMA_HOST or http://localhost:11434)")
+    ollama_hosts: List[str] = Field(
+        default=[],
+        description="Ollama server URLs to balance across; overrides ollama_host when set"
+    )
+    ollama_max_concurrency: int = Field(default=2, ge=1, description="Maximum number of concurrent Ollama model calls per server")
+    ollama_request_timeout: float = Field(default=120.0, gt=0, description="Timeout in seconds for a single Ollama model call")
+    ollama_max_retries: int = Field(default=1, ge=0, description="How many times a failed model call is retried on another server")
+    ollama_keepalive_expiry_seconds: float = Field(default=60.0, ge=0, description="How long idle connections to an Ollama server are kept open")
+    ollama_circuit_failure_threshold: int = Field(default=3, ge=1, description="Consecutive failures after which a server is taken out of rotation")
+    ollama_circuit_cooldown_seconds: float = Field(default=30.0, gt=0, description="Seconds a failing server stays out of rotation before it is tried again")
+    ollama_health_check_interval: float = Field(default=15.0, ge=0, description="Seconds between server health checks (0 disables them)")
+    ollama_health_check_timeout: float = Field(default=5.0, gt=0, description="Timeout in seconds for a server health check")
+    ollama_keep_alive: str = Field(default="30m", description="How long Ollama keeps the model loaded after a request (e.g. '30m', '-1' for forever)")
+    ollama_num_ctx: Optional[int] = Field(default=None, ge=1, description="Context window passed to Ollama; keep it fixed so the model and prompt cache are not reloaded")
+    ollama_num_keep: Optional[int] = Field(default=None, description="Prompt tokens Ollama keeps when the context window shifts (-1 keeps all)")
+
+    # Admission control settings
+    admission_max_in_flight: int = Field(default=4, ge=1, description="Maximum number of analyses running at once")
+    admission_max_queue: int = Field(default=64, ge=0, description="Maximum number of analyses waiting for a slot before new ones get 429")
+    admission_max_wait_seconds: float = Field(default=60.0, gt=0, description="Maximum seconds an analysis waits for a slot before getting 503")
+
+    # Analysis settings
+    max_upload_bytes: int = Field(default=20 * 1024 * 1024, gt=0, description="Maximum accepted image size in bytes")
+    analysis_mode: Literal["multi_pass", "single_pass"] = Field(
+        default="multi_pass",
+        description="multi_pass always runs the description pass; single_pass refines the main result only when it is ambiguous"
+    )
+    pass_schedule: Literal["sequential", "parallel", "speculative"] = Field(
+        default="parallel",
+        description="How the main, eyewear and description passes are scheduled in multi_pass mode"
+    )
+    single_pass_min_description_length: int = Field(
+        default=80,
+        ge=0,
+        description="In single_pass mode, shorter descriptions trigger the description pass"
+    )
+
+    # Framing pre-analysis settings
+    framing_enabled: bool = Field(
+        default=False,
+        description="Detect faces on the CPU before the model passes to skip or crop the eyewear pass (requires opencv-python-headless)"
+    )
+    framing_max_edge: int = Field(
+        default=320,
+        ge=64,
+        description="Long edge of the thumbnail scanned for faces; larger finds smaller faces but takes longer"
+    )
+    framing_face_margin: float = Field(
+        default=0.5,
+        ge=0,
+        description="Margin kept around a detected face on each side, as a fraction of its size, when cropping it for the eyewear pass"
+    )
+
+    # Micro-batching settings
+    micro_batch_enabled: bool = Field(default=False, description="Group concurrent model calls of the same pass into batches")
+    micro_batch_window_ms: float = Field(default=10.0, ge=0, description="How long a batch collects calls before it is sent, in milliseconds")
+    micro_batch_max_size: int = Field(
+        default=4,
+        ge=1,
+        description="Maximum calls per batch; keep it at or below OLLAMA_NUM_PARALLEL on the servers"
+    )
+    micro_batch_strategy: Literal["parallel", "multi_image"] = Field(
+        default="parallel",
+        description="parallel sends a batch as simultaneous calls to one server; multi_image also puts "
+                    "several images in one prompt for passes that support it (needs a multi-image model)"
+    )
+    micro_batch_passes: List[str] = Field(
+        default=["main", "eyewear", "description"],
+        description="Passes whose model calls are micro-batched"
+    )
+
+    # Batch settings
+    batch_max_concurrency: int = Field(default=4, ge=1, description="Maximum number of images analyzed at once per batch request")
+    batch_max_items: int = Field(default=1000, ge=1, description="Maximum number of images in one batch request")
+    batch_max_total_bytes: int = Field(default=512 * 1024 * 1024, gt=0, description="Maximum total size in bytes of one batch request")
+
+    # Video settings
+    video_sample_fps: float = Field(default=1.0, gt=0, description="Frames per second sampled from videos and frame sequences")
+    video_max_frames: int = Field(default=300, ge=1, description="Maximum number of sampled frames per video request")
+    video_max_input_frames: int = Field(
+        default=3000,
+        ge=1,
+        description="Maximum number of frames uploaded as images or archive members per video request, before sampling"
+    )
+    video_max_bytes: int = Field(default=200 * 1024 * 1024, gt=0, description="Maximum accepted video size in bytes")
+    video_change_min_distance: int = Field(
+        default=10,
+        ge=0,
+        le=64,
+        description="Perceptual hash distance (in bits) from the last analyzed frame at which a frame counts as a scene change"
+    )
+    video_decode_timeout: float = Field(default=120.0, gt=0, description="Timeout in seconds for decoding a video with ffmpeg")
+
+    # Result store settings
+    result_store_enabled: bool = Field(
+        default=False,
+        description="Append every fresh analysis, with its raw pass outputs and timings, to the result store"
+    )
+    result_store_path: str = Field(default="results.sqlite3", description="SQLite file of the result store")
+
+    # Job queue settings
+    job_queue_backend: Literal["memory", "sqlite", "redis"] = Field(
+        default="memory",
+        description="Where asynchronous jobs are queued; sqlite and redis can be shared with separate worker processes"
+    )
+    job_queue_sqlite_path: str = Field(default="jobs.sqlite3", description="SQLite file of the sqlite job queue")
+    job_queue_redis_url: str = Field(default="redis://localhost:6379/0", description="Server of the redis job queue")
+    job_api_workers: int = Field(
+        default=1,
+        ge=0,
+        description="Jobs run at once by the API process itself; 0 leaves them to separate workers (python -m app.worker)"
+    )
+    job_worker_concurrency: int = Field(default=2, ge=1, description="Jobs run at once by each worker process")
+    job_lease_seconds: float = Field(
+        default=600.0,
+        gt=0,
+        description="Seconds a worker may hold a job before it is handed to another worker"
+    )
+    job_max_attempts: int = Field(default=3, ge=1, description="Maximum times a job is picked up before it fails")
+    job_retry_backoff_seconds: float = Field(
+        default=5.0,
+        ge=0,
+        description="Delay before a job that failed with a retryable error is picked up again; doubles with each attempt"
+    )
+    job_retry_backoff_max_seconds: float = Field(default=120.0, ge=0, description="Upper bound of the retry delay")
+    job_result_ttl_seconds: float = Field(default=86400.0, gt=0, description="How long finished jobs and their results are kept")
+    job_poll_interval_seconds: float = Field(default=0.5, gt=0, description="How often workers and waiting clients poll the queue")
+
+    # Image preprocessing settings
+    image_preprocessing_enabled: bool = Field(default=True, description="Downscale and re-encode images before inference")
+    image_max_edge: int = Field(default=1120, ge=64, description="Maximum length in pixels of the longer image edge")
+    image_format: Literal["JPEG", "WEBP"] = Field(default="JPEG", description="Format images are re-encoded to")
+    image_quality: int = Field(default=85, ge=1, le=100, description="Encoder quality for re-encoded images")
+
+    # Result cache settings
+    cache_enabled: bool = Field(default=True, description="Cache analysis results by image content")
+    cache_max_entries: int = Field(default=1024, ge=1, description="Maximum number of results kept in the in-memory cache")
+    cache_ttl_seconds: float = Field(default=3600.0, gt=0, description="Time in seconds before a cached result expires")
+    cache_disk_path: Optional[str] = Field(default=None, description="SQLite file for a persistent cache tier (disabled if unset)")
+    cache_disk_max_entries: int = Field(default=100000, ge=1, description="Maximum number of results kept in the disk tier")
+    cache_disk_prune_interval_seconds: float = Field(default=300.0, gt=0, description="How often expired and excess disk tier rows are deleted")
+    cache_perceptual_hash: bool = Field(default=False, description="Reuse results for near-duplicate images via perceptual hashing")
+    cache_phash_max_distance: int = Field(default=4, ge=0, le=64, description="Maximum perceptual hash distance (in bits) for a near-duplicate match")
+
     # Debug settings
     debug: bool = Field(default=False, description="Debug mode")
     
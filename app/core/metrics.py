@@ -0,0 +1,52 @@
+from prometheus_client import Counter, Gauge, Histogram
+from app.services.admission import get_admission_controller
+from app.services.trace import AnalysisTrace
+
+# Buckets span fast stages (parse, validate) up to full multi-pass inference on a busy GPU
+_STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+STAGE_DURATION = Histogram(
+    "vlm_stage_duration_seconds",
+    "Time spent in each stage of an image analysis",
+    ["stage"],
+    buckets=_STAGE_BUCKETS
+)
+ANALYSIS_EVENTS = Counter(
+    "vlm_analysis_events_total",
+    "Notable events during analysis, e.g. eyewear_fallback or description_parse_failure",
+    ["event"]
+)
+CACHE_LOOKUPS = Counter(
+    "vlm_cache_lookups_total",
+    "Result cache lookups by outcome",
+    ["result"]
+)
+VIDEO_FRAMES = Counter(
+    "vlm_video_frames_total",
+    "Sampled video frames by outcome: analyzed by the model, reused from an earlier frame, or failed",
+    ["outcome"]
+)
+FRAMING_OUTCOMES = Counter(
+    "vlm_framing_outcomes_total",
+    "Framing pre-analyses by outcome: face found, no face, or detector unavailable",
+    ["outcome"]
+)
+MICRO_BATCH_SIZE = Histogram(
+    "vlm_micro_batch_size",
+    "Model calls grouped into one micro-batch",
+    ["pass", "strategy"],
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16)
+)
+QUEUE_DEPTH = Gauge("vlm_queue_depth", "Analyses waiting for an admission slot")
+QUEUE_DEPTH.set_function(lambda: get_admission_controller().stats()["queue_depth"])
+IN_FLIGHT = Gauge("vlm_in_flight", "Analyses currently holding an admission slot")
+IN_FLIGHT.set_function(lambda: get_admission_controller().stats()["in_flight"])
+
+def observe_trace(trace: AnalysisTrace) -> None:
+    """Record the timings and events of a finished analysis."""
+    for stage, seconds in trace.timings.items():
+        STAGE_DURATION.labels(stage=stage).observe(seconds)
+    for event in trace.events:
+        ANALYSIS_EVENTS.labels(event=event).inc()
+    if trace.cache is not None:
+        CACHE_LOOKUPS.labels(result=trace.cache).inc()
@@ -0,0 +1,241 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from app.schemas.clothing import EyewearItem
+from app.schemas.image_analysis import ClothingAnalysisResponse, DescriptionPassResult
+import hashlib
+import json
+
+# Bump when prompts change in a way that should invalidate cached results.
+# The registry version also carries a content fingerprint, so an edit that
+# forgets the bump still produces a new version.
+PROMPT_VERSION = "3"
+
+CLOTHING_INSTRUCTIONS = """Analyze ONLY what is FULLY visible in the image. DO NOT assume or infer anything outside the visible area.
+
+STRICT RULES:
+- **Describe ONLY completely visible items.** Ignore any item that is cropped, obscured, or partially visible.
+- **No assumptions.** If part of an item (e.g., sleeve, waistband, strap) is missing, exclude it from the analysis.
+- **Respect image framing.** If the image shows only the upper or lower body, do NOT mention unseen areas.
+- **CRITICAL: If only upper body is visible, DO NOT include ANY lower body clothing in your response.**
+- **CRITICAL: If only lower body is visible, DO NOT include ANY upper body clothing in your response.**
+
+CATEGORIES TO ANALYZE (ONLY IF FULLY VISIBLE):
+
+1. **Upper Body Clothing** (if fully visible):
+   - Identify specific types: shirt, t-shirt, blouse, tank top, polo shirt, sweater, hoodie, jacket, coat
+   - **Sleeve length** (only if both sleeves are fully visible): short, long, three-quarter, sleeveless.
+   - **If upper body is cropped or partially visible, set all upper body fields to "unknown".**
+
+2. **Lower Body Clothing** (if fully visible):
+   - **CRITICAL: SKIP COMPLETELY if the lower body is not in the image frame.**
+   - **SKIP if the lower body is cropped or if clothing is partially visible.**
+   - Identify types: jeans, trousers, shorts, skirt, leggings, sweatpants
+   - **Length** (only if fully visible): short, knee-length, midi, long, ankle-length.
+   - **If lower body is not visible or is cropped, set all lower body fields to null, not to "unknown".**
+
+3. **EYEWEAR - CRITICAL PRIORITY**
+   - **LOOK CAREFULLY for glasses or sunglasses on the person's face.**
+   - **Pay special attention to thin frames, clear lenses, or subtle eyewear that might be easily missed.**
+   - Identify if visible: **glasses, sunglasses, reading glasses, sports glasses, safety glasses, prescription glasses.**
+   - **Check for reflections, lens edges, or frame outlines around the eyes.**
+   - **If you see ANY eyewear, even if partially visible, set wearing to true and identify the type.**
+   - **If no eyewear is present, explicitly set wearing to false.**
+   - **Example Output:**
+     - "Person is wearing glasses with thin metal frames."
+     - "Person is wearing sunglasses with dark lenses."
+     - "No eyewear detected on the person's face."
+   - If **face is not visible or is cropped**, state: "**Eyewear status unknown**."
+
+4. **HEADWEAR**
+   - Identify if fully visible: **hat, cap, beanie, hood**
+   - **Even if no headwear is present, explicitly confirm its absence.**
+   - **Example Output:**
+     - "Person is wearing a hat."
+     - "No headwear detected."
+   - If the **top of the head is cropped**, state: "**Headwear status unknown**."
+
+5. **ACCESSORIES**
+   - Identify if fully visible: **scarf, gloves, belt, tie, bow tie, necklace, bracelet, watch, earrings, rings, handbag, backpack, purse.**
+   - **Even if no accessories are present, explicitly confirm their absence.**
+   - **Example Output:**
+     - "Person is wearing a silver watch and a black leather belt."
+     - "No accessories detected."
+   - If **accessories are partially visible (e.g., a strap, ring edge, necklace glimpse), state:**
+     - "Accessories status unknown due to partial visibility."
+
+6. **THERMAL PROPERTIES AND WEATHER CONTEXT**
+   - Based on the visible clothing items, provide:
+
+   a) **General Description:**
+      - Write a brief caption (2-3 sentences) describing the visible outfit
+      - Include material types if identifiable (cotton, wool, leather, etc.)
+      - Mention layering if present (e.g., "t-shirt under a light jacket")
+
+   b) **Thermal Properties:**
+      - Describe the thermal insulation properties of the visible clothing
+      - Use terms like: very warm, warm, moderate, cool, very cool, lightweight, heavyweight, etc.
+      - Consider fabric thickness, coverage, and layering
+      - Example: "The outfit provides moderate warmth with the medium-weight sweater"
+
+   c) **Weather Appropriateness:**
+      - Describe what weather conditions the visible outfit would be suitable for
+      - Consider temperature ranges, seasons, and weather conditions
+      - Example: "Suitable for mild spring or fall weather, approximately 15-20°C (59-68°F)"
+      - Example: "Appropriate for hot summer days, provides minimal coverage and thermal insulation"
+
+   d) **IMPORTANT: Base your assessment ONLY on visible items**
+      - If only upper body is visible, limit your thermal/weather assessment to those items
+      - If crucial elements for weather assessment are missing, acknowledge this limitation
+      - Example: "Limited weather assessment possible as only upper body clothing is visible"
+
+**FINAL VERIFICATION:**
+    1. Are you describing **only fully visible items**?
+    2. Have you **excluded** all cropped or partially visible items?
+    3. Have you **skipped categories** that aren't entirely visible?
+    4. Can you see the **entire item** in the image?
+    5. **CRITICAL CHECK: Have you carefully examined the face for any eyewear, including subtle or thin-framed glasses?**
+    6. **CRITICAL CHECK: If only upper body is visible in the image, have you set lower_body to null?**
+    7. **CRITICAL CHECK: If only lower body is visible in the image, have you set upper_body to null?**
+    8. **Have you provided thermal properties and weather appropriateness based ONLY on visible items?**
+
+**REMEMBER:** If an item is not fully visible, **DO NOT include it**. It is better to omit details than to assume.
+"""
+
+EYEWEAR_INSTRUCTIONS = """Focus ONLY on detecting eyewear in this image.
+
+Look very carefully at the person's face and eyes.
+
+1. Are they wearing glasses or sunglasses?
+2. Look for thin frames, clear lenses, or subtle eyewear that might be easily missed.
+3. Check for reflections, lens edges, or frame outlines around the eyes.
+
+Respond with a JSON object with these fields:
+{
+  "wearing": true/false,
+  "type": "glasses"/"sunglasses"/"reading glasses"/"unknown",
+  "frame_style": "thin"/"thick"/"rimless"/"wire"/"plastic"/"unknown"
+}
+
+If you're absolutely certain there are no glasses, set wearing to false.
+"""
+
+DESCRIPTION_INSTRUCTIONS = """Provide a detailed description of the clothing visible in this image.
+
+IMPORTANT: You MUST provide a detailed description of what you see.
+
+Based ONLY on what you can see in the image (do not make assumptions about clothing that is not visible):
+
+1. Provide a detailed general description of the visible outfit (3-4 sentences).
+   - Describe the specific clothing items visible
+   - Mention colors, patterns, and materials if identifiable
+   - Describe how the items are worn together (layering, style)
+
+2. Describe the thermal insulation properties of the visible clothing.
+   - How warm or cool would this clothing be?
+   - Consider fabric thickness, coverage, and layering
+
+3. Describe what weather conditions this outfit would be suitable for.
+   - Which season(s) would this be appropriate for?
+   - Suggest temperature ranges if possible
+
+Respond with a JSON object with these fields:
+{
+  "general_description": "Detailed description of the visible outfit",
+  "thermal_properties": "Description of thermal insulation (e.g., warm, cool, lightweight)",
+  "weather_appropriateness": "Description of suitable weather conditions"
+}
+
+IMPORTANT: If only part of the body is visible, acknowledge this limitation in your assessment.
+"""
+
+@dataclass(frozen=True)
+class PassPrompt:
+    """Everything sent to the model for one pass, apart from the image"""
+    instructions: str
+    request: str
+    schema: dict
+    temperature: Optional[float] = None  # None means settings.model_temperature
+    # Request for several images in one call, with a {count} placeholder; None if
+    # the pass can't be asked about several images at once
+    batch_request: Optional[str] = None
+
+class PromptRegistry:
+    """
+    Prompts and JSON schemas for every model pass, built once at startup.
+
+    Messages are laid out so the long instructions form a constant system
+    message at the start of the conversation. Every request for a given pass
+    then shares the same prompt prefix, which Ollama can reuse from its cache
+    instead of re-evaluating; only the short user message and image differ.
+    """
+
+    def __init__(self, prompts: Dict[str, PassPrompt]):
+        self._prompts = prompts
+        fingerprint = hashlib.sha256(json.dumps(
+            {name: [p.instructions, p.request, p.schema, p.temperature, p.batch_request]
+             for name, p in sorted(prompts.items())},
+            sort_keys=True
+        ).encode()).hexdigest()[:8]
+        self.version = f"{PROMPT_VERSION}-{fingerprint}"
+
+    def get(self, name: str) -> PassPrompt:
+        return self._prompts[name]
+
+    def messages(self, name: str, image_b64: str) -> List[dict]:
+        """Build the chat messages for a pass."""
+        prompt = self._prompts[name]
+        return [
+            {'role': 'system', 'content': prompt.instructions},
+            {'role': 'user', 'content': prompt.request, 'images': [image_b64]},
+        ]
+
+    def batch_messages(self, name: str, images_b64: List[str]) -> List[dict]:
+        """Build the chat messages asking a pass about several images at once."""
+        prompt = self._prompts[name]
+        return [
+            {'role': 'system', 'content': prompt.instructions},
+            {'role': 'user', 'content': prompt.batch_request.format(count=len(images_b64)), 'images': images_b64},
+        ]
+
+    def batch_schema(self, name: str, count: int) -> dict:
+        """JSON schema for a multi-image answer: one result per image, in order."""
+        return {
+            'type': 'object',
+            'properties': {
+                'results': {
+                    'type': 'array',
+                    'items': self._prompts[name].schema,
+                    'minItems': count,
+                    'maxItems': count,
+                },
+            },
+            'required': ['results'],
+        }
+
+def _build_registry() -> PromptRegistry:
+    return PromptRegistry({
+        "main": PassPrompt(
+            instructions=CLOTHING_INSTRUCTIONS,
+            request="Analyze the clothing in this image following the instructions.",
+            schema=ClothingAnalysisResponse.model_json_schema(),
+        ),
+        "eyewear": PassPrompt(
+            instructions=EYEWEAR_INSTRUCTIONS,
+            request="Check this image for eyewear.",
+            schema=EyewearItem.model_json_schema(),
+            temperature=0.1,  # Lower temperature for more focused detection
+            batch_request=(
+                "You are given {count} images, each showing a different person. Check each image for "
+                "eyewear on its own and answer with a `results` list holding one eyewear object per "
+                "image, in the order the images were given."
+            ),
+        ),
+        "description": PassPrompt(
+            instructions=DESCRIPTION_INSTRUCTIONS,
+            request="Describe the clothing in this image.",
+            schema=DescriptionPassResult.model_json_schema(),
+            temperature=0.3,
+        ),
+    })
+
+prompts = _build_registry()
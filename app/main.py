@@ -1,14 +1,58 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.endpoints.clothing_info import router as image_router
 from app.core.config import settings
+from app.core.prompts import prompts
+from app.services.image_analysis import warm_up_chat_arguments
+from app.services.job_queue import get_job_queue
+from app.services.job_worker import run_worker
+from app.services.ollama_client import get_pool
+from app.services.result_store import get_result_store
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import app.core.metrics  # noqa: F401  Registers the app's collectors
+
+logging.basicConfig(level=settings.log_level)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up the model, start background Ollama health checks and the in-process
+    job workers, and stop them and close connections on shutdown
+
+    The warm-up runs in the background so the server starts accepting
+    connections immediately; `/health/ready` reports when the model is loaded.
+    """
+    pool = get_pool()
+    if settings.model_warm_up_enabled:
+        pool.start_warm_up(**warm_up_chat_arguments())
+    pool.start_health_checks()
+    queue = get_job_queue()
+    stop_workers = asyncio.Event()
+    workers = None
+    if settings.job_api_workers > 0:
+        workers = asyncio.create_task(run_worker(queue, settings.job_api_workers, f"api-{os.getpid()}", stop_workers))
+    yield
+    if workers is not None:
+        # Running jobs go back to the queue rather than holding up shutdown
+        stop_workers.set()
+        workers.cancel()
+        await asyncio.gather(workers, return_exceptions=True)
+    await queue.close()
+    if settings.result_store_enabled:
+        get_result_store().close()
+    await pool.close()
 
 app = FastAPI(
     title=settings.app_name,
     description="API for analyzing images using VLM model",
     version=settings.api_version,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -36,9 +80,60 @@ async def read_root():
         "name": settings.app_name,
         "version": settings.api_version,
         "status": "operational",
+        "prompt_version": prompts.version,
         "docs": "/docs",
         "redoc": "/redoc",
         "endpoints": {
-            "analyze": f"/api/{settings.api_version}/analyze"
+            "analyze": f"/api/{settings.api_version}/analyze",
+            "analyze_stream": f"/api/{settings.api_version}/analyze/stream",
+            "analyze_batch": f"/api/{settings.api_version}/analyze/batch",
+            "analyze_video": f"/api/{settings.api_version}/analyze/video",
+            "jobs": f"/api/{settings.api_version}/jobs",
+            "batch_jobs": f"/api/{settings.api_version}/jobs/batch",
+            "results": f"/api/{settings.api_version}/results",
+            "results_stats": f"/api/{settings.api_version}/results/stats",
+            "results_replay": f"/api/{settings.api_version}/results/replay",
+            "cache_stats": f"/api/{settings.api_version}/cache/stats",
+            "queue_stats": f"/api/{settings.api_version}/queue/stats",
+            "backend_stats": f"/api/{settings.api_version}/backends/stats",
+            "micro_batch_stats": f"/api/{settings.api_version}/micro-batch/stats",
+            "framing_stats": f"/api/{settings.api_version}/framing/stats",
+            "metrics": "/metrics",
+            "liveness": "/health/live",
+            "readiness": "/health/ready"
         }
-    }
\ No newline at end of file
+    }
+
+@app.get("/metrics", tags=["status"])
+async def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, pass fallback and parse
+    failure counters, cache outcomes and queue depth
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/health/live", tags=["status"])
+async def liveness():
+    """
+    Liveness probe: the process is up and serving requests
+    """
+    return {"status": "alive"}
+
+@app.get("/health/ready", tags=["status"])
+async def readiness(response: Response):
+    """
+    Readiness probe: 200 once an Ollama backend is reachable and (with warm-up
+    enabled) has the model loaded, 503 otherwise
+    """
+    pool = get_pool()
+    ready = pool.ready()
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if ready else "not_ready",
+        "model": settings.model_name,
+        "backends": [
+            {"host": backend.host or "default", "available": backend.available, "model_state": backend.model_state}
+            for backend in pool.backends
+        ]
+    }
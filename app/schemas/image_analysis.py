@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from .clothing import FullBodyClothingInfo
-from typing import Optional
+from typing import Literal, Optional
 
 class ClothingAnalysisResponse(BaseModel):
     """Response model for clothing analysis"""
@@ -17,3 +17,43 @@ class ClothingAnalysisResponse(BaseModel):
         ..., 
         description="Description of what weather conditions the outfit would be suitable for"
     )
+
+class BatchItemResult(BaseModel):
+    """Per-image record streamed back from the batch endpoint"""
+    filename: str = Field(..., description="Name of the image (archive member path for archives)")
+    status: Literal["ok", "error"] = Field(..., description="Whether the image was analyzed successfully")
+    result: Optional[ClothingAnalysisResponse] = Field(
+        default=None,
+        description="Analysis result when status is 'ok'"
+    )
+    error: Optional[str] = Field(default=None, description="Error message when status is 'error'")
+    status_code: Optional[int] = Field(default=None, description="HTTP-style status code of the failure")
+    prompt_version: Optional[str] = Field(default=None, description="Version of the prompts that produced the result")
+
+class FrameAnalysisResult(BaseModel):
+    """Per-frame record streamed back from the video endpoint"""
+    index: int = Field(..., description="Position of the frame among the sampled frames")
+    timestamp: Optional[float] = Field(default=None, description="Time of the frame in the clip, in seconds, if known")
+    filename: Optional[str] = Field(default=None, description="Name of the frame image, for uploaded frame sequences")
+    status: Literal["ok", "error"] = Field(..., description="Whether a result is available for the frame")
+    changed: bool = Field(..., description="Whether the scene changed enough for the frame to be analyzed")
+    hash_distance: Optional[int] = Field(
+        default=None,
+        description="Perceptual hash distance (in bits) to the last analyzed frame"
+    )
+    reused_from: Optional[int] = Field(
+        default=None,
+        description="Index of the analyzed frame whose result is reused, when the scene did not change"
+    )
+    result: Optional[ClothingAnalysisResponse] = Field(
+        default=None,
+        description="Analysis result when status is 'ok'"
+    )
+    error: Optional[str] = Field(default=None, description="Error message when status is 'error'")
+    status_code: Optional[int] = Field(default=None, description="HTTP-style status code of the failure")
+
+class DescriptionPassResult(BaseModel):
+    """Structured output of the focused description and thermal assessment pass"""
+    general_description: str = Field(..., description="Detailed description of the visible outfit")
+    thermal_properties: str = Field(..., description="Description of thermal insulation (e.g., warm, cool, lightweight)")
+    weather_appropriateness: str = Field(..., description="Description of suitable weather conditions")
@@ -0,0 +1,41 @@
+from pydantic import BaseModel, Field
+from .image_analysis import BatchItemResult, ClothingAnalysisResponse
+from typing import Dict, List, Literal, Optional
+
+JobState = Literal["queued", "running", "done", "failed"]
+
+class JobStatus(BaseModel):
+    """State of an asynchronous analysis job"""
+    job_id: str = Field(..., description="Identifier of the job")
+    status: JobState = Field(..., description="queued, running, done or failed")
+    filename: str = Field(..., description="Name of the submitted image")
+    priority: Literal["interactive", "bulk"] = Field(..., description="Admission class the job runs with")
+    batch_id: Optional[str] = Field(default=None, description="Batch the job was submitted with, if any")
+    created_at: float = Field(..., description="Submission time (Unix seconds)")
+    started_at: Optional[float] = Field(default=None, description="Time a worker last picked the job up")
+    finished_at: Optional[float] = Field(default=None, description="Completion time")
+    attempts: int = Field(default=0, description="Number of times a worker picked the job up")
+    result: Optional[ClothingAnalysisResponse] = Field(default=None, description="Analysis result when status is 'done'")
+    error: Optional[str] = Field(default=None, description="Error message when status is 'failed'")
+    status_code: Optional[int] = Field(default=None, description="HTTP-style status code of the failure")
+    prompt_version: Optional[str] = Field(default=None, description="Version of the prompts that produced the result")
+
+class JobSubmission(BaseModel):
+    """Response to a job submission"""
+    job_id: str = Field(..., description="Identifier to poll or subscribe to")
+    status: JobState = Field(..., description="Initial job state")
+    status_url: str = Field(..., description="Where to poll for the result")
+    events_url: str = Field(..., description="Server-sent events stream of job state changes")
+
+class BatchSubmission(BaseModel):
+    """Response to a batch job submission"""
+    batch_id: str = Field(..., description="Identifier of the batch")
+    job_ids: List[str] = Field(..., description="One job per accepted image, in upload order")
+    rejected: List[BatchItemResult] = Field(default_factory=list, description="Uploads that were not queued")
+    status_url: str = Field(..., description="Where to poll for the batch progress")
+
+class BatchStatus(BaseModel):
+    """Progress of a batch of jobs"""
+    batch_id: str = Field(..., description="Identifier of the batch")
+    counts: Dict[str, int] = Field(..., description="Number of jobs in each state")
+    jobs: List[JobStatus] = Field(..., description="Every job of the batch, in submission order")
@@ -0,0 +1,32 @@
+from pydantic import BaseModel, Field
+from .image_analysis import ClothingAnalysisResponse
+from typing import Dict, List, Literal, Optional
+
+class StoredAnalysis(BaseModel):
+    """An analysis kept in the result store"""
+    id: int = Field(..., description="Identifier of the record; increases with insertion order")
+    created_at: float = Field(..., description="Time the analysis finished (Unix seconds)")
+    image_sha256: str = Field(..., description="SHA-256 of the uploaded image")
+    filename: Optional[str] = Field(default=None, description="Name of the analyzed image")
+    model_name: str = Field(..., description="Model that produced the result")
+    prompt_version: str = Field(..., description="Version of the prompts that produced the result")
+    analysis_mode: str = Field(..., description="multi_pass or single_pass")
+    timings: Dict[str, float] = Field(..., description="Seconds spent in each stage")
+    events: List[str] = Field(default_factory=list, description="Notable events, e.g. eyewear_fallback")
+    result: ClothingAnalysisResponse = Field(..., description="The analysis result as returned to the client")
+    outputs: Optional[Dict[str, str]] = Field(
+        default=None,
+        description="Raw model output of each merged pass, when requested"
+    )
+
+class ReplayedAnalysis(BaseModel):
+    """A stored analysis run again through the current post-processing"""
+    id: int = Field(..., description="Identifier of the stored record")
+    image_sha256: str = Field(..., description="SHA-256 of the uploaded image")
+    status: Literal["ok", "error"] = Field(..., description="Whether the stored outputs could be post-processed")
+    changed: List[str] = Field(
+        default_factory=list,
+        description="Fields whose value differs from the stored result, e.g. clothing_info.eyewear.type"
+    )
+    result: Optional[ClothingAnalysisResponse] = Field(default=None, description="The replayed result")
+    error: Optional[str] = Field(default=None, description="Why post-processing failed")
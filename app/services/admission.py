@@ -0,0 +1,158 @@
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+from fastapi import HTTPException
+from app.core.config import settings
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+Priority = Literal["interactive", "bulk"]
+
+# Lower value is served first
+PRIORITY_ORDER = {"interactive": 0, "bulk": 1}
+
+class AdmissionController:
+    """
+    Bounded, priority-ordered admission in front of model inference.
+
+    Up to `max_in_flight` analyses run at once. Further callers wait in a queue
+    of at most `max_queue` entries, interactive before bulk and FIFO within a
+    class. Callers are turned away with 429 when the queue is full and with 503
+    when they have waited longer than `max_wait` seconds; both responses carry
+    a `Retry-After` estimate.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, max_wait: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._in_flight = 0
+        self._waiters = []
+        self._queued = {priority: 0 for priority in PRIORITY_ORDER}
+        self._sequence = itertools.count()
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        # Exponentially weighted average of how long an admitted analysis holds its slot
+        self._avg_service_time = None
+
+    def _queue_depth(self) -> int:
+        return sum(self._queued.values())
+
+    def retry_after(self) -> int:
+        """Estimate in whole seconds how long until a new caller would be admitted."""
+        service_time = self._avg_service_time or 1.0
+        rounds = (self._queue_depth() + 1) / self.max_in_flight
+        return max(1, math.ceil(service_time * rounds))
+
+    def _hand_off(self) -> None:
+        """Give free slots to the highest priority waiters still interested."""
+        while self._waiters and self._in_flight < self.max_in_flight:
+            _, _, priority, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # Waiter gave up
+            self._queued[priority] -= 1
+            self._in_flight += 1
+            future.set_result(None)
+
+    async def _acquire(self, priority: Priority) -> float:
+        if self._in_flight < self.max_in_flight and not self._queue_depth():
+            self._in_flight += 1
+            return 0.0
+
+        if self._queue_depth() >= self.max_queue:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Analysis queue is full, try again later",
+                headers={"Retry-After": str(self.retry_after())}
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITY_ORDER[priority], next(self._sequence), priority, future))
+        self._queued[priority] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up
+                if not isinstance(e, asyncio.TimeoutError):
+                    self._release()
+                    raise
+            else:
+                future.cancel()
+                self._queued[priority] -= 1
+                if isinstance(e, asyncio.TimeoutError):
+                    self._timed_out += 1
+                    raise HTTPException(
+                        status_code=503,
+                        detail=f"Timed out after waiting {self.max_wait:.0f} seconds for an analysis slot",
+                        headers={"Retry-After": str(self.retry_after())}
+                    )
+                raise
+        return time.perf_counter() - start
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._hand_off()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = "interactive"):
+        """
+        Hold an analysis slot for the duration of the block.
+
+        Yields:
+            float: Seconds spent waiting in the queue
+
+        Raises:
+            HTTPException: 429 if the queue is full, 503 if the wait timed out
+        """
+        waited = await self._acquire(priority)
+        self._admitted += 1
+        self._total_wait += waited
+        self._max_wait_seen = max(self._max_wait_seen, waited)
+        start = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            elapsed = time.perf_counter() - start
+            self._avg_service_time = (
+                elapsed if self._avg_service_time is None
+                else 0.8 * self._avg_service_time + 0.2 * elapsed
+            )
+            self._release()
+
+    def stats(self) -> dict:
+        """Return queue depth, in-flight count and wait time statistics."""
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self._queue_depth(),
+            "queued_by_priority": dict(self._queued),
+            "max_queue": self.max_queue,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "avg_wait_seconds": self._total_wait / self._admitted if self._admitted else 0.0,
+            "max_wait_seconds": self._max_wait_seen,
+            "avg_service_seconds": self._avg_service_time,
+            "retry_after_seconds": self.retry_after(),
+        }
+
+_controller: Optional[AdmissionController] = None
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller, creating it from settings on first use."""
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController(
+            max_in_flight=settings.admission_max_in_flight,
+            max_queue=settings.admission_max_queue,
+            max_wait=settings.admission_max_wait_seconds,
+        )
+    return _controller
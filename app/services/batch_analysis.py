@@ -0,0 +1,131 @@
+from typing import AsyncIterator, List, Optional, Tuple
+from fastapi import HTTPException
+from app.schemas.image_analysis import BatchItemResult
+from app.services.image_analysis import analyze_clothing
+from app.core.config import settings
+from app.core.prompts import prompts
+import asyncio
+import io
+import mimetypes
+import os
+import tarfile
+import zipfile
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff')
+
+def is_archive(filename: str, content_type: str = "") -> bool:
+    """Whether an upload should be treated as an archive of images."""
+    return (
+        (filename or "").lower().endswith(ARCHIVE_EXTENSIONS)
+        or content_type in ("application/zip", "application/x-zip-compressed", "application/x-tar", "application/gzip")
+    )
+
+def is_image(filename: str, content_type: str = "") -> bool:
+    """Whether an upload or archive member looks like an image."""
+    if content_type.startswith('image/'):
+        return True
+    guessed, _ = mimetypes.guess_type(filename or "")
+    return bool(guessed and guessed.startswith('image/')) or (filename or "").lower().endswith(IMAGE_EXTENSIONS)
+
+def extract_archive_images(
+    data: bytes,
+    archive_name: str,
+    max_bytes: Optional[int] = None,
+    max_items: Optional[int] = None
+) -> List[Tuple[str, bytes]]:
+    """
+    Extract image members from a zip or tar archive held in memory.
+
+    Members that are not images, hidden files (e.g. `__MACOSX/` entries) and
+    members larger than `settings.max_upload_bytes` are skipped. The budget is
+    checked against each member's declared size before it is decompressed, so
+    a small archive cannot expand into more memory than the caller allows.
+
+    Args:
+        data (bytes): The archive contents
+        archive_name (str): Name of the uploaded archive, used to prefix member names
+        max_bytes (Optional[int]): Maximum total uncompressed size of the extracted images
+        max_items (Optional[int]): Maximum number of extracted images
+
+    Returns:
+        List[Tuple[str, bytes]]: (filename, image bytes) pairs in archive order
+
+    Raises:
+        HTTPException: 400 if the archive cannot be read, 413 if it exceeds the budget
+    """
+    images = []
+    total_bytes = 0
+
+    def reserve(size: int) -> None:
+        nonlocal total_bytes
+        total_bytes += size
+        if max_bytes is not None and total_bytes > max_bytes:
+            raise HTTPException(status_code=413, detail=f"{archive_name} expands beyond the {max_bytes} byte limit")
+        if max_items is not None and len(images) >= max_items:
+            raise HTTPException(status_code=413, detail=f"{archive_name} holds more than {max_items} images")
+
+    def keep(name: str, size: int) -> bool:
+        base = os.path.basename(name)
+        return (
+            is_image(name)
+            and not base.startswith('.')
+            and not name.startswith('__MACOSX/')
+            and size <= settings.max_upload_bytes
+        )
+
+    try:
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and keep(info.filename, info.file_size):
+                        # ZipExtFile stops at the declared size, so it bounds what read() returns
+                        reserve(info.file_size)
+                        images.append((f"{archive_name}/{info.filename}", archive.read(info)))
+        else:
+            with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+                for member in archive:
+                    if member.isfile() and keep(member.name, member.size):
+                        reserve(member.size)
+                        images.append((f"{archive_name}/{member.name}", archive.extractfile(member).read()))
+    except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read archive {archive_name}: {str(e)}")
+    return images
+
+async def _analyze_item(filename: str, image: bytes, use_cache: bool, semaphore: asyncio.Semaphore) -> BatchItemResult:
+    async with semaphore:
+        try:
+            result = await analyze_clothing(image, filename, use_cache=use_cache, priority="bulk")
+            return BatchItemResult(filename=filename, status="ok", result=result, prompt_version=prompts.version)
+        except HTTPException as e:
+            return BatchItemResult(filename=filename, status="error", error=str(e.detail), status_code=e.status_code)
+        except Exception as e:
+            return BatchItemResult(filename=filename, status="error", error=str(e), status_code=500)
+
+async def analyze_batch(items: List[Tuple[str, bytes]], use_cache: bool = True) -> AsyncIterator[BatchItemResult]:
+    """
+    Analyze many images, yielding each result as soon as it is ready.
+
+    At most `settings.batch_max_concurrency` images are analyzed at once.
+    Failures are reported as error records instead of aborting the batch.
+
+    Args:
+        items (List[Tuple[str, bytes]]): (filename, image bytes) pairs
+        use_cache (bool): Whether cached results may be returned
+
+    Yields:
+        BatchItemResult: One record per image, in completion order
+    """
+    semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+    tasks = [
+        asyncio.create_task(_analyze_item(filename, image, use_cache, semaphore))
+        for filename, image in items
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client may disconnect mid-stream; stop the remaining work
+        for task in tasks:
+            if not task.done():
+                task.cancel()
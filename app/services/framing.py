@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+from typing import List, Literal, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import FRAMING_OUTCOMES
+import io
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# (left, top, right, bottom) in pixels of the analyzed image
+Box = Tuple[int, int, int, int]
+
+# Crops covering more of the image than this save too little to be worth a second encode
+_MAX_CROP_AREA = 0.6
+
+EyewearOutcome = Literal["cropped", "full_frame", "skipped"]
+
+@dataclass
+class FramingPlan:
+    """What the pre-analysis found in an image and how the eyewear pass should run"""
+    face_found: Optional[bool]  # None when no detector is available
+    face_box: Optional[Box] = None
+    eyewear_image: Optional[bytes] = None  # Face crop, or None to use the full image
+    crop_area: float = 1.0  # Fraction of the image's pixels in the crop
+
+    @property
+    def skip_eyewear(self) -> bool:
+        """Whether the eyewear pass can be skipped because no face is visible."""
+        return self.face_found is False
+
+class FramingAnalyzer:
+    """
+    Cheap CPU pre-analysis deciding how the eyewear pass runs.
+
+    Faces are found with OpenCV's Haar cascades (frontal, then profile) on a
+    small grayscale thumbnail, which takes tens of milliseconds. When no face
+    is visible the eyewear pass cannot tell anything and is skipped; otherwise
+    it gets the largest face, plus a margin, instead of the full frame. Without
+    OpenCV every plan is "unavailable" and the passes run as usual.
+    """
+
+    def __init__(self, max_edge: int, face_margin: float):
+        self.max_edge = max_edge
+        self.face_margin = face_margin
+        self._local = threading.local()
+        self._available: Optional[bool] = None
+        self._lock = threading.Lock()
+        self._counters = {
+            "images": 0, "faces": 0, "no_face": 0, "unavailable": 0,
+            "eyewear_cropped": 0, "eyewear_full_frame": 0, "eyewear_skipped": 0, "crop_area_sum": 0.0,
+        }
+
+    def _cascades(self) -> Optional[list]:
+        # Cascade classifiers are not safe to share between threads, so each worker thread loads its own
+        if self._available is False:
+            return None
+        cascades = getattr(self._local, "cascades", None)
+        if cascades is None:
+            try:
+                import cv2
+                cascades = [cv2.CascadeClassifier(cv2.data.haarcascades + name)
+                            for name in ("haarcascade_frontalface_default.xml", "haarcascade_profileface.xml")]
+            except (ImportError, AttributeError):
+                cascades = []
+            if not cascades or any(cascade.empty() for cascade in cascades):
+                # OpenCV 5 no longer bundles the Haar cascades
+                logger.warning("Framing pre-analysis disabled: install opencv-python-headless<5 for face detection")
+                self._available = False
+                return None
+            self._available = True
+            self._local.cascades = cascades
+        return cascades
+
+    def _detect_faces(self, image) -> Optional[List[Box]]:
+        cascades = self._cascades()
+        if cascades is None:
+            return None
+        import numpy as np
+        from PIL import Image
+        thumbnail = image.convert("L")
+        thumbnail.thumbnail((self.max_edge, self.max_edge), Image.Resampling.BILINEAR)
+        pixels = np.asarray(thumbnail)
+        scale = image.width / thumbnail.width
+        for cascade in cascades:
+            faces = cascade.detectMultiScale(pixels, scaleFactor=1.2, minNeighbors=5, minSize=(24, 24))
+            if len(faces):
+                return [(int(x * scale), int(y * scale), int((x + w) * scale), int((y + h) * scale))
+                        for x, y, w, h in faces]
+        return []
+
+    def _crop(self, image, face: Box, image_format: str, quality: int) -> Tuple[Optional[bytes], float]:
+        left, top, right, bottom = face
+        margin_x = (right - left) * self.face_margin
+        margin_y = (bottom - top) * self.face_margin
+        box = (
+            max(0, int(left - margin_x)), max(0, int(top - margin_y)),
+            min(image.width, int(right + margin_x)), min(image.height, int(bottom + margin_y))
+        )
+        area = (box[2] - box[0]) * (box[3] - box[1]) / (image.width * image.height)
+        if area > _MAX_CROP_AREA:
+            return None, 1.0
+        output = io.BytesIO()
+        image.crop(box).save(output, format=image_format, quality=quality)
+        return output.getvalue(), area
+
+    def plan(self, image_bytes: bytes, image_format: str = "JPEG", quality: int = 85) -> FramingPlan:
+        """
+        Look for faces and prepare the eyewear crop. Blocking; run it in a thread.
+
+        Args:
+            image_bytes (bytes): The image sent to the model
+            image_format (str): Format the face crop is encoded in
+            quality (int): Encoder quality of the face crop
+
+        Returns:
+            FramingPlan: Whether a face was found and the crop for the eyewear pass
+        """
+        from PIL import Image
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        faces = self._detect_faces(image)
+        if faces is None:
+            plan, outcome = FramingPlan(face_found=None), "unavailable"
+        elif not faces:
+            plan, outcome = FramingPlan(face_found=False), "no_face"
+        else:
+            face = max(faces, key=lambda box: (box[2] - box[0]) * (box[3] - box[1]))
+            crop, area = self._crop(image, face, image_format, quality)
+            plan, outcome = FramingPlan(face_found=True, face_box=face, eyewear_image=crop, crop_area=area), "faces"
+        with self._lock:
+            self._counters["images"] += 1
+            self._counters[outcome] += 1
+        FRAMING_OUTCOMES.labels(outcome="face" if outcome == "faces" else outcome).inc()
+        return plan
+
+    def record_eyewear(self, outcome: EyewearOutcome, plan: Optional[FramingPlan] = None) -> None:
+        """Count how an eyewear pass was run, or that it was skipped."""
+        with self._lock:
+            self._counters[f"eyewear_{outcome}"] += 1
+            if outcome == "cropped" and plan is not None:
+                self._counters["crop_area_sum"] += plan.crop_area
+
+    def stats(self) -> dict:
+        """Return face detection counts and the eyewear pass skip and crop rates."""
+        with self._lock:
+            counters = dict(self._counters)
+        crop_area_sum = counters.pop("crop_area_sum")
+        needed = counters["eyewear_cropped"] + counters["eyewear_full_frame"] + counters["eyewear_skipped"]
+        ran = counters["eyewear_cropped"] + counters["eyewear_full_frame"]
+        return {
+            **counters,
+            "detector_available": self._available,
+            "eyewear_skip_rate": counters["eyewear_skipped"] / needed if needed else 0.0,
+            "eyewear_crop_rate": counters["eyewear_cropped"] / ran if ran else 0.0,
+            "avg_crop_area": crop_area_sum / counters["eyewear_cropped"] if counters["eyewear_cropped"] else 0.0,
+        }
+
+_analyzer: Optional[FramingAnalyzer] = None
+
+def get_framing_analyzer() -> FramingAnalyzer:
+    """Return the process-wide framing analyzer, creating it from settings on first use."""
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = FramingAnalyzer(max_edge=settings.framing_max_edge, face_margin=settings.framing_face_margin)
+    return _analyzer
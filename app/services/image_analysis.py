@@ -1,291 +1,696 @@
-from ollama import chat
 from fastapi import HTTPException
+from pydantic import ValidationError
 from app.schemas.image_analysis import ClothingAnalysisResponse
+from app.schemas.clothing import FullBodyClothingInfo
 from app.core.config import settings
-import tempfile
-import os
+from app.core.prompts import prompts
+from app.services.ollama_client import chat, chat_stream
+from app.services.result_cache import result_cache, make_cache_key
+from app.services.trace import AnalysisTrace
+from app.services.admission import Priority, get_admission_controller
+from app.services.micro_batcher import get_micro_batcher
+from app.services.framing import FramingPlan, get_framing_analyzer
+from app.services.result_store import get_result_store
+from app.core.metrics import observe_trace
+from app.utils.image_processing import blank_image, perceptual_hash, prepare_image_for_inference
+import asyncio
+import base64
+import hashlib
 import json
+import logging
+import re
 import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
 
-def _generate_clothing_prompt() -> str:
-    """Generate a prompt for analyzing only fully visible clothing and accessories, avoiding assumptions or partial items."""
-    return """Analyze ONLY what is FULLY visible in the image. DO NOT assume or infer anything outside the visible area.
-
-STRICT RULES:
-- **Describe ONLY completely visible items.** Ignore any item that is cropped, obscured, or partially visible.
-- **No assumptions.** If part of an item (e.g., sleeve, waistband, strap) is missing, exclude it from the analysis.
-- **Respect image framing.** If the image shows only the upper or lower body, do NOT mention unseen areas.
-- **CRITICAL: If only upper body is visible, DO NOT include ANY lower body clothing in your response.**
-- **CRITICAL: If only lower body is visible, DO NOT include ANY upper body clothing in your response.**
-
-CATEGORIES TO ANALYZE (ONLY IF FULLY VISIBLE):
-
-1. **Upper Body Clothing** (if fully visible):
-   - Identify specific types: shirt, t-shirt, blouse, tank top, polo shirt, sweater, hoodie, jacket, coat
-   - **Sleeve length** (only if both sleeves are fully visible): short, long, three-quarter, sleeveless.
-   - **If upper body is cropped or partially visible, set all upper body fields to "unknown".**
-
-2. **Lower Body Clothing** (if fully visible):
-   - **CRITICAL: SKIP COMPLETELY if the lower body is not in the image frame.**
-   - **SKIP if the lower body is cropped or if clothing is partially visible.**
-   - Identify types: jeans, trousers, shorts, skirt, leggings, sweatpants
-   - **Length** (only if fully visible): short, knee-length, midi, long, ankle-length.
-   - **If lower body is not visible or is cropped, set all lower body fields to null, not to "unknown".**
-
-3. **EYEWEAR - CRITICAL PRIORITY**
-   - **LOOK CAREFULLY for glasses or sunglasses on the person's face.**
-   - **Pay special attention to thin frames, clear lenses, or subtle eyewear that might be easily missed.**
-   - Identify if visible: **glasses, sunglasses, reading glasses, sports glasses, safety glasses, prescription glasses.**
-   - **Check for reflections, lens edges, or frame outlines around the eyes.**
-   - **If you see ANY eyewear, even if partially visible, set wearing to true and identify the type.**
-   - **If no eyewear is present, explicitly set wearing to false.**
-   - **Example Output:**
-     - "Person is wearing glasses with thin metal frames."
-     - "Person is wearing sunglasses with dark lenses."
-     - "No eyewear detected on the person's face."
-   - If **face is not visible or is cropped**, state: "**Eyewear status unknown**."
-   
-4. **HEADWEAR**
-   - Identify if fully visible: **hat, cap, beanie, hood**
-   - **Even if no headwear is present, explicitly confirm its absence.**
-   - **Example Output:**
-     - "Person is wearing a hat."
-     - "No headwear detected."
-   - If the **top of the head is cropped**, state: "**Headwear status unknown**."
-
-5. **ACCESSORIES**
-   - Identify if fully visible: **scarf, gloves, belt, tie, bow tie, necklace, bracelet, watch, earrings, rings, handbag, backpack, purse.**
-   - **Even if no accessories are present, explicitly confirm their absence.**
-   - **Example Output:**
-     - "Person is wearing a silver watch and a black leather belt."
-     - "No accessories detected."
-   - If **accessories are partially visible (e.g., a strap, ring edge, necklace glimpse), state:**
-     - "Accessories status unknown due to partial visibility."
-
-6. **THERMAL PROPERTIES AND WEATHER CONTEXT**
-   - Based on the visible clothing items, provide:
-   
-   a) **General Description:**
-      - Write a brief caption (2-3 sentences) describing the visible outfit
-      - Include material types if identifiable (cotton, wool, leather, etc.)
-      - Mention layering if present (e.g., "t-shirt under a light jacket")
-      
-   b) **Thermal Properties:**
-      - Describe the thermal insulation properties of the visible clothing
-      - Use terms like: very warm, warm, moderate, cool, very cool, lightweight, heavyweight, etc.
-      - Consider fabric thickness, coverage, and layering
-      - Example: "The outfit provides moderate warmth with the medium-weight sweater"
-      
-   c) **Weather Appropriateness:**
-      - Describe what weather conditions the visible outfit would be suitable for
-      - Consider temperature ranges, seasons, and weather conditions
-      - Example: "Suitable for mild spring or fall weather, approximately 15-20°C (59-68°F)"
-      - Example: "Appropriate for hot summer days, provides minimal coverage and thermal insulation"
-      
-   d) **IMPORTANT: Base your assessment ONLY on visible items**
-      - If only upper body is visible, limit your thermal/weather assessment to those items
-      - If crucial elements for weather assessment are missing, acknowledge this limitation
-      - Example: "Limited weather assessment possible as only upper body clothing is visible"
-
-**FINAL VERIFICATION:**
-    1. Are you describing **only fully visible items**?  
-    2. Have you **excluded** all cropped or partially visible items?  
-    3. Have you **skipped categories** that aren't entirely visible?  
-    4. Can you see the **entire item** in the image?
-    5. **CRITICAL CHECK: Have you carefully examined the face for any eyewear, including subtle or thin-framed glasses?**
-    6. **CRITICAL CHECK: If only upper body is visible in the image, have you set lower_body to null?**
-    7. **CRITICAL CHECK: If only lower body is visible in the image, have you set upper_body to null?**
-    8. **Have you provided thermal properties and weather appropriateness based ONLY on visible items?**
-
-**REMEMBER:** If an item is not fully visible, **DO NOT include it**. It is better to omit details than to assume.  
-"""
-
-async def analyze_clothing(image: bytes, image_name: str) -> ClothingAnalysisResponse:
+logger = logging.getLogger(__name__)
+
+# Callback receiving (event name, JSON-serialisable data) for partial results
+Emit = Callable[[str, Any], Awaitable[None]]
+
+# Field of each streamed pass whose text is emitted as it is generated
+_STREAMED_FIELDS = {"description": "general_description"}
+
+class _StreamedStringField:
     """
-    Analyze basic clothing information in an image using Ollama's VLM model.
-    
+    Pull the text of one string field out of a JSON object that arrives in chunks.
+
+    Only the field's characters are returned, with escapes decoded; an
+    escape sequence split across chunks is held back until it is complete.
+    """
+
+    def __init__(self, field: str):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._inside = False
+        self._done = False
+
+    def _complete_prefix(self) -> int:
+        """Length of the buffer that can be decoded, marking the field done at its closing quote."""
+        index = 0
+        while index < len(self._buffer):
+            char = self._buffer[index]
+            if char == '"':
+                self._done = True
+                break
+            if char != '\\':
+                index += 1
+                continue
+            length = 6 if self._buffer[index + 1:index + 2] == 'u' else 2
+            if length == 6 and 0xD800 <= int(self._buffer[index + 2:index + 6].ljust(4, '0'), 16) <= 0xDBFF:
+                length = 12  # High surrogate: keep the pair together
+            if index + length > len(self._buffer):
+                break
+            index += length
+        return index
+
+    def feed(self, chunk: str) -> str:
+        """Add the next chunk of output and return the field text it completed."""
+        if self._done:
+            return ""
+        self._buffer += chunk
+        if not self._inside:
+            match = self._key.search(self._buffer)
+            if match is None:
+                return ""
+            self._inside = True
+            self._buffer = self._buffer[match.end():]
+        try:
+            end = self._complete_prefix()
+            text = json.loads(f'"{self._buffer[:end]}"', strict=False)
+        except ValueError:
+            # Not valid JSON; the final parse of the full output reports it
+            self._done = True
+            return ""
+        self._buffer = self._buffer[end:]
+        return text
+
+def _model_options(temperature: Optional[float]) -> dict:
+    """
+    Build the Ollama options for a pass.
+
+    `num_ctx` is kept identical across passes and requests: a different context
+    size forces Ollama to reload the model and discards its prompt cache.
+    """
+    options = {'temperature': settings.model_temperature if temperature is None else temperature}
+    if settings.ollama_num_ctx is not None:
+        options['num_ctx'] = settings.ollama_num_ctx
+    if settings.ollama_num_keep is not None:
+        options['num_keep'] = settings.ollama_num_keep
+    return options
+
+def _chat_arguments(name: str, image_b64: str) -> dict:
+    prompt = prompts.get(name)
+    return dict(
+        model=settings.model_name,
+        format=prompt.schema,
+        messages=prompts.messages(name, image_b64),
+        options=_model_options(prompt.temperature),
+        keep_alive=settings.ollama_keep_alive
+    )
+
+async def _run_pass(name: str, image_b64: str, trace: AnalysisTrace, emit: Optional[Emit] = None) -> str:
+    """
+    Run one registered pass and return the model output.
+
+    With `emit`, the output is streamed and the text of the pass's
+    `_STREAMED_FIELDS` field is emitted in `{name}_delta` events as it
+    arrives. Otherwise, with micro-batching enabled for the pass, the call
+    joins a batch with concurrent calls.
+    """
+    with trace.stage(f"{name}_pass"):
+        if emit is None:
+            if settings.micro_batch_enabled and name in settings.micro_batch_passes:
+                return await get_micro_batcher().submit(name, image_b64, _chat_arguments(name, image_b64))
+            response = await chat(**_chat_arguments(name, image_b64))
+            return response.message.content
+        content = []
+        field = _StreamedStringField(_STREAMED_FIELDS[name])
+        async for part in chat_stream(**_chat_arguments(name, image_b64)):
+            if part.message.content:
+                content.append(part.message.content)
+                text = field.feed(part.message.content)
+                if text:
+                    await emit(f"{name}_delta", {'text': text})
+        return "".join(content)
+
+async def _run_main_pass(image_b64: str, trace: AnalysisTrace, emit: Optional[Emit] = None) -> dict:
+    """Run the structured clothing pass and return the parsed JSON response."""
+    content = await _run_pass("main", image_b64, trace)
+    logger.info(f"Model inference time: {trace.timings['main_pass']:.2f} seconds")
+    trace.outputs["main"] = content
+    with trace.stage("parse"):
+        raw_response = json.loads(content)
+    if emit is not None:
+        try:
+            clothing_info = FullBodyClothingInfo.model_validate(raw_response.get('clothing_info') or {})
+        except ValidationError:
+            pass  # Reported when the full response is validated
+        else:
+            trace.timings.setdefault("first_result", time.perf_counter() - trace.started)
+            await emit("clothing_info", clothing_info.model_dump())
+    return raw_response
+
+async def _run_eyewear_pass(image_b64: str, trace: AnalysisTrace, framing: Optional[FramingPlan] = None) -> str:
+    """Run the focused eyewear pass, on the face crop if the pre-analysis made one, and return the model output."""
+    if framing is not None and framing.eyewear_image is not None:
+        image_b64 = base64.b64encode(framing.eyewear_image).decode('ascii')
+    return await _run_pass("eyewear", image_b64, trace)
+
+async def _run_description_pass(image_b64: str, trace: AnalysisTrace, emit: Optional[Emit] = None) -> str:
+    """Run the description and thermal assessment pass, streaming it if `emit` is given."""
+    return await _run_pass("description", image_b64, trace, emit)
+
+def _needs_eyewear_refinement(raw_response: dict) -> bool:
+    """Whether the main pass left eyewear missing or unknown."""
+    eyewear = raw_response.get('clothing_info', {}).get('eyewear')
+    return not eyewear or eyewear.get('type') == 'unknown'
+
+def _needs_single_pass_eyewear_refinement(raw_response: dict) -> bool:
+    """
+    Whether the single pass left eyewear missing, or saw eyewear without telling its type.
+
+    Unlike multi_pass, a main-pass `{"wearing": false, "type": "unknown"}` is
+    taken as is, saving the eyewear call at the cost of the cases where the
+    main pass missed the eyewear.
+    """
+    eyewear = raw_response.get('clothing_info', {}).get('eyewear')
+    if not isinstance(eyewear, dict) or 'wearing' not in eyewear:
+        return True
+    return eyewear['wearing'] in (True, 'true') and eyewear.get('type', 'unknown') == 'unknown'
+
+def _needs_description_refinement(raw_response: dict) -> bool:
+    """Whether the main pass description or thermal assessment is missing or too thin to use."""
+    description = (raw_response.get('general_description') or '').strip()
+    return (
+        len(description) < settings.single_pass_min_description_length
+        or not (raw_response.get('thermal_properties') or '').strip()
+        or not (raw_response.get('weather_appropriateness') or '').strip()
+    )
+
+def _skip_eyewear(raw_response: dict, framing: Optional[FramingPlan], trace: AnalysisTrace) -> bool:
+    """
+    Whether the pre-analysis found no face, so an eyewear pass cannot help.
+
+    A skipped pass leaves eyewear null (not visible) unless the main pass
+    saw eyewear being worn.
+    """
+    if framing is None or not framing.skip_eyewear:
+        return False
+    trace.events.append("eyewear_skipped")
+    get_framing_analyzer().record_eyewear("skipped")
+    _mark_eyewear_not_visible(raw_response)
+    return True
+
+def _mark_eyewear_not_visible(raw_response: dict) -> None:
+    """
+    Report eyewear as null, like other items that are not visible, unless the main pass saw it worn.
+
+    A "not wearing" answer is dropped: without a visible face it cannot be
+    told apart from eyewear the main pass missed.
+    """
+    clothing_info = raw_response.setdefault('clothing_info', {})
+    eyewear = clothing_info.get('eyewear')
+    if not isinstance(eyewear, dict) or eyewear.get('wearing') not in (True, 'true'):
+        clothing_info['eyewear'] = None
+
+def _merge_eyewear(raw_response: dict, eyewear_content: str, trace: AnalysisTrace) -> None:
+    """Overwrite the main pass eyewear result with the focused eyewear detection."""
+    trace.outputs["eyewear"] = eyewear_content
+    try:
+        with trace.stage("parse"):
+            eyewear_data = json.loads(eyewear_content)
+        if 'clothing_info' not in raw_response:
+            raw_response['clothing_info'] = {}
+        raw_response['clothing_info']['eyewear'] = eyewear_data
+        logger.debug("Enhanced eyewear detection applied")
+    except (json.JSONDecodeError, KeyError):
+        trace.events.append("eyewear_parse_failure")
+        logger.warning("Failed to enhance eyewear detection")
+
+def _merge_description(raw_response: dict, description_content: str, trace: AnalysisTrace) -> None:
+    """Fill the description and thermal fields from the description pass."""
+    trace.outputs["description"] = description_content
+    try:
+        with trace.stage("parse"):
+            description_data = json.loads(description_content)
+        raw_response['general_description'] = description_data.get('general_description', 'No description available')
+        raw_response['thermal_properties'] = description_data.get('thermal_properties', '')
+        raw_response['weather_appropriateness'] = description_data.get('weather_appropriateness', '')
+        logger.debug("Enhanced description and thermal assessment applied")
+    except (json.JSONDecodeError, KeyError) as e:
+        trace.events.append("description_parse_failure")
+        logger.warning(f"Failed to enhance description: {str(e)}")
+        # Ensure we have at least a basic description if JSON parsing fails
+        if 'general_description' not in raw_response or not raw_response['general_description']:
+            raw_response['general_description'] = "The image shows a person wearing clothing. Detailed description could not be generated."
+
+async def _refine_eyewear(
+    raw_response: dict,
+    eyewear_content: str,
+    trace: AnalysisTrace,
+    emit: Optional[Emit],
+    framing: Optional[FramingPlan] = None
+) -> None:
+    """
+    Merge the eyewear pass result and emit the refined eyewear.
+
+    The framing stats count the pass here rather than when it starts, so
+    speculative passes that get cancelled are not counted.
+    """
+    _merge_eyewear(raw_response, eyewear_content, trace)
+    if framing is not None:
+        if framing.eyewear_image is not None:
+            trace.events.append("eyewear_cropped")
+            get_framing_analyzer().record_eyewear("cropped", framing)
+        else:
+            get_framing_analyzer().record_eyewear("full_frame")
+    if emit is not None:
+        await emit("eyewear", raw_response.get('clothing_info', {}).get('eyewear'))
+
+async def _run_single_pass(
+    image_b64: str,
+    trace: AnalysisTrace,
+    emit: Optional[Emit] = None,
+    framing: Optional[FramingPlan] = None
+) -> dict:
+    """
+    Get the whole analysis from the schema-constrained main pass, refining only
+    the parts that came back ambiguous.
+
+    The eyewear pass runs only if eyewear is missing, or worn with an unknown
+    type, and a face is visible, and the description pass only if the description or thermal fields
+    are empty or too short. When both are needed they run concurrently.
+
     Args:
-        image (bytes): The image data to analyze
-        image_name (str): The name of the image
-        
+        image_b64 (str): Base64-encoded image handed to the model
+        trace (AnalysisTrace): Receives the duration of each pass
+        emit (Optional[Emit]): Receives partial results as they become available
+        framing (Optional[FramingPlan]): Pre-analysis deciding whether and on
+            which crop the eyewear pass runs
+
     Returns:
-        ClothingAnalysisResponse: Basic clothing analysis results
-        
+        dict: The (possibly refined) raw response, ready for schema validation
+    """
+    raw_response = await _run_main_pass(image_b64, trace, emit)
+    eyewear_task = description_task = None
+    if _needs_single_pass_eyewear_refinement(raw_response):
+        trace.events.append("eyewear_fallback")
+        if not _skip_eyewear(raw_response, framing, trace):
+            eyewear_task = asyncio.create_task(_run_eyewear_pass(image_b64, trace, framing))
+    if _needs_description_refinement(raw_response):
+        trace.events.append("description_fallback")
+        description_task = asyncio.create_task(_run_description_pass(image_b64, trace, emit))
+    try:
+        if eyewear_task is not None:
+            await _refine_eyewear(raw_response, await eyewear_task, trace, emit, framing)
+        if description_task is not None:
+            _merge_description(raw_response, await description_task, trace)
+        return raw_response
+    finally:
+        for task in (description_task, eyewear_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+async def _schedule_passes(
+    image_b64: str,
+    trace: AnalysisTrace,
+    emit: Optional[Emit] = None,
+    framing: Optional[FramingPlan] = None
+) -> dict:
+    """
+    Run the model passes according to `settings.pass_schedule` and merge their results.
+
+    In "single_pass" analysis mode the schedule is ignored; see `_run_single_pass`.
+    Otherwise:
+
+    - "sequential": main pass, then the eyewear pass if needed, then the description pass.
+    - "parallel": the description pass runs alongside the main pass; the eyewear
+      pass starts only once the main pass turns out to be unsure about eyewear.
+    - "speculative": all three passes start together; the eyewear result is
+      discarded (and its call cancelled) when the main pass is already confident.
+
+    With a framing plan, the eyewear pass is skipped when no face is visible
+    and otherwise runs on the face crop.
+
+    Args:
+        image_b64 (str): Base64-encoded image handed to the model
+        trace (AnalysisTrace): Receives the duration of each pass
+        emit (Optional[Emit]): Receives partial results as they become available:
+            "clothing_info" once the main pass is parsed, "eyewear" after a
+            refinement and "description_delta" chunks from the streamed description pass
+        framing (Optional[FramingPlan]): Pre-analysis deciding whether and on
+            which crop the eyewear pass runs
+
+    Returns:
+        dict: The merged raw response, ready for schema validation
+    """
+    if settings.analysis_mode == "single_pass":
+        return await _run_single_pass(image_b64, trace, emit, framing)
+
+    mode = settings.pass_schedule
+    if mode == "sequential":
+        raw_response = await _run_main_pass(image_b64, trace, emit)
+        if _needs_eyewear_refinement(raw_response):
+            trace.events.append("eyewear_fallback")
+            if not _skip_eyewear(raw_response, framing, trace):
+                eyewear_content = await _run_eyewear_pass(image_b64, trace, framing)
+                await _refine_eyewear(raw_response, eyewear_content, trace, emit, framing)
+        _merge_description(raw_response, await _run_description_pass(image_b64, trace, emit), trace)
+        return raw_response
+
+    description_task = asyncio.create_task(_run_description_pass(image_b64, trace, emit))
+    eyewear_task = None
+    if mode == "speculative" and not (framing is not None and framing.skip_eyewear):
+        eyewear_task = asyncio.create_task(_run_eyewear_pass(image_b64, trace, framing))
+    try:
+        raw_response = await _run_main_pass(image_b64, trace, emit)
+        if _needs_eyewear_refinement(raw_response):
+            trace.events.append("eyewear_fallback")
+            if not _skip_eyewear(raw_response, framing, trace):
+                if eyewear_task is None:
+                    eyewear_task = asyncio.create_task(_run_eyewear_pass(image_b64, trace, framing))
+                await _refine_eyewear(raw_response, await eyewear_task, trace, emit, framing)
+        elif eyewear_task is not None:
+            eyewear_task.cancel()
+        _merge_description(raw_response, await description_task, trace)
+        return raw_response
+    finally:
+        # Don't leave follow-up passes running if the main pass failed
+        for task in (description_task, eyewear_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+def postprocess_outputs(outputs: Dict[str, str], events: List[str]) -> ClothingAnalysisResponse:
+    """
+    Rebuild a response from the raw outputs of an earlier analysis, without calling the model.
+
+    Applies the same parsing, merging and validation as a live analysis, so
+    stored outputs can be replayed through changed post-processing.
+
+    Args:
+        outputs (Dict[str, str]): Raw output of each merged pass, keyed "main", "eyewear" and "description"
+        events (List[str]): Events of the original analysis, e.g. "eyewear_skipped"
+
+    Returns:
+        ClothingAnalysisResponse: The rebuilt result
+
+    Raises:
+        json.JSONDecodeError, ValidationError: If the outputs cannot be turned into a valid response
+    """
+    trace = AnalysisTrace()
+    raw_response = json.loads(outputs["main"])
+    if "eyewear" in outputs:
+        _merge_eyewear(raw_response, outputs["eyewear"], trace)
+    elif "eyewear_skipped" in events:
+        _mark_eyewear_not_visible(raw_response)
+    if "description" in outputs:
+        _merge_description(raw_response, outputs["description"], trace)
+    return ClothingAnalysisResponse.model_validate(raw_response)
+
+def warm_up_chat_arguments() -> dict:
+    """
+    Chat arguments for the model warm-up inference.
+
+    Sends the main pass prompt with a small blank image and asks for a single
+    token: this loads the weights and the vision encoder with the same options
+    real passes use, and leaves the shared prompt prefix in Ollama's cache.
+    """
+    image_b64 = base64.b64encode(blank_image()).decode('utf-8')
+    return dict(
+        model=settings.model_name,
+        messages=prompts.messages("main", image_b64),
+        options={**_model_options(prompts.get("main").temperature), 'num_predict': 1},
+        keep_alive=settings.ollama_keep_alive
+    )
+
+def _cache_variant() -> str:
+    """Describe the settings that affect a result, for use in cache keys."""
+    variant = f"{settings.model_name}|{settings.model_temperature}|{prompts.version}|{settings.analysis_mode}"
+    return f"{variant}|framing" if settings.framing_enabled else variant
+
+async def _preprocess_image(image: bytes, image_name: str) -> bytes:
+    """
+    Downscale and re-encode an image off the event loop.
+
+    Raises:
+        HTTPException: 400 if the image cannot be decoded
+    """
+    try:
+        processed = await asyncio.to_thread(
+            prepare_image_for_inference,
+            image,
+            max_edge=settings.image_max_edge,
+            image_format=settings.image_format,
+            quality=settings.image_quality
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+    logger.info(f"Preprocessed {image_name}: {len(image)} -> {len(processed)} bytes")
+    return processed
+
+async def _plan_framing(image: bytes, image_name: str) -> Optional[FramingPlan]:
+    """Run the framing pre-analysis off the event loop; None if it fails, so every pass runs."""
+    try:
+        return await asyncio.to_thread(
+            get_framing_analyzer().plan, image, image_format=settings.image_format, quality=settings.image_quality
+        )
+    except Exception as e:
+        logger.warning(f"Framing pre-analysis failed for {image_name}: {str(e)}")
+        return None
+
+async def _run_analysis(
+    image: bytes,
+    image_name: str,
+    trace: AnalysisTrace,
+    emit: Optional[Emit] = None
+) -> ClothingAnalysisResponse:
+    """
+    Preprocess an image, run the model passes and validate the merged result.
+
     Raises:
         HTTPException: If there's an error processing the image or communicating with Ollama
     """
-    start_time = time.time()
-    temp_path = None
+    if settings.image_preprocessing_enabled:
+        with trace.stage("preprocess"):
+            image = await _preprocess_image(image, image_name)
+
+    framing = None
+    if settings.framing_enabled:
+        with trace.stage("framing"):
+            framing = await _plan_framing(image, image_name)
+
     try:
-        # Save image to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            temp_file.write(image)
-            temp_path = temp_file.name
-        
-        # Generate the prompt
-        prompt = _generate_clothing_prompt()
+        # Encode once; every pass reuses the same in-memory payload
+        image_b64 = base64.b64encode(image).decode('ascii')
         
         try:
-            # Call Ollama's chat with the image
-            model_start_time = time.time()
-            response = chat(
-                model=settings.model_name,
-                format=ClothingAnalysisResponse.model_json_schema(),
-                messages=[
-                    {
-                        'role': 'user',
-                        'content': prompt,
-                        'images': [temp_path],
-                    },
-                ],
-                options={'temperature': settings.model_temperature}
-            )
-            model_time = time.time() - model_start_time
-            print(f"Model inference time: {model_time:.2f} seconds")
-            
-            # Parse the response
             try:
-                # First, try to parse the raw response to potentially apply post-processing
-                raw_response = json.loads(response.message.content)
-                
-                # Post-processing for eyewear detection
-                # If the model is uncertain about eyewear, we'll do a second pass with a focused prompt
-                if (not raw_response.get('clothing_info', {}).get('eyewear') or 
-                    raw_response.get('clothing_info', {}).get('eyewear', {}).get('type') == 'unknown'):
-                    
-                    # Try a second pass with a focused prompt for eyewear detection
-                    eyewear_prompt = """Focus ONLY on detecting eyewear in this image.
-                    
-                    Look very carefully at the person's face and eyes. 
-                    
-                    1. Are they wearing glasses or sunglasses?
-                    2. Look for thin frames, clear lenses, or subtle eyewear that might be easily missed.
-                    3. Check for reflections, lens edges, or frame outlines around the eyes.
-                    
-                    Respond with a JSON object with these fields:
-                    {
-                      "wearing": true/false,
-                      "type": "glasses"/"sunglasses"/"reading glasses"/"unknown",
-                      "frame_style": "thin"/"thick"/"rimless"/"wire"/"plastic"/"unknown"
-                    }
-                    
-                    If you're absolutely certain there are no glasses, set wearing to false.
-                    """
-                    
-                    eyewear_response = chat(
-                        model=settings.model_name,
-                        messages=[
-                            {
-                                'role': 'user',
-                                'content': eyewear_prompt,
-                                'images': [temp_path],
-                            },
-                        ],
-                        options={'temperature': 0.1}  # Lower temperature for more focused detection
-                    )
-                    
-                    try:
-                        eyewear_data = json.loads(eyewear_response.message.content)
-                        # Update the raw response with the focused eyewear detection
-                        if 'clothing_info' not in raw_response:
-                            raw_response['clothing_info'] = {}
-                        raw_response['clothing_info']['eyewear'] = eyewear_data
-                        print("Enhanced eyewear detection applied")
-                    except (json.JSONDecodeError, KeyError):
-                        print("Failed to enhance eyewear detection")
-                
-                # Always do a second pass for description and thermal properties
-                # This ensures we always get a description even if the first pass doesn't provide one
-                
-                # Try a second pass with a focused prompt for description and thermal assessment
-                description_prompt = """Provide a detailed description of the clothing visible in this image.
-                
-                IMPORTANT: You MUST provide a detailed description of what you see.
-                
-                Based ONLY on what you can see in the image (do not make assumptions about clothing that is not visible):
-                
-                1. Provide a detailed general description of the visible outfit (3-4 sentences).
-                   - Describe the specific clothing items visible
-                   - Mention colors, patterns, and materials if identifiable
-                   - Describe how the items are worn together (layering, style)
-                
-                2. Describe the thermal insulation properties of the visible clothing.
-                   - How warm or cool would this clothing be?
-                   - Consider fabric thickness, coverage, and layering
+                raw_response = await _schedule_passes(image_b64, trace, emit, framing)
                 
-                3. Describe what weather conditions this outfit would be suitable for.
-                   - Which season(s) would this be appropriate for?
-                   - Suggest temperature ranges if possible
-                
-                Respond with a JSON object with these fields:
-                {
-                  "general_description": "Detailed description of the visible outfit",
-                  "thermal_properties": "Description of thermal insulation (e.g., warm, cool, lightweight)",
-                  "weather_appropriateness": "Description of suitable weather conditions"
-                }
-                
-                IMPORTANT: If only part of the body is visible, acknowledge this limitation in your assessment.
-                """
-                
-                description_response = chat(
-                    model=settings.model_name,
-                    messages=[
-                        {
-                            'role': 'user',
-                            'content': description_prompt,
-                            'images': [temp_path],
-                        },
-                    ],
-                    options={'temperature': 0.3}
-                )
-                
-                try:
-                    description_data = json.loads(description_response.message.content)
-                    # Update the raw response with the description and thermal assessment
-                    raw_response['general_description'] = description_data.get('general_description', 'No description available')
-                    raw_response['thermal_properties'] = description_data.get('thermal_properties', '')
-                    raw_response['weather_appropriateness'] = description_data.get('weather_appropriateness', '')
-                    print("Enhanced description and thermal assessment applied")
-                except (json.JSONDecodeError, KeyError) as e:
-                    print(f"Failed to enhance description: {str(e)}")
-                    # Ensure we have at least a basic description if JSON parsing fails
-                    if 'general_description' not in raw_response or not raw_response['general_description']:
-                        raw_response['general_description'] = "The image shows a person wearing clothing. Detailed description could not be generated."
-                
-                # Now validate the potentially modified response
-                analysis = ClothingAnalysisResponse.model_validate(raw_response)
-                
-                total_time = time.time() - start_time
-                print(f"Total analysis time: {total_time:.2f} seconds")
-                                    
-                return analysis
+                # Now validate the merged response
+                with trace.stage("validate"):
+                    return ClothingAnalysisResponse.model_validate(raw_response)
+            except HTTPException:
+                raise
             except json.JSONDecodeError:
                 raise HTTPException(
                     status_code=500,
                     detail="Failed to parse model response as valid JSON"
                 )
-            except Exception as e:
+            except ValidationError as e:
                 raise HTTPException(
                     status_code=500,
                     detail=f"Failed to validate model response: {str(e)}"
                 )
                 
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=503,
                 detail=f"Failed to communicate with Ollama model: {str(e)}"
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
         )
+
+async def analyze_clothing(
+    image: bytes,
+    image_name: str,
+    use_cache: bool = True,
+    trace: Optional[AnalysisTrace] = None,
+    priority: Priority = "interactive",
+    emit: Optional[Emit] = None
+) -> ClothingAnalysisResponse:
+    """
+    Analyze basic clothing information in an image using Ollama's VLM model.
+    
+    Args:
+        image (bytes): The image data to analyze
+        image_name (str): The name of the image
+        use_cache (bool): Whether a cached result may be returned. Fresh results
+            are stored in the cache either way.
+        trace (Optional[AnalysisTrace]): Receives per-stage timings and the cache outcome
+        priority (Priority): Admission class; "interactive" requests are served before "bulk"
+        emit (Optional[Emit]): Receives partial results while the passes run; see
+            `analyze_clothing_stream`
         
+    Returns:
+        ClothingAnalysisResponse: Basic clothing analysis results
+        
+    Raises:
+        HTTPException: If there's an error processing the image or communicating with Ollama,
+            or 429/503 if the analysis queue is full or the wait for a slot timed out
+    """
+    trace = trace if trace is not None else AnalysisTrace()
+    try:
+        return await _analyze_clothing(image, image_name, use_cache, trace, priority, emit)
     finally:
-        # Clean up the temporary file
-        if temp_path and os.path.exists(temp_path):
+        observe_trace(trace)
+
+async def _analyze_clothing(
+    image: bytes,
+    image_name: str,
+    use_cache: bool,
+    trace: AnalysisTrace,
+    priority: Priority,
+    emit: Optional[Emit]
+) -> ClothingAnalysisResponse:
+    start_time = time.time()
+
+    if len(image) > settings.max_upload_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image exceeds the {settings.max_upload_bytes} byte limit"
+        )
+
+    cache_key = variant = phash = None
+    if settings.cache_enabled:
+        variant = _cache_variant()
+        cache_key = make_cache_key(image, variant)
+        if settings.cache_perceptual_hash:
             try:
-                os.remove(temp_path)
-            except:
-                pass  # Ignore cleanup errors
+                phash = await asyncio.to_thread(perceptual_hash, image)
+            except Exception as e:
+                logger.warning(f"Perceptual hash unavailable for {image_name}: {str(e)}")
+        if use_cache:
+            cached = await result_cache.get(cache_key, variant, phash)
+            if cached is not None:
+                logger.info(f"Cache hit for {image_name}")
+                trace.cache = "hit"
+                return cached
+        trace.cache = "miss" if use_cache else "bypass"
+
+    # Cache hits above never queue; only model work is subject to admission control
+    async with get_admission_controller().slot(priority) as waited:
+        trace.timings["queue_wait"] = waited
+        analysis = await _run_analysis(image, image_name, trace, emit)
+
+    if cache_key is not None:
+        await result_cache.set(cache_key, variant, analysis, phash)
+
+    total_time = time.time() - start_time
+    trace.timings["total"] = total_time
+    logger.info(f"Total analysis time: {total_time:.2f} seconds")
+    if settings.result_store_enabled:
+        await _store_result(image, image_name, analysis, trace)
+    return analysis
+
+async def _store_result(image: bytes, image_name: str, analysis: ClothingAnalysisResponse, trace: AnalysisTrace) -> None:
+    """Append a fresh result to the result store; failures are logged, not raised."""
+    try:
+        with trace.stage("store"):
+            await asyncio.to_thread(
+                get_result_store().record,
+                hashlib.sha256(image).hexdigest(),
+                image_name,
+                analysis,
+                outputs=dict(trace.outputs),
+                timings=dict(trace.timings),
+                events=list(trace.events),
+                model_name=settings.model_name,
+                prompt_version=prompts.version,
+                analysis_mode=settings.analysis_mode
+            )
+    except Exception as e:
+        logger.warning(f"Failed to store the result for {image_name}: {str(e)}")
+
+async def analyze_clothing_stream(
+    image: bytes,
+    image_name: str,
+    use_cache: bool = True,
+    trace: Optional[AnalysisTrace] = None,
+    priority: Priority = "interactive"
+) -> AsyncIterator[dict]:
+    """
+    Analyze an image like `analyze_clothing`, yielding partial results as they arrive.
+
+    Events are dicts with "event" and "data" keys:
+
+    - "clothing_info": structured clothing from the main pass, once it validates
+    - "eyewear": the refined eyewear, if the eyewear pass ran
+    - "description_delta": `{"text": ...}` pieces of the general description
+      as the model generates it; concatenated, they give the description
+      pass's `general_description`
+    - "result": the final `ClothingAnalysisResponse`, always the last event on success
+    - "error": status_code and detail if the analysis failed after events were
+      already sent; ends the stream
+
+    "clothing_info" always comes first: the description pass may run
+    alongside the main pass, so its deltas are held back until then. After
+    it, "eyewear" and "description_delta" events interleave in the order they
+    are produced. A cached result is returned as a single "result" event.
+
+    Raises:
+        HTTPException: If the analysis fails before the first event, so callers
+            can still answer with a proper status code (e.g. 429 when the queue is full)
+    """
+    trace = trace if trace is not None else AnalysisTrace()
+    events = asyncio.Queue()
+    held = []  # Description deltas produced before "clothing_info"
+
+    async def emit(event: str, data: Any) -> None:
+        if event == "description_delta" and held is not None:
+            held.append({'event': event, 'data': data})
+            return
+        await events.put({'event': event, 'data': data})
+        if event == "clothing_info":
+            await release_held()
+
+    async def release_held() -> None:
+        nonlocal held
+        pending, held = held or [], None
+        for event in pending:
+            await events.put(event)
+
+    async def produce() -> None:
+        try:
+            result = await analyze_clothing(image, image_name, use_cache, trace, priority, emit)
+            await release_held()
+            await emit("result", result.model_dump())
+        except HTTPException as e:
+            await events.put(e)
+        except Exception as e:
+            await events.put(HTTPException(status_code=500, detail=str(e)))
+        finally:
+            await events.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        started = False
+        while (event := await events.get()) is not None:
+            if isinstance(event, HTTPException):
+                if not started:
+                    raise event
+                event = {'event': "error", 'data': {'status_code': event.status_code, 'detail': event.detail}}
+            started = True
+            yield event
+    finally:
+        # The client may have disconnected; stop the model work too
+        if not producer.done():
+            producer.cancel()
@@ -0,0 +1,616 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.schemas.jobs import JobStatus
+from app.services.admission import PRIORITY_ORDER, Priority
+import asyncio
+import heapq
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+FINISHED_STATES = ("done", "failed")
+
+@dataclass
+class NewJob:
+    """An image to queue for analysis"""
+    image: bytes
+    filename: str
+    use_cache: bool = True
+    priority: Priority = "interactive"
+    batch_id: Optional[str] = None
+
+@dataclass
+class ClaimedJob:
+    """
+    A job a worker has picked up, with everything needed to run it.
+
+    `worker` and `status.attempts` identify the lease: finishing, releasing
+    or renewing the job only succeeds while both still match.
+    """
+    status: JobStatus
+    image: bytes
+    use_cache: bool
+    worker: str
+
+class JobQueue(ABC):
+    """
+    Durable queue of analysis jobs shared by API nodes and workers.
+
+    Workers claim jobs with a lease of `settings.job_lease_seconds`, which
+    they renew while the job runs. A job whose worker disappears is handed
+    out again once its lease expires, up to `settings.job_max_attempts`
+    pickups in total; a worker that lost its lease can no longer change the
+    job. Interactive jobs are claimed before bulk ones, oldest first within a
+    class. Finished jobs are kept for `settings.job_result_ttl_seconds`.
+    """
+
+    @abstractmethod
+    async def submit(self, jobs: List[NewJob]) -> List[JobStatus]:
+        """Queue jobs and return their initial status."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[JobStatus]:
+        """Return the current status of a job, or None if it is unknown or expired."""
+
+    @abstractmethod
+    async def batch(self, batch_id: str) -> List[JobStatus]:
+        """Return the jobs of a batch in submission order."""
+
+    @abstractmethod
+    async def claim(self, worker: str, timeout: float) -> Optional[ClaimedJob]:
+        """Take the next job, waiting up to `timeout` seconds; None if there was none."""
+
+    @abstractmethod
+    async def finish(self, job: ClaimedJob) -> bool:
+        """Store the outcome in `job.status` ("done" or "failed"); False if the lease was lost."""
+
+    @abstractmethod
+    async def release(self, job: ClaimedJob, delay: float = 0.0) -> bool:
+        """
+        Put a claimed job back in the queue, e.g. after a transient failure.
+
+        The job is not handed out again for `delay` seconds. Returns False if
+        the lease was lost.
+        """
+
+    @abstractmethod
+    async def renew(self, job: ClaimedJob) -> bool:
+        """Extend the lease of a running job by `settings.job_lease_seconds`; False if it was lost."""
+
+    async def wait(self, job_id: str, timeout: float, since: Optional[str] = None) -> Optional[JobStatus]:
+        """
+        Wait until a job's state differs from `since` or it finishes.
+
+        Returns the latest status after at most `timeout` seconds, or None if
+        the job is unknown.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            status = await self.get(job_id)
+            if (status is None or status.status in FINISHED_STATES or status.status != since
+                    or time.monotonic() >= deadline):
+                return status
+            await asyncio.sleep(min(settings.job_poll_interval_seconds, max(0.0, deadline - time.monotonic())))
+
+    async def close(self) -> None:
+        """Release connections held by the queue."""
+
+class MemoryJobQueue(JobQueue):
+    """
+    Job queue held in the API process.
+
+    Jobs are lost on restart and only workers running inside the same process
+    (`settings.job_api_workers`) can serve it.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Tuple[JobStatus, Optional[bytes], bool]] = {}
+        self._batches: Dict[str, List[str]] = {}
+        self._heap = []
+        self._delayed = []  # (available_at, sequence, job_id) of jobs backing off before a retry
+        self._workers: Dict[str, str] = {}  # Worker holding each running job
+        self._sequence = itertools.count()
+        self._changed: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    async def _notify(self) -> None:
+        async with self._condition():
+            self._condition().notify_all()
+
+    def _expire(self) -> None:
+        cutoff = time.time() - settings.job_result_ttl_seconds
+        for job_id in [job_id for job_id, (status, _, _) in self._jobs.items()
+                       if status.finished_at is not None and status.finished_at < cutoff]:
+            status, _, _ = self._jobs.pop(job_id)
+            if status.batch_id in self._batches:
+                self._batches[status.batch_id].remove(job_id)
+                if not self._batches[status.batch_id]:
+                    del self._batches[status.batch_id]
+
+    async def submit(self, jobs: List[NewJob]) -> List[JobStatus]:
+        self._expire()
+        statuses = []
+        for job in jobs:
+            status = JobStatus(job_id=uuid.uuid4().hex, status="queued", filename=job.filename,
+                               priority=job.priority, batch_id=job.batch_id, created_at=time.time())
+            self._jobs[status.job_id] = (status, job.image, job.use_cache)
+            if job.batch_id is not None:
+                self._batches.setdefault(job.batch_id, []).append(status.job_id)
+            heapq.heappush(self._heap, (PRIORITY_ORDER[job.priority], next(self._sequence), status.job_id))
+            statuses.append(status.model_copy())
+        await self._notify()
+        return statuses
+
+    async def get(self, job_id: str) -> Optional[JobStatus]:
+        entry = self._jobs.get(job_id)
+        return entry[0].model_copy() if entry else None
+
+    async def batch(self, batch_id: str) -> List[JobStatus]:
+        return [self._jobs[job_id][0].model_copy() for job_id in self._batches.get(batch_id, [])]
+
+    def _promote(self) -> Optional[float]:
+        """Queue the retries whose backoff has passed; return seconds until the next one is due."""
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, job_id = heapq.heappop(self._delayed)
+            status = self._jobs[job_id][0]
+            heapq.heappush(self._heap, (PRIORITY_ORDER[status.priority], next(self._sequence), job_id))
+        return self._delayed[0][0] - now if self._delayed else None
+
+    def _holds(self, job: ClaimedJob) -> bool:
+        entry = self._jobs.get(job.status.job_id)
+        return (entry is not None and entry[0].status == "running" and entry[0].attempts == job.status.attempts
+                and self._workers.get(job.status.job_id) == job.worker)
+
+    async def claim(self, worker: str, timeout: float) -> Optional[ClaimedJob]:
+        deadline = time.monotonic() + timeout
+        async with self._condition():
+            while True:
+                next_due = self._promote()
+                if self._heap:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(self._condition().wait(),
+                                           remaining if next_due is None else min(remaining, next_due))
+                except asyncio.TimeoutError:
+                    pass
+            _, _, job_id = heapq.heappop(self._heap)
+        status, image, use_cache = self._jobs[job_id]
+        status.status = "running"
+        status.started_at = time.time()
+        status.attempts += 1
+        self._workers[job_id] = worker
+        await self._notify()
+        return ClaimedJob(status=status.model_copy(), image=image, use_cache=use_cache, worker=worker)
+
+    async def finish(self, job: ClaimedJob) -> bool:
+        if not self._holds(job):
+            return False
+        _, _, use_cache = self._jobs[job.status.job_id]
+        self._jobs[job.status.job_id] = (job.status.model_copy(), None, use_cache)
+        del self._workers[job.status.job_id]
+        await self._notify()
+        return True
+
+    async def release(self, job: ClaimedJob, delay: float = 0.0) -> bool:
+        if not self._holds(job):
+            return False
+        current, _, _ = self._jobs[job.status.job_id]
+        current.status = "queued"
+        del self._workers[job.status.job_id]
+        if delay > 0:
+            heapq.heappush(self._delayed, (time.time() + delay, next(self._sequence), job.status.job_id))
+        else:
+            heapq.heappush(self._heap, (PRIORITY_ORDER[current.priority], next(self._sequence), job.status.job_id))
+        await self._notify()
+        return True
+
+    async def renew(self, job: ClaimedJob) -> bool:
+        # Workers of the memory queue live in this process, so leases never expire
+        return self._holds(job)
+
+    async def wait(self, job_id: str, timeout: float, since: Optional[str] = None) -> Optional[JobStatus]:
+        deadline = time.monotonic() + timeout
+        async with self._condition():
+            while True:
+                status = await self.get(job_id)
+                remaining = deadline - time.monotonic()
+                if status is None or status.status in FINISHED_STATES or status.status != since or remaining <= 0:
+                    return status
+                try:
+                    await asyncio.wait_for(self._condition().wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Job queue in a SQLite file, shared by API and worker processes on one host.
+
+    Jobs survive restarts of either. Claims take a write lock so two workers
+    never get the same job.
+    """
+
+    _COLUMNS = ("job_id", "status", "filename", "priority", "batch_id", "created_at", "started_at",
+                "finished_at", "attempts", "result", "error", "status_code", "prompt_version")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT NOT NULL, priority TEXT NOT NULL, "
+            "priority_rank INTEGER NOT NULL, batch_id TEXT, created_at REAL NOT NULL, started_at REAL, "
+            "finished_at REAL, lease_expires_at REAL, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+            "use_cache INTEGER NOT NULL, image BLOB, result TEXT, error TEXT, status_code INTEGER, "
+            "prompt_version TEXT)"
+        )
+        if "available_at" not in {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}:
+            # Queue files created before retries were delayed
+            self._db.execute("ALTER TABLE jobs ADD COLUMN available_at REAL")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (status, priority_rank, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_by_batch ON jobs (batch_id, created_at)")
+
+    def _status(self, row) -> JobStatus:
+        values = dict(zip(self._COLUMNS, row))
+        values['result'] = json.loads(values['result']) if values['result'] else None
+        return JobStatus(**values)
+
+    def _select(self, where: str, parameters: tuple) -> List[JobStatus]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE {where} ORDER BY created_at, rowid", parameters
+            ).fetchall()
+        return [self._status(row) for row in rows]
+
+    def _submit(self, jobs: List[NewJob]) -> List[JobStatus]:
+        now = time.time()
+        statuses = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM jobs WHERE finished_at < ?", (now - settings.job_result_ttl_seconds,))
+                for job in jobs:
+                    status = JobStatus(job_id=uuid.uuid4().hex, status="queued", filename=job.filename,
+                                       priority=job.priority, batch_id=job.batch_id, created_at=now)
+                    self._db.execute(
+                        "INSERT INTO jobs (job_id, status, filename, priority, priority_rank, batch_id, created_at, "
+                        "use_cache, image) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                        (status.job_id, job.filename, job.priority, PRIORITY_ORDER[job.priority], job.batch_id,
+                         now, int(job.use_cache), job.image)
+                    )
+                    statuses.append(status)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return statuses
+
+    def _claim(self, worker: str) -> Optional[ClaimedJob]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker vanished: give up after too many attempts, otherwise hand them out again
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, image = NULL, status_code = 500, "
+                    "error = 'Worker stopped responding ' || attempts || ' times' "
+                    "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                    (now, now, settings.job_max_attempts)
+                )
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND lease_expires_at < ?", (now,)
+                )
+                row = self._db.execute(
+                    "SELECT job_id, use_cache, image FROM jobs WHERE status = 'queued' "
+                    "AND (available_at IS NULL OR available_at <= ?) "
+                    "ORDER BY priority_rank, created_at, rowid LIMIT 1", (now,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?, lease_expires_at = ?, "
+                        "attempts = attempts + 1, worker = ? WHERE job_id = ?",
+                        (now, now + settings.job_lease_seconds, worker, row[0])
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        status = self._select("job_id = ?", (row[0],))[0]
+        return ClaimedJob(status=status, image=row[2], use_cache=bool(row[1]), worker=worker)
+
+    # Appended to every update of a claimed job, so it only applies while the caller holds the lease
+    _HELD = " WHERE job_id = ? AND status = 'running' AND worker = ? AND attempts = ?"
+
+    def _update_held(self, assignments: str, parameters: tuple, job: ClaimedJob) -> bool:
+        with self._lock:
+            cursor = self._db.execute(
+                f"UPDATE jobs SET {assignments}{self._HELD}",
+                parameters + (job.status.job_id, job.worker, job.status.attempts)
+            )
+        return cursor.rowcount == 1
+
+    def _finish(self, job: ClaimedJob) -> bool:
+        status = job.status
+        return self._update_held(
+            "status = ?, finished_at = ?, result = ?, error = ?, status_code = ?, "
+            "prompt_version = ?, image = NULL, lease_expires_at = NULL",
+            (status.status, status.finished_at,
+             status.result.model_dump_json() if status.result is not None else None,
+             status.error, status.status_code, status.prompt_version),
+            job
+        )
+
+    def _release(self, job: ClaimedJob, delay: float) -> bool:
+        return self._update_held(
+            "status = 'queued', lease_expires_at = NULL, available_at = ?", (time.time() + delay,), job
+        )
+
+    def _renew(self, job: ClaimedJob) -> bool:
+        return self._update_held("lease_expires_at = ?", (time.time() + settings.job_lease_seconds,), job)
+
+    async def submit(self, jobs: List[NewJob]) -> List[JobStatus]:
+        return await asyncio.to_thread(self._submit, jobs)
+
+    async def get(self, job_id: str) -> Optional[JobStatus]:
+        statuses = await asyncio.to_thread(self._select, "job_id = ?", (job_id,))
+        return statuses[0] if statuses else None
+
+    async def batch(self, batch_id: str) -> List[JobStatus]:
+        return await asyncio.to_thread(self._select, "batch_id = ?", (batch_id,))
+
+    async def claim(self, worker: str, timeout: float) -> Optional[ClaimedJob]:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await asyncio.to_thread(self._claim, worker)
+            remaining = deadline - time.monotonic()
+            if job is not None or remaining <= 0:
+                return job
+            await asyncio.sleep(min(settings.job_poll_interval_seconds, remaining))
+
+    async def finish(self, job: ClaimedJob) -> bool:
+        return await asyncio.to_thread(self._finish, job)
+
+    async def release(self, job: ClaimedJob, delay: float = 0.0) -> bool:
+        return await asyncio.to_thread(self._release, job, delay)
+
+    async def renew(self, job: ClaimedJob) -> bool:
+        return await asyncio.to_thread(self._renew, job)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+# Lua scripts run atomically on the server, so a job is never popped from its queue without a
+# lease, and a worker whose lease expired cannot overwrite the job once someone else holds it.
+# Job hashes are addressed through the key prefix passed in ARGV[1].
+
+# Whether the caller still holds the lease: ARGV[2] job id, ARGV[3] worker, ARGV[4] attempt
+_REDIS_HELD = """
+local job_key = ARGV[1] .. 'job:' .. ARGV[2]
+if redis.call('HGET', job_key, 'worker') ~= ARGV[3] then return 0 end
+local current = redis.call('HGET', job_key, 'status')
+if not current then return 0 end
+current = cjson.decode(current)
+if current.status ~= 'running' or current.attempts ~= tonumber(ARGV[4]) then return 0 end
+"""
+
+# KEYS: leases, delayed, queues in claim order. ARGV: prefix, now, lease expiry, worker, max attempts, result TTL
+_REDIS_CLAIM = """
+local prefix, now = ARGV[1], tonumber(ARGV[2])
+-- Jobs whose worker vanished: give up after too many attempts, otherwise hand them out again
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)) do
+    redis.call('ZREM', KEYS[1], job_id)
+    local job_key = prefix .. 'job:' .. job_id
+    local raw = redis.call('HGET', job_key, 'status')
+    if raw then
+        local status = cjson.decode(raw)
+        if status.status == 'running' then
+            redis.call('HDEL', job_key, 'worker')
+            if status.attempts >= tonumber(ARGV[5]) then
+                status.status = 'failed'
+                status.finished_at = now
+                status.error = 'Worker stopped responding ' .. status.attempts .. ' times'
+                status.status_code = 500
+                redis.call('HSET', job_key, 'status', cjson.encode(status))
+                redis.call('HDEL', job_key, 'image')
+                redis.call('EXPIRE', job_key, ARGV[6])
+            else
+                status.status = 'queued'
+                redis.call('HSET', job_key, 'status', cjson.encode(status))
+                redis.call('RPUSH', prefix .. 'queue:' .. status.priority, job_id)
+            end
+        end
+    end
+end
+-- Retries whose backoff has passed
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], job_id)
+    local raw = redis.call('HGET', prefix .. 'job:' .. job_id, 'status')
+    if raw then
+        redis.call('RPUSH', prefix .. 'queue:' .. cjson.decode(raw).priority, job_id)
+    end
+end
+for index = 3, #KEYS do
+    local job_id = redis.call('RPOP', KEYS[index])
+    while job_id do
+        local job_key = prefix .. 'job:' .. job_id
+        local raw = redis.call('HGET', job_key, 'status')
+        if raw then
+            local status = cjson.decode(raw)
+            status.status = 'running'
+            status.started_at = now
+            status.attempts = status.attempts + 1
+            raw = cjson.encode(status)
+            redis.call('HSET', job_key, 'status', raw, 'worker', ARGV[4])
+            redis.call('ZADD', KEYS[1], ARGV[3], job_id)
+            return {raw, redis.call('HGET', job_key, 'image'), redis.call('HGET', job_key, 'use_cache')}
+        end
+        -- The job expired while queued
+        job_id = redis.call('RPOP', KEYS[index])
+    end
+end
+return false
+"""
+
+# KEYS: leases. ARGV: prefix, job id, worker, attempt, status, result TTL
+_REDIS_FINISH = _REDIS_HELD + """
+redis.call('ZREM', KEYS[1], ARGV[2])
+redis.call('HSET', job_key, 'status', ARGV[5])
+redis.call('HDEL', job_key, 'image', 'worker')
+redis.call('EXPIRE', job_key, ARGV[6])
+return 1
+"""
+
+# KEYS: leases, delayed, queue. ARGV: prefix, job id, worker, attempt, status, time the job is due again or ''
+_REDIS_RELEASE = _REDIS_HELD + """
+redis.call('ZREM', KEYS[1], ARGV[2])
+redis.call('HSET', job_key, 'status', ARGV[5])
+redis.call('HDEL', job_key, 'worker')
+if ARGV[6] == '' then
+    redis.call('RPUSH', KEYS[3], ARGV[2])
+else
+    redis.call('ZADD', KEYS[2], ARGV[6], ARGV[2])
+end
+return 1
+"""
+
+# KEYS: leases. ARGV: prefix, job id, worker, attempt, new lease expiry
+_REDIS_RENEW = _REDIS_HELD + """
+redis.call('ZADD', KEYS[1], ARGV[5], ARGV[2])
+return 1
+"""
+
+class RedisJobQueue(JobQueue):
+    """
+    Job queue on a Redis-compatible server, shared by API nodes and workers on any host.
+
+    Besides hashes, lists and sorted sets, claims and lease checks run as Lua
+    scripts (EVALSHA), which Redis, Valkey and KeyDB all support. Workers
+    poll for jobs every `settings.job_poll_interval_seconds`. Requires the
+    `redis` package.
+    """
+
+    def __init__(self, url: str, prefix: str = "vlm:jobs:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis job queue requires the redis package: pip install redis")
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+        self._claim = self._redis.register_script(_REDIS_CLAIM)
+        self._finish = self._redis.register_script(_REDIS_FINISH)
+        self._release = self._redis.register_script(_REDIS_RELEASE)
+        self._renew = self._redis.register_script(_REDIS_RENEW)
+
+    def _key(self, *parts: str) -> str:
+        return self._prefix + ":".join(parts)
+
+    def _queue_keys(self) -> List[str]:
+        # Checked in order, so interactive jobs are taken first
+        return [self._key("queue", priority) for priority in sorted(PRIORITY_ORDER, key=PRIORITY_ORDER.get)]
+
+    def _status(self, fields: dict) -> Optional[JobStatus]:
+        if not fields:
+            return None
+        return JobStatus.model_validate_json(fields[b"status"])
+
+    def _held(self, job: ClaimedJob) -> list:
+        """Script arguments identifying the caller's lease."""
+        return [self._prefix, job.status.job_id, job.worker, job.status.attempts]
+
+    async def submit(self, jobs: List[NewJob]) -> List[JobStatus]:
+        statuses = []
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for job in jobs:
+                status = JobStatus(job_id=uuid.uuid4().hex, status="queued", filename=job.filename,
+                                   priority=job.priority, batch_id=job.batch_id, created_at=time.time())
+                pipe.hset(self._key("job", status.job_id), mapping={
+                    "status": status.model_dump_json(), "image": job.image, "use_cache": int(job.use_cache)
+                })
+                if job.batch_id is not None:
+                    pipe.rpush(self._key("batch", job.batch_id), status.job_id)
+                    pipe.expire(self._key("batch", job.batch_id), int(settings.job_result_ttl_seconds * 2))
+                pipe.lpush(self._key("queue", job.priority), status.job_id)
+                statuses.append(status)
+            await pipe.execute()
+        return statuses
+
+    async def get(self, job_id: str) -> Optional[JobStatus]:
+        return self._status(await self._redis.hgetall(self._key("job", job_id)))
+
+    async def batch(self, batch_id: str) -> List[JobStatus]:
+        job_ids = await self._redis.lrange(self._key("batch", batch_id), 0, -1)
+        statuses = [await self.get(job_id.decode()) for job_id in job_ids]
+        return [status for status in statuses if status is not None]
+
+    async def claim(self, worker: str, timeout: float) -> Optional[ClaimedJob]:
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.time()
+            claimed = await self._claim(
+                keys=[self._key("leases"), self._key("delayed"), *self._queue_keys()],
+                args=[self._prefix, now, now + settings.job_lease_seconds, worker,
+                      settings.job_max_attempts, int(settings.job_result_ttl_seconds)]
+            )
+            remaining = deadline - time.monotonic()
+            if claimed is not None or remaining <= 0:
+                break
+            await asyncio.sleep(min(settings.job_poll_interval_seconds, remaining))
+        if claimed is None:
+            return None
+        status, image, use_cache = claimed
+        return ClaimedJob(status=JobStatus.model_validate_json(status), image=image,
+                          use_cache=use_cache == b"1", worker=worker)
+
+    async def finish(self, job: ClaimedJob) -> bool:
+        return bool(await self._finish(
+            keys=[self._key("leases")],
+            args=[*self._held(job), job.status.model_dump_json(), int(settings.job_result_ttl_seconds)]
+        ))
+
+    async def release(self, job: ClaimedJob, delay: float = 0.0) -> bool:
+        status = job.status.model_copy(update={"status": "queued"})
+        return bool(await self._release(
+            keys=[self._key("leases"), self._key("delayed"), self._key("queue", status.priority)],
+            args=[*self._held(job), status.model_dump_json(), time.time() + delay if delay > 0 else ""]
+        ))
+
+    async def renew(self, job: ClaimedJob) -> bool:
+        return bool(await self._renew(
+            keys=[self._key("leases")],
+            args=[*self._held(job), time.time() + settings.job_lease_seconds]
+        ))
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue, creating it from settings on first use."""
+    global _queue
+    if _queue is None:
+        if settings.job_queue_backend == "sqlite":
+            _queue = SQLiteJobQueue(settings.job_queue_sqlite_path)
+        elif settings.job_queue_backend == "redis":
+            _queue = RedisJobQueue(settings.job_queue_redis_url)
+        else:
+            _queue = MemoryJobQueue()
+    return _queue
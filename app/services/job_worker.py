@@ -0,0 +1,96 @@
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.prompts import prompts
+from app.services.image_analysis import analyze_clothing
+from app.services.job_queue import ClaimedJob, JobQueue
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Failures worth another attempt: overload, timeouts and backend errors
+_RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+def _retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, so jobs rejected together don't come back together."""
+    delay = min(settings.job_retry_backoff_max_seconds, settings.job_retry_backoff_seconds * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+async def _run_job(queue: JobQueue, job: ClaimedJob) -> None:
+    status = job.status
+    try:
+        result = await analyze_clothing(job.image, status.filename, use_cache=job.use_cache, priority=status.priority)
+        status.status = "done"
+        status.result = result
+        status.prompt_version = prompts.version
+    except asyncio.CancelledError:
+        # Shutting down: hand the job to another worker right away instead of after the lease
+        await asyncio.shield(queue.release(job))
+        raise
+    except Exception as e:
+        status_code = e.status_code if isinstance(e, HTTPException) else 500
+        detail = str(e.detail) if isinstance(e, HTTPException) else str(e)
+        if status_code in _RETRYABLE_STATUS_CODES and status.attempts < settings.job_max_attempts:
+            delay = _retry_delay(status.attempts)
+            logger.warning(f"Job {status.job_id} failed with {status_code} ({detail}); "
+                           f"retrying it in {delay:.1f} seconds")
+            if not await queue.release(job, delay):
+                logger.warning(f"Job {status.job_id} was handed to another worker before it could be retried")
+            return
+        status.status = "failed"
+        status.error = detail
+        status.status_code = status_code
+    status.finished_at = time.time()
+    if not await queue.finish(job):
+        logger.warning(f"Job {status.job_id} was handed to another worker; dropping its {status.status} outcome")
+
+async def _renew_lease(queue: JobQueue, job: ClaimedJob) -> None:
+    """Keep extending the job's lease while it runs, so slow jobs are not handed out twice."""
+    while True:
+        await asyncio.sleep(settings.job_lease_seconds / 3)
+        try:
+            if not await queue.renew(job):
+                logger.warning(f"Lost the lease of job {job.status.job_id}; another worker may be running it")
+                return
+        except Exception as e:
+            logger.warning(f"Could not renew the lease of job {job.status.job_id}: {str(e)}")
+
+async def run_worker(queue: JobQueue, concurrency: int, name: str, stop: asyncio.Event) -> None:
+    """
+    Claim and run jobs until `stop` is set.
+
+    Jobs that fail with a retryable error (429 or 5xx) go back to the queue
+    until they reach `settings.job_max_attempts`, and are not picked up
+    again before an exponential backoff of `settings.job_retry_backoff_seconds`
+    (doubling per attempt) has passed. The lease of a running job is renewed
+    every third of `settings.job_lease_seconds`. When `stop` is set, jobs
+    already running are finished first.
+
+    Args:
+        queue (JobQueue): Queue to take jobs from
+        concurrency (int): Number of jobs run at once
+        name (str): Worker name recorded on claimed jobs
+        stop (asyncio.Event): Set to stop claiming jobs
+    """
+    async def slot(index: int) -> None:
+        while not stop.is_set():
+            try:
+                job = await queue.claim(f"{name}/{index}", timeout=1.0)
+            except Exception as e:
+                logger.warning(f"Worker {name} could not claim a job: {str(e)}")
+                await asyncio.sleep(settings.job_poll_interval_seconds)
+                continue
+            if job is None:
+                continue
+            start = time.perf_counter()
+            renewal = asyncio.create_task(_renew_lease(queue, job))
+            try:
+                await _run_job(queue, job)
+            finally:
+                renewal.cancel()
+            logger.info(f"Worker {name} ran job {job.status.job_id} ({job.status.filename}) "
+                        f"in {time.perf_counter() - start:.2f} seconds")
+
+    await asyncio.gather(*(slot(index) for index in range(concurrency)))
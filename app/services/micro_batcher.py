@@ -0,0 +1,142 @@
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.prompts import prompts
+from app.core.metrics import MICRO_BATCH_SIZE
+from app.services.ollama_client import chat, get_pool
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (image, chat arguments of the individual call, caller's future)
+_Call = Tuple[str, dict, asyncio.Future]
+
+class MicroBatcher:
+    """
+    Groups concurrent model calls of the same pass into batches.
+
+    The first call of a pass opens a batch; calls arriving within `window`
+    seconds join it, and it is sent once the window ends or `max_size` calls
+    have joined. With the "parallel" strategy a batch is sent as simultaneous
+    calls to one Ollama server, which decodes them together in its parallel
+    slots. With "multi_image", passes that support it get one call carrying
+    every image of the batch and answering with one result per image; if the
+    model rejects that or answers with the wrong number of results, the batch
+    falls back to "parallel". Each caller gets back the model output for its
+    own image.
+    """
+
+    def __init__(self, window: float, max_size: int, strategy: str):
+        self.window = window
+        self.max_size = max_size
+        self.strategy = strategy
+        self._pending: Dict[str, List[_Call]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+        self._counters = {"calls": 0, "batches": 0, "multi_image_batches": 0, "multi_image_fallbacks": 0}
+
+    async def submit(self, name: str, image_b64: str, chat_arguments: dict) -> str:
+        """
+        Queue one model call of a pass and wait for its output.
+
+        Args:
+            name (str): Name of the registered pass
+            image_b64 (str): Base64-encoded image the call is about
+            chat_arguments (dict): Arguments of the equivalent unbatched `chat` call
+
+        Returns:
+            str: The model output for this image
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(name, [])
+        batch.append((image_b64, chat_arguments, future))
+        self._counters["calls"] += 1
+        if len(batch) >= self.max_size:
+            self._flush(name)
+        elif len(batch) == 1:
+            self._timers[name] = loop.call_later(self.window, self._flush, name)
+        return await future
+
+    def _flush(self, name: str) -> None:
+        timer = self._timers.pop(name, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(name, [])
+        # Callers that gave up (e.g. a cancelled speculative pass) are dropped
+        batch = [call for call in batch if not call[2].done()]
+        if not batch:
+            return
+        self._counters["batches"] += 1
+        task = asyncio.create_task(self._send(name, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, name: str, batch: List[_Call]) -> None:
+        try:
+            if self.strategy == "multi_image" and len(batch) > 1 and prompts.get(name).batch_request:
+                contents = await self._send_multi_image(name, batch)
+                if contents is not None:
+                    MICRO_BATCH_SIZE.labels(name, "multi_image").observe(len(batch))
+                    for (_, _, future), content in zip(batch, contents):
+                        if not future.done():
+                            future.set_result(content)
+                    return
+            MICRO_BATCH_SIZE.labels(name, "parallel").observe(len(batch))
+            results = await get_pool().chat_group([arguments for _, arguments, _ in batch])
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result.message.content)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        except asyncio.CancelledError:
+            for _, _, future in batch:
+                future.cancel()
+            raise
+
+    async def _send_multi_image(self, name: str, batch: List[_Call]) -> Optional[List[str]]:
+        """Ask about every image in one call; None if the answer can't be split up by image."""
+        arguments = dict(batch[0][1])
+        images = [image for image, _, _ in batch]
+        arguments['messages'] = prompts.batch_messages(name, images)
+        arguments['format'] = prompts.batch_schema(name, len(images))
+        try:
+            response = await chat(**arguments)
+            results = json.loads(response.message.content)['results']
+            if not isinstance(results, list) or len(results) != len(images):
+                raise ValueError(f"expected {len(images)} results")
+        except Exception as e:
+            self._counters["multi_image_fallbacks"] += 1
+            logger.warning(f"Multi-image {name} call for {len(images)} images failed ({type(e).__name__}: {e}); "
+                           f"sending the images separately")
+            return None
+        self._counters["multi_image_batches"] += 1
+        return [json.dumps(result) for result in results]
+
+    def stats(self) -> dict:
+        """Return call and batch counts and the resulting average batch size."""
+        return {
+            **self._counters,
+            "avg_batch_size": self._counters["calls"] / self._counters["batches"] if self._counters["batches"] else 0.0,
+            "pending": sum(len(batch) for batch in self._pending.values()),
+        }
+
+_batcher: Optional[MicroBatcher] = None
+
+def get_micro_batcher() -> MicroBatcher:
+    """Return the process-wide micro-batcher, creating it from settings on first use."""
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            window=settings.micro_batch_window_ms / 1000,
+            max_size=settings.micro_batch_max_size,
+            strategy=settings.micro_batch_strategy,
+        )
+    return _batcher
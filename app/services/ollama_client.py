@@ -0,0 +1,392 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+import httpx
+from ollama import AsyncClient, ResponseError
+from fastapi import HTTPException
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _is_retryable(error: BaseException) -> bool:
+    """Whether a failed call says something about the backend rather than the request."""
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500 or error.status_code == -1
+    return isinstance(error, (ConnectionError, httpx.TransportError, asyncio.TimeoutError))
+
+def _is_timeout(error: BaseException) -> bool:
+    return isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException))
+
+def _model_tag(name: str) -> str:
+    """Normalise a model name the way Ollama does, e.g. "llava" -> "llava:latest"."""
+    return name if ":" in name else f"{name}:latest"
+
+class OllamaBackend:
+    """One Ollama server with its keep-alive client, load and circuit breaker state"""
+
+    def __init__(self, host: Optional[str]):
+        self.host = host
+        self.client = AsyncClient(
+            host=host,
+            timeout=settings.ollama_request_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.ollama_max_concurrency * 2,
+                max_keepalive_connections=settings.ollama_max_concurrency,
+                keepalive_expiry=settings.ollama_keepalive_expiry_seconds,
+            ),
+        )
+        self.outstanding = 0  # Calls routed here, waiting for or holding a slot
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        # unknown, loading, loaded, unloaded (evicted by Ollama), missing or failed
+        self.model_state = "unknown"
+
+    def semaphore(self) -> asyncio.Semaphore:
+        """Slots limiting this server to `settings.ollama_max_concurrency` calls at once."""
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.ollama_max_concurrency)
+        return self._semaphore
+
+    @property
+    def circuit_open(self) -> bool:
+        return self.open_until > time.monotonic()
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.circuit_open and self.model_state != "missing"
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= settings.ollama_circuit_failure_threshold:
+            # Half-open again once the cooldown expires: the next call is a trial
+            self.open_until = time.monotonic() + settings.ollama_circuit_cooldown_seconds
+
+    def stats(self) -> dict:
+        return {
+            "host": self.host or "default",
+            "healthy": self.healthy,
+            "circuit_open": self.circuit_open,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "model_state": self.model_state,
+        }
+
+class OllamaPool:
+    """
+    Least-outstanding-requests load balancer over one or more Ollama servers.
+
+    A backend is skipped while its last health check failed, while its
+    circuit breaker is open after repeated failures, or if warm-up found it
+    does not have the model. A call that fails because
+    of the backend (connection error, timeout, 5xx) is retried on a different
+    backend; model passes are read-only, so retrying them is safe.
+    """
+
+    def __init__(self, hosts: List[Optional[str]]):
+        self.backends = [OllamaBackend(host) for host in hosts]
+        self._health_task: Optional[asyncio.Task] = None
+        self._warm_up_arguments: Optional[dict] = None
+        self._warm_up_tasks: Dict[OllamaBackend, asyncio.Task] = {}
+
+    @asynccontextmanager
+    async def _slot(self, backend: OllamaBackend, calls: int = 1):
+        """Route calls to a backend and hold one of its concurrency slots while they run."""
+        backend.outstanding += calls
+        backend.requests += calls
+        try:
+            async with backend.semaphore():
+                yield
+        finally:
+            backend.outstanding -= calls
+
+    def _pick(self, tried: List[OllamaBackend]) -> Optional[OllamaBackend]:
+        candidates = [backend for backend in self.backends if backend not in tried]
+        available = [backend for backend in candidates if backend.available]
+        if not available:
+            # Everything looks down; rather than failing outright, try the backend
+            # whose problems are most likely to have cleared
+            available = sorted(candidates, key=lambda backend: (backend.open_until, not backend.healthy))[:1]
+        return min(available, key=lambda backend: backend.outstanding, default=None)
+
+    def _should_retry(self, backend: OllamaBackend, error: Exception, tried: List[OllamaBackend]) -> bool:
+        """Record a failed attempt and decide whether to retry it on another backend."""
+        if not _is_retryable(error):
+            return False
+        backend.record_failure()
+        retries_left = len(tried) <= settings.ollama_max_retries and len(tried) < len(self.backends)
+        logger.warning(f"Ollama backend {backend.host or 'default'} failed ({type(error).__name__}: {error})"
+                       f"{', retrying on another backend' if retries_left else ''}")
+        return retries_left
+
+    def _timeout_error(self) -> HTTPException:
+        return HTTPException(
+            status_code=504,
+            detail=f"Ollama model call timed out after {settings.ollama_request_timeout:.0f} seconds"
+        )
+
+    async def chat(self, **kwargs):
+        """
+        Call Ollama's chat endpoint on the least loaded available backend.
+
+        At most `settings.ollama_max_concurrency` calls per backend run at
+        once; additional callers wait for a slot on the backend they were
+        routed to, so a backend whose circuit opens does not push the others
+        past their limit. Each attempt is bounded by
+        `settings.ollama_request_timeout` and failed attempts are retried up to
+        `settings.ollama_max_retries` times on other backends.
+
+        Args:
+            **kwargs: Arguments forwarded to `AsyncClient.chat`
+
+        Returns:
+            ChatResponse: The Ollama chat response
+
+        Raises:
+            HTTPException: 504 if the last attempt timed out
+            Exception: The last backend error if every attempt failed
+        """
+        tried = []
+        while True:
+            backend = self._pick(tried)
+            tried.append(backend)
+            try:
+                async with self._slot(backend):
+                    response = await asyncio.wait_for(
+                        backend.client.chat(**kwargs),
+                        timeout=settings.ollama_request_timeout
+                    )
+                backend.record_success()
+                return response
+            except Exception as e:
+                if self._should_retry(backend, e, tried):
+                    continue
+                if _is_timeout(e):
+                    raise self._timeout_error()
+                raise
+
+    async def chat_group(self, calls: List[dict]) -> List:
+        """
+        Send several chat calls to the same backend at once.
+
+        Arriving together, the calls land in the server's parallel slots
+        (OLLAMA_NUM_PARALLEL) and are decoded in the same batches. The group
+        takes a single concurrency slot of that backend. Calls that fail
+        because of the backend are retried one by one through `chat`; a call
+        that still times out is reported as a 504, like in `chat`.
+
+        Args:
+            calls (List[dict]): Keyword arguments for each `AsyncClient.chat` call
+
+        Returns:
+            List: The ChatResponse or exception of each call, in order
+        """
+        backend = self._pick([])
+        async with self._slot(backend, len(calls)):
+            results = await asyncio.gather(
+                *(asyncio.wait_for(backend.client.chat(**kwargs), timeout=settings.ollama_request_timeout)
+                  for kwargs in calls),
+                return_exceptions=True
+            )
+
+        retry = [index for index, result in enumerate(results)
+                 if isinstance(result, Exception) and _is_retryable(result)]
+        if not retry:
+            backend.record_success()
+            return results
+        backend.record_failure()
+        logger.warning(f"Ollama backend {backend.host or 'default'} failed {len(retry)} of {len(calls)} "
+                       f"grouped calls, retrying them individually")
+        retried = await asyncio.gather(*(self.chat(**calls[index]) for index in retry), return_exceptions=True)
+        for index, result in zip(retry, retried):
+            results[index] = result
+        return [self._timeout_error() if _is_timeout(result) else result for result in results]
+
+    async def chat_stream(self, **kwargs) -> AsyncIterator:
+        """
+        Stream a chat response from the least loaded available backend.
+
+        Behaves like `chat`, except that `settings.ollama_request_timeout`
+        bounds the wait for each chunk, and a failed attempt is only retried
+        on another backend if nothing has been yielded yet.
+
+        Args:
+            **kwargs: Arguments forwarded to `AsyncClient.chat`
+
+        Yields:
+            ChatResponse: Partial responses as Ollama produces them
+
+        Raises:
+            HTTPException: 504 if Ollama stopped producing output
+            Exception: The last backend error if every attempt failed
+        """
+        tried = []
+        while True:
+            backend = self._pick(tried)
+            tried.append(backend)
+            started = False
+            try:
+                async with self._slot(backend):
+                    stream = await asyncio.wait_for(
+                        backend.client.chat(stream=True, **kwargs),
+                        timeout=settings.ollama_request_timeout
+                    )
+                    while True:
+                        try:
+                            part = await asyncio.wait_for(stream.__anext__(), timeout=settings.ollama_request_timeout)
+                        except StopAsyncIteration:
+                            break
+                        started = True
+                        yield part
+                backend.record_success()
+                return
+            except Exception as e:
+                if not started and self._should_retry(backend, e, tried):
+                    continue
+                if _is_timeout(e):
+                    raise self._timeout_error()
+                raise
+
+    async def _warm_up_backend(self, backend: OllamaBackend) -> None:
+        name = backend.host or 'default'
+        model = self._warm_up_arguments['model']
+        backend.model_state = "loading"
+        try:
+            await asyncio.wait_for(backend.client.show(model), timeout=settings.ollama_health_check_timeout)
+        except ResponseError as e:
+            if e.status_code == 404:
+                backend.model_state = "missing"
+                logger.error(f"Model {model} is not available on Ollama backend {name}; run `ollama pull {model}` there")
+                return
+            backend.model_state = "failed"
+            logger.warning(f"Could not check model {model} on Ollama backend {name}: {str(e)}")
+            return
+        except Exception as e:
+            backend.model_state = "failed"
+            logger.warning(f"Could not check model {model} on Ollama backend {name}: {str(e)}")
+            return
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                backend.client.chat(**self._warm_up_arguments),
+                timeout=settings.model_warm_up_timeout
+            )
+        except Exception as e:
+            backend.model_state = "failed"
+            logger.warning(f"Warm-up of {model} on Ollama backend {name} failed: {type(e).__name__}: {e}")
+            return
+        backend.model_state = "loaded"
+        logger.info(f"Model {model} warmed up on Ollama backend {name} in {time.perf_counter() - start:.1f} seconds")
+
+    def _schedule_warm_up(self, backend: OllamaBackend) -> None:
+        task = self._warm_up_tasks.get(backend)
+        if task is None or task.done():
+            self._warm_up_tasks[backend] = asyncio.create_task(self._warm_up_backend(backend))
+
+    def start_warm_up(self, **kwargs) -> None:
+        """
+        Load the model on every backend in the background.
+
+        Each backend is first asked whether the model exists, then sent a small
+        inference so the weights are resident before the first real request.
+        Health checks re-run the warm-up on backends where Ollama has since
+        unloaded the model.
+
+        Args:
+            **kwargs: Arguments forwarded to `AsyncClient.chat` for the warm-up inference
+        """
+        self._warm_up_arguments = kwargs
+        for backend in self.backends:
+            self._schedule_warm_up(backend)
+
+    def _update_model_state(self, backend: OllamaBackend, running) -> None:
+        """Track whether the warmed-up model is still loaded, given an `/api/ps` response."""
+        if self._warm_up_arguments is None or backend.model_state not in ("loaded", "unloaded", "failed"):
+            return
+        model = _model_tag(self._warm_up_arguments['model'])
+        if any(_model_tag(process.model or process.name or "") == model for process in running.models):
+            backend.model_state = "loaded"
+            return
+        if backend.model_state == "loaded":
+            backend.model_state = "unloaded"
+            logger.info(f"Ollama backend {backend.host or 'default'} unloaded {model}; warming it up again")
+        self._schedule_warm_up(backend)
+
+    def ready(self) -> bool:
+        """Whether some backend can serve requests, with the model loaded if warm-up is enabled."""
+        return any(
+            backend.available and (self._warm_up_arguments is None or backend.model_state == "loaded")
+            for backend in self.backends
+        )
+
+    async def check_health(self) -> None:
+        """Probe every backend once and update its health flag and model state."""
+        async def probe(backend: OllamaBackend) -> None:
+            try:
+                running = await asyncio.wait_for(backend.client.ps(), timeout=settings.ollama_health_check_timeout)
+                if not backend.healthy:
+                    logger.info(f"Ollama backend {backend.host or 'default'} is healthy again")
+                backend.healthy = True
+            except Exception as e:
+                if backend.healthy:
+                    logger.warning(f"Ollama backend {backend.host or 'default'} failed health check: {str(e)}")
+                backend.healthy = False
+                return
+            self._update_model_state(backend, running)
+
+        await asyncio.gather(*(probe(backend) for backend in self.backends))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await self.check_health()
+            await asyncio.sleep(settings.ollama_health_check_interval)
+
+    def start_health_checks(self) -> None:
+        """Start periodic health checks, if enabled, on the running event loop."""
+        if settings.ollama_health_check_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        """Stop health checks and warm-ups and close every backend's connections."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for task in self._warm_up_tasks.values():
+            task.cancel()
+        self._warm_up_tasks.clear()
+        for backend in self.backends:
+            await backend.client.close()
+
+    def stats(self) -> List[dict]:
+        return [backend.stats() for backend in self.backends]
+
+_pool: Optional[OllamaPool] = None
+
+def get_pool() -> OllamaPool:
+    """Return the process-wide Ollama pool, creating it from settings on first use."""
+    global _pool
+    if _pool is None:
+        _pool = OllamaPool(settings.ollama_hosts or [settings.ollama_host])
+    return _pool
+
+async def chat(**kwargs):
+    """Call Ollama's chat endpoint through the shared backend pool without blocking the event loop."""
+    return await get_pool().chat(**kwargs)
+
+def chat_stream(**kwargs) -> AsyncIterator:
+    """Stream a chat response through the shared backend pool."""
+    return get_pool().chat_stream(**kwargs)
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.schemas.image_analysis import ClothingAnalysisResponse
+from app.core.config import settings
+from app.utils.image_processing import hash_distance
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+def make_cache_key(image: bytes, variant: str) -> str:
+    """
+    Build a content-addressed cache key.
+
+    Args:
+        image (bytes): The raw image data
+        variant (str): Everything besides the image that affects the result
+            (model name, temperature, prompt version)
+
+    Returns:
+        str: Hex digest identifying the image/variant pair
+    """
+    digest = hashlib.sha256(image).hexdigest()
+    return hashlib.sha256(f"{variant}|{digest}".encode()).hexdigest()
+
+class ResultCache:
+    """
+    Two-tier cache for clothing analysis results.
+
+    The memory tier is an LRU bounded by entry count with a per-entry TTL.
+    The optional disk tier is a SQLite file that survives restarts; entries
+    found there are promoted back into memory. Disk reads and writes run in
+    worker threads so they never block the event loop, and expired or excess
+    rows (beyond `disk_max_entries`, soonest to expire first) are deleted every
+    `disk_prune_interval` seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, disk_path: Optional[str] = None,
+                 phash_max_distance: int = 0, disk_max_entries: int = 100000,
+                 disk_prune_interval: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.phash_max_distance = phash_max_distance
+        self.disk_max_entries = disk_max_entries
+        self.disk_prune_interval = disk_prune_interval
+        # key -> (expires_at, variant, phash, payload)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Serialises use of the SQLite connection across worker threads
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._last_prune = 0.0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "perceptual_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    def _get_db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_by_expiry ON results (expires_at)")
+            self._db.commit()
+        return self._db
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, dict]]:
+        with self._db_lock:
+            db = self._get_db()
+            row = db.execute("SELECT expires_at, payload FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] <= now:
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                db.commit()
+                return None
+            return row[0], json.loads(row[1])
+
+    def _disk_set(self, key: str, expires_at: float, payload: dict) -> None:
+        with self._db_lock:
+            db = self._get_db()
+            db.execute(
+                "INSERT OR REPLACE INTO results (key, expires_at, payload) VALUES (?, ?, ?)",
+                (key, expires_at, json.dumps(payload))
+            )
+            now = time.time()
+            if now - self._last_prune >= self.disk_prune_interval:
+                self._last_prune = now
+                db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+                excess = db.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.disk_max_entries
+                if excess > 0:
+                    db.execute(
+                        "DELETE FROM results WHERE key IN "
+                        "(SELECT key FROM results ORDER BY expires_at LIMIT ?)", (excess,)
+                    )
+            db.commit()
+
+    def _remember(self, key: str, expires_at: float, variant: str, phash: Optional[int], payload: dict) -> None:
+        self._entries[key] = (expires_at, variant, phash, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    async def get(self, key: str, variant: str, phash: Optional[int] = None) -> Optional[ClothingAnalysisResponse]:
+        """
+        Look up a cached result.
+
+        Exact matches are tried first in memory, then on disk. If a perceptual
+        hash is given, the most recent memory entries with the same variant are
+        scanned for one within `phash_max_distance` bits.
+
+        Returns:
+            Optional[ClothingAnalysisResponse]: The cached result, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return ClothingAnalysisResponse.model_validate(entry[3])
+                del self._entries[key]
+
+        if self.disk_path:
+            row = await asyncio.to_thread(self._disk_get, key, now)
+            if row is not None:
+                expires_at, payload = row
+                with self._lock:
+                    self._remember(key, expires_at, variant, phash, payload)
+                    self._counters["disk_hits"] += 1
+                return ClothingAnalysisResponse.model_validate(payload)
+
+        with self._lock:
+            if phash is not None:
+                for other_key in reversed(self._entries):
+                    expires_at, other_variant, other_phash, payload = self._entries[other_key]
+                    if (expires_at > now and other_variant == variant and other_phash is not None
+                            and hash_distance(phash, other_phash) <= self.phash_max_distance):
+                        self._entries.move_to_end(other_key)
+                        self._counters["perceptual_hits"] += 1
+                        return ClothingAnalysisResponse.model_validate(payload)
+
+            self._counters["misses"] += 1
+            return None
+
+    async def set(self, key: str, variant: str, result: ClothingAnalysisResponse, phash: Optional[int] = None) -> None:
+        """Store a result in memory and, if configured, on disk."""
+        expires_at = time.time() + self.ttl_seconds
+        payload = result.model_dump()
+        with self._lock:
+            self._remember(key, expires_at, variant, phash, payload)
+        if self.disk_path:
+            await asyncio.to_thread(self._disk_set, key, expires_at, payload)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current memory tier size."""
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"] + self._counters["perceptual_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "hits": hits,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_enabled": bool(self.disk_path),
+                "perceptual_hash_enabled": settings.cache_perceptual_hash,
+            }
+
+result_cache = ResultCache(
+    max_entries=settings.cache_max_entries,
+    ttl_seconds=settings.cache_ttl_seconds,
+    disk_path=settings.cache_disk_path,
+    phash_max_distance=settings.cache_phash_max_distance,
+    disk_max_entries=settings.cache_disk_max_entries,
+    disk_prune_interval=settings.cache_disk_prune_interval_seconds,
+)
@@ -0,0 +1,387 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, get_args
+from app.core.config import settings
+from app.schemas.clothing import FullBodyClothingInfo
+from app.schemas.image_analysis import ClothingAnalysisResponse
+from app.schemas.results import ReplayedAnalysis, StoredAnalysis
+import json
+import sqlite3
+import threading
+import time
+
+# Rebuilds a response from raw pass outputs and the analysis events
+PostProcess = Callable[[Dict[str, str], List[str]], ClothingAnalysisResponse]
+
+class _Column(NamedTuple):
+    name: str
+    item: str
+    attribute: str
+    boolean: bool
+
+# Model of each clothing item, e.g. "eyewear" -> EyewearItem
+_CLOTHING_ITEMS = {
+    item: next(arg for arg in get_args(item_field.annotation) if arg is not type(None))
+    for item, item_field in FullBodyClothingInfo.model_fields.items()
+}
+# One column per attribute of each clothing item, e.g. upper_body_type or eyewear_wearing
+_CLOTHING_COLUMNS = [
+    _Column(f"{item}_{attribute}", item, attribute, attribute_field.annotation is bool)
+    for item, item_model in _CLOTHING_ITEMS.items()
+    for attribute, attribute_field in item_model.model_fields.items()
+]
+_TEXT_FIELDS = ("general_description", "thermal_properties", "weather_appropriateness")
+
+@dataclass
+class ResultQuery:
+    """Filters selecting stored analyses; unset fields match everything"""
+    image_sha256: Optional[str] = None
+    since: Optional[float] = None
+    until: Optional[float] = None
+    model_name: Optional[str] = None
+    prompt_version: Optional[str] = None
+
+    def where(self) -> Tuple[str, list]:
+        clauses, parameters = [], []
+        if self.image_sha256 is not None:
+            clauses.append("image_sha256 = ?")
+            parameters.append(bytes.fromhex(self.image_sha256))
+        if self.since is not None:
+            clauses.append("created_at >= ?")
+            parameters.append(self.since)
+        if self.until is not None:
+            clauses.append("created_at < ?")
+            parameters.append(self.until)
+        if self.model_name is not None:
+            clauses.append("model_name = ?")
+            parameters.append(self.model_name)
+        if self.prompt_version is not None:
+            clauses.append("prompt_version = ?")
+            parameters.append(self.prompt_version)
+        return " AND ".join(clauses) or "1", parameters
+
+def _changed_fields(stored: dict, replayed: dict, prefix: str = "") -> List[str]:
+    changed = []
+    for key in sorted(set(stored) | set(replayed)):
+        a, b = stored.get(key), replayed.get(key)
+        if isinstance(a, dict) and isinstance(b, dict):
+            changed.extend(_changed_fields(a, b, f"{prefix}{key}."))
+        elif a != b:
+            changed.append(f"{prefix}{key}")
+    return changed
+
+class ResultStore:
+    """
+    Append-only SQLite store of finished analyses.
+
+    Each record keeps the result, the raw output of every merged pass, stage
+    timings, model name and prompt version. Clothing attributes are stored as
+    small integer codes, one column each, with the code-to-value table in the
+    same file so it stays readable after the schema's values change. Records
+    are indexed by image hash and time, and can be aggregated or replayed
+    through new post-processing without calling the model.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._codes: Dict[str, Dict[Optional[str], int]] = {}
+        self._values: Dict[str, Dict[int, Optional[str]]] = {}
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            "id INTEGER PRIMARY KEY, created_at REAL NOT NULL, image_sha256 BLOB NOT NULL, filename TEXT, "
+            "model_name TEXT NOT NULL, prompt_version TEXT NOT NULL, analysis_mode TEXT NOT NULL, "
+            "total_seconds REAL, timings TEXT NOT NULL, events TEXT NOT NULL, clothing_items INTEGER NOT NULL, "
+            "general_description TEXT, thermal_properties TEXT, weather_appropriateness TEXT)"
+        )
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(analyses)")}
+        for column in _CLOTHING_COLUMNS:
+            # Attributes added to the schema later become new nullable columns
+            if column.name not in existing:
+                self._db.execute(f"ALTER TABLE analyses ADD COLUMN {column.name} INTEGER")
+        self._db.execute("CREATE INDEX IF NOT EXISTS analyses_by_image ON analyses (image_sha256, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS analyses_by_time ON analyses (created_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pass_outputs ("
+            "analysis_id INTEGER NOT NULL, pass TEXT NOT NULL, output TEXT NOT NULL, "
+            "PRIMARY KEY (analysis_id, pass)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS enum_values ("
+            "field TEXT NOT NULL, code INTEGER NOT NULL, value TEXT, "
+            "PRIMARY KEY (field, code), UNIQUE (field, value))"
+        )
+        self._load_codes()
+
+    def _load_codes(self) -> None:
+        self._codes = {column.name: {} for column in _CLOTHING_COLUMNS if not column.boolean}
+        self._values = {name: {} for name in self._codes}
+        for field, code, value in self._db.execute("SELECT field, code, value FROM enum_values"):
+            self._codes.setdefault(field, {})[value] = code
+            self._values.setdefault(field, {})[code] = value
+
+    def _code(self, field: str, value: Optional[str]) -> int:
+        # Runs inside the write transaction, so processes sharing the file agree on new codes
+        code = self._codes[field].get(value)
+        if code is None:
+            lookup = ("SELECT code FROM enum_values WHERE field = ? AND value IS ?", (field, value))
+            row = self._db.execute(*lookup).fetchone()
+            if row is None:
+                self._db.execute(
+                    "INSERT INTO enum_values (field, code, value) "
+                    "SELECT ?, COALESCE(MAX(code) + 1, 0), ? FROM enum_values WHERE field = ?",
+                    (field, value, field)
+                )
+                row = self._db.execute(*lookup).fetchone()
+            code = row[0]
+            self._codes[field][value] = code
+            self._values[field][code] = value
+        return code
+
+    def _value(self, field: str, code: int) -> Optional[str]:
+        if code not in self._values.get(field, {}):
+            # Added by another process since the codes were loaded
+            self._load_codes()
+        return self._values[field][code]
+
+    def record(
+        self,
+        image_sha256: str,
+        filename: Optional[str],
+        result: ClothingAnalysisResponse,
+        outputs: Dict[str, str],
+        timings: Dict[str, float],
+        events: List[str],
+        model_name: str,
+        prompt_version: str,
+        analysis_mode: str
+    ) -> int:
+        """
+        Append one analysis. Blocking; run it in a thread.
+
+        Args:
+            image_sha256 (str): Hex SHA-256 of the uploaded image
+            filename (Optional[str]): Name of the image
+            result (ClothingAnalysisResponse): The result returned to the client
+            outputs (Dict[str, str]): Raw model output of each merged pass
+            timings (Dict[str, float]): Seconds spent in each stage
+            events (List[str]): Notable events of the analysis
+            model_name (str): Model that produced the result
+            prompt_version (str): Version of the prompts that produced the result
+            analysis_mode (str): multi_pass or single_pass
+
+        Returns:
+            int: Identifier of the new record
+        """
+        clothing_info = result.clothing_info.model_dump()
+        items = sum(1 << index for index, item in enumerate(_CLOTHING_ITEMS) if clothing_info[item] is not None)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                values = []
+                for column in _CLOTHING_COLUMNS:
+                    value = (clothing_info[column.item] or {}).get(column.attribute)
+                    if column.boolean or clothing_info[column.item] is None:
+                        values.append(value)
+                    else:
+                        values.append(self._code(column.name, value))
+                columns = ["created_at", "image_sha256", "filename", "model_name", "prompt_version", "analysis_mode",
+                           "total_seconds", "timings", "events", "clothing_items", *_TEXT_FIELDS,
+                           *(column.name for column in _CLOTHING_COLUMNS)]
+                cursor = self._db.execute(
+                    f"INSERT INTO analyses ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    (time.time(), bytes.fromhex(image_sha256), filename, model_name, prompt_version, analysis_mode,
+                     timings.get("total"), json.dumps(timings), json.dumps(events), items,
+                     *(getattr(result, field) for field in _TEXT_FIELDS), *values)
+                )
+                analysis_id = cursor.lastrowid
+                self._db.executemany(
+                    "INSERT INTO pass_outputs (analysis_id, pass, output) VALUES (?, ?, ?)",
+                    [(analysis_id, name, output) for name, output in outputs.items()]
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return analysis_id
+
+    def _analysis(self, row: sqlite3.Row, outputs: Optional[Dict[str, str]]) -> StoredAnalysis:
+        clothing_info = {
+            item: {} if row["clothing_items"] & (1 << index) else None for index, item in enumerate(_CLOTHING_ITEMS)
+        }
+        for column in _CLOTHING_COLUMNS:
+            if clothing_info[column.item] is None:
+                continue
+            value = row[column.name]
+            if column.boolean:
+                value = None if value is None else bool(value)
+            elif value is not None:
+                value = self._value(column.name, value)
+            clothing_info[column.item][column.attribute] = value
+        # Constructed rather than validated: stored values already passed validation, and
+        # schema defaults such as upper_body.type "unknown" are not among the allowed values
+        result = ClothingAnalysisResponse.model_construct(
+            clothing_info=FullBodyClothingInfo.model_construct(**{
+                item: None if attributes is None else _CLOTHING_ITEMS[item].model_construct(**attributes)
+                for item, attributes in clothing_info.items()
+            }),
+            **{field: row[field] for field in _TEXT_FIELDS}
+        )
+        return StoredAnalysis(
+            id=row["id"], created_at=row["created_at"], image_sha256=row["image_sha256"].hex(),
+            filename=row["filename"], model_name=row["model_name"], prompt_version=row["prompt_version"],
+            analysis_mode=row["analysis_mode"], timings=json.loads(row["timings"]), events=json.loads(row["events"]),
+            result=result, outputs=outputs
+        )
+
+    def _outputs(self, analysis_ids: List[int]) -> Dict[int, Dict[str, str]]:
+        outputs = {analysis_id: {} for analysis_id in analysis_ids}
+        for start in range(0, len(analysis_ids), 500):
+            chunk = analysis_ids[start:start + 500]
+            for analysis_id, name, output in self._db.execute(
+                f"SELECT analysis_id, pass, output FROM pass_outputs "
+                f"WHERE analysis_id IN ({', '.join('?' * len(chunk))})", chunk
+            ):
+                outputs[analysis_id][name] = output
+        return outputs
+
+    def find(
+        self,
+        query: ResultQuery,
+        limit: int = 100,
+        after_id: Optional[int] = None,
+        newest_first: bool = True,
+        include_outputs: bool = False
+    ) -> List[StoredAnalysis]:
+        """
+        Return stored analyses matching `query`. Blocking; run it in a thread.
+
+        Args:
+            query (ResultQuery): Filters to apply
+            limit (int): Maximum number of records
+            after_id (Optional[int]): Only records inserted after this one, for paging oldest-first
+            newest_first (bool): Order by insertion, newest or oldest first
+            include_outputs (bool): Whether to attach the raw pass outputs
+
+        Returns:
+            List[StoredAnalysis]: The matching records
+        """
+        where, parameters = query.where()
+        if after_id is not None:
+            where += " AND id > ?"
+            parameters.append(after_id)
+        with self._lock:
+            cursor = self._db.execute(
+                f"SELECT * FROM analyses WHERE {where} ORDER BY id {'DESC' if newest_first else 'ASC'} LIMIT ?",
+                (*parameters, limit)
+            )
+            cursor.row_factory = sqlite3.Row
+            rows = cursor.fetchall()
+            outputs = self._outputs([row["id"] for row in rows]) if include_outputs else {}
+            return [self._analysis(row, outputs.get(row["id"])) for row in rows]
+
+    def aggregate(self, query: ResultQuery) -> dict:
+        """
+        Summarise the stored analyses matching `query`. Blocking; run it in a thread.
+
+        Returns:
+            dict: Record and distinct image counts, counts per model and prompt
+                version, average and maximum seconds per stage, the number of
+                analyses reporting each clothing item as null (not visible)
+                and the distribution of every clothing attribute
+        """
+        where, parameters = query.where()
+        with self._lock:
+            analyses, images, first, last = self._db.execute(
+                f"SELECT COUNT(*), COUNT(DISTINCT image_sha256), MIN(created_at), MAX(created_at) "
+                f"FROM analyses WHERE {where}", parameters
+            ).fetchone()
+            versions = [
+                {"model_name": model_name, "prompt_version": prompt_version, "analyses": count}
+                for model_name, prompt_version, count in self._db.execute(
+                    f"SELECT model_name, prompt_version, COUNT(*) FROM analyses WHERE {where} "
+                    f"GROUP BY model_name, prompt_version ORDER BY MIN(id)", parameters
+                )
+            ]
+            timings = {
+                stage: {"count": count, "avg": avg, "max": maximum}
+                for stage, count, avg, maximum in self._db.execute(
+                    f"SELECT stage.key, COUNT(*), AVG(stage.value), MAX(stage.value) "
+                    f"FROM analyses, json_each(analyses.timings) AS stage WHERE {where} GROUP BY stage.key",
+                    parameters
+                )
+            }
+            row = self._db.execute(
+                f"SELECT {', '.join(f'SUM((clothing_items & {1 << index}) = 0)' for index in range(len(_CLOTHING_ITEMS)))} "
+                f"FROM analyses WHERE {where}", parameters
+            ).fetchone()
+            not_visible = {item: count or 0 for item, count in zip(_CLOTHING_ITEMS, row)}
+            fields = {}
+            for column in _CLOTHING_COLUMNS:
+                counts = {}
+                for code, count in self._db.execute(
+                    f"SELECT {column.name}, COUNT(*) FROM analyses WHERE {where} AND {column.name} IS NOT NULL "
+                    f"GROUP BY {column.name} ORDER BY COUNT(*) DESC", parameters
+                ):
+                    value = bool(code) if column.boolean else self._value(column.name, code)
+                    counts[str(value).lower() if column.boolean else str(value)] = count
+                fields[f"{column.item}.{column.attribute}"] = counts
+        return {
+            "analyses": analyses,
+            "images": images,
+            "first_at": first,
+            "last_at": last,
+            "versions": versions,
+            "timings": timings,
+            "not_visible": not_visible,
+            "fields": fields,
+        }
+
+    def replay(self, query: ResultQuery, postprocess: PostProcess, limit: Optional[int] = None,
+               page_size: int = 200) -> Iterator[ReplayedAnalysis]:
+        """
+        Run stored raw pass outputs through `postprocess`, oldest first, and
+        compare each outcome with the stored result. Blocking; iterate it in a thread.
+
+        Args:
+            query (ResultQuery): Filters selecting the records to replay
+            postprocess (PostProcess): Rebuilds a response from raw outputs and events
+            limit (Optional[int]): Maximum number of records to replay
+            page_size (int): Records fetched per query
+
+        Yields:
+            ReplayedAnalysis: The replayed result and the fields that changed
+        """
+        after_id, replayed = None, 0
+        while limit is None or replayed < limit:
+            size = page_size if limit is None else min(page_size, limit - replayed)
+            page = self.find(query, limit=size, after_id=after_id, newest_first=False, include_outputs=True)
+            if not page:
+                return
+            for stored in page:
+                try:
+                    result = postprocess(stored.outputs, stored.events)
+                except Exception as e:
+                    yield ReplayedAnalysis(id=stored.id, image_sha256=stored.image_sha256, status="error", error=str(e))
+                else:
+                    yield ReplayedAnalysis(
+                        id=stored.id, image_sha256=stored.image_sha256, status="ok", result=result,
+                        changed=_changed_fields(stored.result.model_dump(), result.model_dump())
+                    )
+            after_id = page[-1].id
+            replayed += len(page)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+_store: Optional[ResultStore] = None
+
+def get_result_store() -> ResultStore:
+    """Return the process-wide result store, creating it from settings on first use."""
+    global _store
+    if _store is None:
+        _store = ResultStore(settings.result_store_path)
+    return _store
@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import time
+
+@dataclass
+class AnalysisTrace:
+    """Per-request record of how an analysis was carried out"""
+    timings: Dict[str, float] = field(default_factory=dict)
+    cache: Optional[str] = None
+    events: List[str] = field(default_factory=list)
+    outputs: Dict[str, str] = field(default_factory=dict)  # Raw model output of each merged pass
+    started: float = field(default_factory=time.perf_counter)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block and add its duration (in seconds) to `timings[name]`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def server_timing(self) -> str:
+        """Format the timings as a `Server-Timing` header value (durations in milliseconds)."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items())
@@ -0,0 +1,254 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from app.schemas.image_analysis import ClothingAnalysisResponse, FrameAnalysisResult
+from app.services.image_analysis import analyze_clothing
+from app.services.admission import Priority
+from app.core.config import settings
+from app.core.metrics import VIDEO_FRAMES
+from app.utils.image_processing import hash_distance, perceptual_hash
+import asyncio
+import glob
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.mkv', '.avi', '.webm', '.mpg', '.mpeg', '.ts')
+
+# (filename, timestamp in seconds, image bytes); filename and timestamp may be unknown
+Frame = Tuple[Optional[str], Optional[float], bytes]
+
+def is_video(filename: str, content_type: str = "") -> bool:
+    """Whether an upload looks like a video file."""
+    return content_type.startswith('video/') or (filename or "").lower().endswith(VIDEO_EXTENSIONS)
+
+def sample_frame_sequence(
+    frames: List[Tuple[str, bytes]],
+    source_fps: Optional[float],
+    sample_fps: float,
+    max_frames: int
+) -> List[Frame]:
+    """
+    Sample an ordered frame sequence at `sample_fps`.
+
+    Args:
+        frames (List[Tuple[str, bytes]]): (filename, image bytes) pairs in playback order
+        source_fps (Optional[float]): Frame rate the sequence was captured at; without
+            it every frame is kept and timestamps are unknown
+        sample_fps (float): Frames per second to keep
+        max_frames (int): Maximum number of frames to return
+
+    Returns:
+        List[Frame]: The sampled frames
+    """
+    if source_fps is None:
+        return [(name, None, data) for name, data in frames[:max_frames]]
+    step = max(source_fps / sample_fps, 1.0)
+    sampled = []
+    position = 0.0
+    while round(position) < len(frames) and len(sampled) < max_frames:
+        index = round(position)
+        name, data = frames[index]
+        sampled.append((name, index / source_fps, data))
+        position += step
+    return sampled
+
+def _sample_animation(image, sample_fps: float, max_frames: int) -> List[Frame]:
+    # Animated GIF/WebP/PNG: each sample takes the frame on screen at that time.
+    # Frame durations are in milliseconds in image.info.
+    frames = []
+    start = 0.0
+    sample_index = 0
+    for index in range(image.n_frames):
+        image.seek(index)
+        end = start + (image.info.get("duration") or 100) / 1000
+        encoded = None
+        while sample_index / sample_fps < end and len(frames) < max_frames:
+            if encoded is None:
+                output = io.BytesIO()
+                image.convert("RGB").save(output, format="JPEG", quality=95)
+                encoded = output.getvalue()
+            frames.append((None, sample_index / sample_fps, encoded))
+            sample_index += 1
+        if len(frames) >= max_frames:
+            break
+        start = end
+    return frames
+
+def _sample_with_ffmpeg(data: bytes, filename: str, sample_fps: float, max_frames: int) -> List[Frame]:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise HTTPException(
+            status_code=501,
+            detail="Video decoding requires ffmpeg on the server; upload the frames as images instead"
+        )
+    with tempfile.TemporaryDirectory() as directory:
+        # ffmpeg needs a seekable input for most containers (e.g. MP4 with a trailing index)
+        source = os.path.join(directory, "input")
+        with open(source, 'wb') as source_file:
+            source_file.write(data)
+        try:
+            subprocess.run(
+                [ffmpeg, "-nostdin", "-loglevel", "error", "-i", source,
+                 "-vf", f"fps={sample_fps}", "-frames:v", str(max_frames), "-q:v", "2",
+                 os.path.join(directory, "frame_%06d.jpg")],
+                check=True,
+                capture_output=True,
+                timeout=settings.video_decode_timeout
+            )
+        except subprocess.CalledProcessError as e:
+            message = e.stderr.decode(errors='replace').strip()[-500:]
+            raise HTTPException(status_code=400, detail=f"Could not decode video {filename}: {message}")
+        except subprocess.TimeoutExpired:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Decode timeout: decoding {filename} took longer than {settings.video_decode_timeout:.0f} seconds"
+            )
+        frames = []
+        for index, path in enumerate(sorted(glob.glob(os.path.join(directory, "frame_*.jpg")))):
+            with open(path, 'rb') as frame_file:
+                frames.append((None, index / sample_fps, frame_file.read()))
+    if not frames:
+        raise HTTPException(status_code=400, detail=f"No frames could be decoded from {filename}")
+    return frames
+
+def extract_video_frames(data: bytes, filename: str, sample_fps: float, max_frames: int) -> List[Frame]:
+    """
+    Decode a video and sample its frames at `sample_fps`.
+
+    Animated images (GIF, WebP, APNG) are decoded with Pillow; a still image
+    becomes a single frame. Anything else is decoded with the `ffmpeg` binary.
+
+    Args:
+        data (bytes): The uploaded file
+        filename (str): Name of the upload, used in error messages
+        sample_fps (float): Frames per second to keep
+        max_frames (int): Maximum number of frames to return
+
+    Returns:
+        List[Frame]: The sampled frames with their timestamps
+
+    Raises:
+        HTTPException: 400 if the video cannot be decoded, 504 if decoding takes
+            too long and 501 if ffmpeg is needed but not installed
+    """
+    from PIL import Image, UnidentifiedImageError
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError):
+        return _sample_with_ffmpeg(data, filename, sample_fps, max_frames)
+    if getattr(image, "n_frames", 1) > 1:
+        return _sample_animation(image, sample_fps, max_frames)
+    return [(filename, None, data)]
+
+def _select_keyframes(hashes: List[Optional[int]]) -> Tuple[List[Optional[int]], List[Optional[int]]]:
+    """
+    Decide which frames to analyze.
+
+    A frame is analyzed when its perceptual hash is at least
+    `settings.video_change_min_distance` bits away from the last analyzed
+    frame; otherwise it reuses that frame's result. Comparing against the last
+    analyzed frame rather than the previous one keeps slow drift from going
+    unnoticed.
+
+    Returns:
+        Tuple[List[Optional[int]], List[Optional[int]]]: For every frame, the
+            index of the frame whose result it uses (itself for keyframes,
+            None if it could not be hashed) and its distance to that frame
+    """
+    references = []
+    distances = []
+    keyframe = None
+    for index, frame_hash in enumerate(hashes):
+        if frame_hash is None:
+            references.append(None)
+            distances.append(None)
+            continue
+        distance = None if keyframe is None else hash_distance(frame_hash, hashes[keyframe])
+        if distance is None or distance >= settings.video_change_min_distance:
+            keyframe = index
+        references.append(keyframe)
+        distances.append(distance)
+    return references, distances
+
+async def _analyze_keyframe(
+    index: int,
+    frame: Frame,
+    use_cache: bool,
+    priority: Priority,
+    semaphore: asyncio.Semaphore
+) -> ClothingAnalysisResponse:
+    filename, timestamp, image = frame
+    async with semaphore:
+        return await analyze_clothing(
+            image, filename or f"frame {index} ({timestamp or 0:.1f}s)", use_cache=use_cache, priority=priority
+        )
+
+async def analyze_frames(
+    frames: List[Frame],
+    use_cache: bool = True,
+    priority: Priority = "interactive"
+) -> AsyncIterator[FrameAnalysisResult]:
+    """
+    Analyze a sequence of frames, running the model only when the scene changes.
+
+    Every frame is perceptually hashed first; frames that differ little from
+    the last analyzed frame reuse its `ClothingAnalysisResponse`. The changed
+    frames are analyzed concurrently (at most `settings.batch_max_concurrency`
+    at once), and results are yielded in frame order.
+
+    Args:
+        frames (List[Frame]): Sampled frames in playback order
+        use_cache (bool): Whether cached results may be returned
+        priority (Priority): Admission class for the model calls
+
+    Yields:
+        FrameAnalysisResult: One record per frame, in frame order
+    """
+    def hash_frames() -> List[Optional[int]]:
+        hashes = []
+        for _, _, image in frames:
+            try:
+                hashes.append(perceptual_hash(image))
+            except Exception:
+                hashes.append(None)
+        return hashes
+
+    hashes = await asyncio.to_thread(hash_frames)
+    references, distances = _select_keyframes(hashes)
+
+    semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+    tasks: Dict[int, asyncio.Task] = {
+        index: asyncio.create_task(_analyze_keyframe(index, frames[index], use_cache, priority, semaphore))
+        for index, reference in enumerate(references)
+        if reference == index
+    }
+    try:
+        for index, (filename, timestamp, _) in enumerate(frames):
+            reference = references[index]
+            record = dict(index=index, timestamp=timestamp, filename=filename,
+                          changed=reference == index, hash_distance=distances[index])
+            if reference is None:
+                VIDEO_FRAMES.labels(outcome="failed").inc()
+                yield FrameAnalysisResult(**record, status="error", error="Invalid image data", status_code=400)
+                continue
+            if reference != index:
+                record['reused_from'] = reference
+            try:
+                result = await tasks[reference]
+            except HTTPException as e:
+                VIDEO_FRAMES.labels(outcome="failed").inc()
+                yield FrameAnalysisResult(**record, status="error", error=str(e.detail), status_code=e.status_code)
+                continue
+            except Exception as e:
+                VIDEO_FRAMES.labels(outcome="failed").inc()
+                yield FrameAnalysisResult(**record, status="error", error=str(e), status_code=500)
+                continue
+            VIDEO_FRAMES.labels(outcome="analyzed" if reference == index else "reused").inc()
+            yield FrameAnalysisResult(**record, status="ok", result=result)
+    finally:
+        # The client may disconnect mid-stream; stop the remaining work
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
@@ -1,7 +1,7 @@
 def resize_image(image, target_size):
     from PIL import Image
     image = Image.open(image)
-    image = image.resize(target_size, Image.ANTIALIAS)
+    image = image.resize(target_size, Image.Resampling.LANCZOS)
     return image
 
 def normalize_image(image):
@@ -12,4 +12,53 @@ def normalize_image(image):
 def preprocess_image(image, target_size=(224, 224)):
     resized_image = resize_image(image, target_size)
     normalized_image = normalize_image(resized_image)
-    return normalized_image
\ No newline at end of file
+    return normalized_image
+
+def perceptual_hash(image_bytes, hash_size=8):
+    # Difference hash (dHash): compares neighbouring pixels of a tiny grayscale
+    # thumbnail, so re-encoded or slightly shifted frames hash to nearby values.
+    import io
+    from PIL import Image
+    image = Image.open(io.BytesIO(image_bytes)).convert("L")
+    image = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hash_distance(a, b):
+    # Number of differing bits between two perceptual hashes
+    return bin(a ^ b).count("1")
+
+
+def prepare_image_for_inference(image_bytes, max_edge=1024, image_format="JPEG", quality=85):
+    # Normalise an upload before it is sent to the model: apply EXIF orientation,
+    # cap the long edge, flatten transparency and re-encode. Metadata is dropped
+    # because nothing from the original info/exif is passed to save().
+    import io
+    from PIL import Image, ImageOps
+    image = Image.open(io.BytesIO(image_bytes))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, format=image_format, quality=quality)
+    return output.getvalue()
+
+def blank_image(size=(64, 64)):
+    # Small uniform grey JPEG, e.g. for warming up the model
+    import io
+    from PIL import Image
+    output = io.BytesIO()
+    Image.new("RGB", size, (128, 128, 128)).save(output, format="JPEG")
+    return output.getvalue()
@@ -0,0 +1,61 @@
+"""
+Inference worker: runs asynchronous analysis jobs from the shared job queue.
+
+Start any number of these next to the API, on the same host for the sqlite
+queue or on any host for the redis queue; set JOB_API_WORKERS=0 on the API
+nodes to leave all inference to them:
+
+    JOB_QUEUE_BACKEND=redis JOB_QUEUE_REDIS_URL=redis://queue:6379/0 python -m app.worker --concurrency 2
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from app.core.config import settings
+from app.services.image_analysis import warm_up_chat_arguments
+from app.services.job_queue import get_job_queue
+from app.services.job_worker import run_worker
+from app.services.ollama_client import get_pool
+
+logger = logging.getLogger(__name__)
+
+async def serve(concurrency: int, name: str) -> None:
+    """Warm up the model and run jobs until SIGINT or SIGTERM."""
+    pool = get_pool()
+    if settings.model_warm_up_enabled:
+        pool.start_warm_up(**warm_up_chat_arguments())
+    pool.start_health_checks()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    queue = get_job_queue()
+    logger.info(f"Worker {name} serving the {settings.job_queue_backend} job queue with {concurrency} slots")
+    try:
+        await run_worker(queue, concurrency, name, stop)
+    finally:
+        await queue.close()
+        await pool.close()
+    logger.info(f"Worker {name} stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run analysis jobs from the shared job queue.")
+    parser.add_argument('--concurrency', type=int, default=settings.job_worker_concurrency,
+                        help=f"Jobs run at once (default: {settings.job_worker_concurrency})")
+    parser.add_argument('--name', default=f"{socket.gethostname()}-{os.getpid()}", help="Worker name shown on jobs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level)
+    if settings.job_queue_backend == "memory":
+        raise SystemExit("The memory job queue lives inside the API process; "
+                         "set JOB_QUEUE_BACKEND to sqlite or redis to run separate workers")
+    # Let every slot's passes reach Ollama instead of queueing behind the API default
+    settings.admission_max_in_flight = max(settings.admission_max_in_flight, args.concurrency)
+    asyncio.run(serve(args.concurrency, args.name))
+
+if __name__ == '__main__':
+    main()
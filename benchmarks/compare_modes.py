@@ -0,0 +1,158 @@
+"""
+Compare analysis modes on latency, model calls and accuracy.
+
+Runs every image through each mode (multi_pass with each pass schedule, and
+single_pass) against the configured Ollama server(s), with the result cache
+disabled, and prints a per-mode summary.
+
+Accuracy needs a labels file mapping image names to expected values of dotted
+`ClothingAnalysisResponse` fields, for example:
+
+    {"F1.JPG": {"clothing_info.eyewear.wearing": true, "clothing_info.upper_body.type": "jacket"}}
+
+Without labels the first mode is the reference and the others are scored on
+agreement with it.
+
+Example:
+    python benchmarks/compare_modes.py --labels labels.json --repeat 3 --json report.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.services.image_analysis import analyze_clothing  # noqa: E402
+from app.services.trace import AnalysisTrace  # noqa: E402
+
+# (label, analysis_mode, pass_schedule)
+MODES = [
+    ("multi_pass/sequential", "multi_pass", "sequential"),
+    ("multi_pass/parallel", "multi_pass", "parallel"),
+    ("multi_pass/speculative", "multi_pass", "speculative"),
+    ("single_pass", "single_pass", "parallel"),
+]
+MODEL_PASSES = ("main_pass", "eyewear_pass", "description_pass")
+# Free-text fields vary run to run; only categorical fields are compared
+COMPARED_PREFIX = "clothing_info."
+
+def flatten(value, prefix=""):
+    """Flatten nested dicts into {"a.b.c": leaf} form."""
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}{key}."))
+        return flat
+    return {prefix[:-1]: value}
+
+def score(predicted: dict, expected: dict):
+    """Return (matching fields, compared fields)."""
+    matches = sum(1 for field, value in expected.items() if predicted.get(field) == value)
+    return matches, len(expected)
+
+async def run_mode(mode, paths, repeat):
+    label, analysis_mode, pass_schedule = mode
+    settings.analysis_mode = analysis_mode
+    settings.pass_schedule = pass_schedule
+    runs = []
+    for path in paths:
+        with open(path, 'rb') as image_file:
+            image = image_file.read()
+        for _ in range(repeat):
+            trace = AnalysisTrace()
+            start = time.perf_counter()
+            try:
+                result = await analyze_clothing(image, os.path.basename(path), use_cache=False, trace=trace)
+                fields = {key: value for key, value in flatten(result.model_dump()).items()
+                          if key.startswith(COMPARED_PREFIX)}
+                error = None
+            except HTTPException as e:
+                fields, error = None, f"{e.status_code}: {e.detail}"
+            runs.append({
+                "image": os.path.basename(path),
+                "latency": time.perf_counter() - start,
+                "model_calls": sum(1 for name in MODEL_PASSES if name in trace.timings),
+                "fields": fields,
+                "error": error,
+            })
+    return label, runs
+
+def summarize(label, runs, expected_by_image):
+    ok = [run for run in runs if run["error"] is None]
+    latencies = sorted(run["latency"] for run in ok)
+    matches = compared = 0
+    for run in ok:
+        expected = expected_by_image.get(run["image"])
+        if expected:
+            run_matches, run_compared = score(run["fields"], expected)
+            matches += run_matches
+            compared += run_compared
+    return {
+        "mode": label,
+        "runs": len(runs),
+        "errors": len(runs) - len(ok),
+        "p50": statistics.median(latencies) if latencies else None,
+        "p95": latencies[max(0, round(0.95 * len(latencies)) - 1)] if latencies else None,
+        "mean_model_calls": statistics.mean(run["model_calls"] for run in ok) if ok else None,
+        "accuracy": matches / compared if compared else None,
+    }
+
+async def main_async(args):
+    paths = sorted(path for pattern in args.images for path in glob.glob(pattern)
+                   if path.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')))
+    if not paths:
+        raise SystemExit("No images found")
+    settings.cache_enabled = False
+    modes = [mode for mode in MODES if not args.modes or mode[0] in args.modes]
+
+    labels = None
+    if args.labels:
+        with open(args.labels, encoding='utf-8') as labels_file:
+            labels = json.load(labels_file)
+
+    results = [await run_mode(mode, paths, args.repeat) for mode in modes]
+
+    if labels is None:
+        # Score agreement with the first mode's first run of each image
+        reference = {}
+        for run in results[0][1]:
+            if run["fields"] is not None:
+                reference.setdefault(run["image"], run["fields"])
+        expected_by_image = reference
+        accuracy_label = f"agreement with {results[0][0]}"
+    else:
+        expected_by_image = labels
+        accuracy_label = "accuracy vs labels"
+
+    summaries = [summarize(label, runs, expected_by_image) for label, runs in results]
+    print(f"\n{len(paths)} images x {args.repeat} runs; last column is {accuracy_label}\n")
+    print(f"{'mode':<24}{'runs':>6}{'errors':>8}{'p50':>9}{'p95':>9}{'calls':>7}{'score':>8}")
+    for summary in summaries:
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else '-'
+        print(f"{summary['mode']:<24}{summary['runs']:>6}{summary['errors']:>8}"
+              f"{fmt(summary['p50'], '>8.2f')}s{fmt(summary['p95'], '>8.2f')}s"
+              f"{fmt(summary['mean_model_calls'], '>7.2f')}{fmt(summary['accuracy'], '>8.1%')}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as report:
+            json.dump({"summaries": summaries, "runs": dict(results)}, report, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare analysis modes on latency and accuracy.")
+    parser.add_argument('images', nargs='*', default=['samples/*'], help="Image glob patterns (default: samples/*)")
+    parser.add_argument('--labels', help="JSON file of expected field values per image name")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per image and mode (default: 1)")
+    parser.add_argument('--modes', nargs='+', choices=[mode[0] for mode in MODES], help="Modes to compare (default: all)")
+    parser.add_argument('--json', help="Also write the full report to this file")
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Measure how long a worker takes to import the app.
+
+Every run imports the module in a fresh interpreter with `python -X importtime`,
+so nothing is shared between runs but the OS file cache. Prints the median
+total import time and the modules with the largest cumulative import time.
+
+With `--baseline`, exits non-zero if the median is more than
+`--max-regression` slower than the stored baseline; `--save-baseline` writes
+the current measurement as the new baseline.
+
+Example:
+    python benchmarks/import_time.py --repeat 10
+    python benchmarks/import_time.py --save-baseline benchmarks/baselines/import_time.json
+    python benchmarks/import_time.py --baseline benchmarks/baselines/import_time.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(module: str) -> dict:
+    """Import `module` in a fresh interpreter and return {module name: cumulative seconds}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, total, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(total) / 1e6
+    return cumulative
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the app.")
+    parser.add_argument('--module', default='app.main', help="Module to import (default: app.main)")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of fresh-interpreter runs (default: 5)")
+    parser.add_argument('--top', type=int, default=15, help="Number of slowest modules to list (default: 15)")
+    parser.add_argument('--baseline', help="JSON file from --save-baseline to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help="Allowed slowdown relative to the baseline, as a fraction (default: 0.25)")
+    parser.add_argument('--save-baseline', help="Write the measurement to this JSON file")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    totals = sorted(run[args.module] for run in runs)
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median * 1000:.0f} ms, "
+          f"min {totals[0] * 1000:.0f} ms, max {totals[-1] * 1000:.0f} ms over {args.repeat} runs\n")
+
+    # Median per module across runs; only top-level packages and the app's own modules
+    modules = {
+        name: statistics.median(run.get(name, 0.0) for run in runs)
+        for name in runs[0]
+        if "." not in name or name.split(".")[0] == args.module.split(".")[0]
+    }
+    print(f"{'module':<48}{'cumulative':>12}")
+    for name, seconds in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<48}{seconds * 1000:>10.1f}ms")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump({"module": args.module, "median_seconds": median}, baseline_file, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)["median_seconds"]
+        change = median / baseline - 1
+        print(f"\nBaseline {baseline * 1000:.0f} ms, change {change:+.1%}")
+        if change > args.max_regression:
+            raise SystemExit(f"Import time regressed by more than {args.max_regression:.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+Load-test the API over HTTP and check the results against a stored baseline.
+
+By default this starts a mock Ollama server (see benchmarks/mock_ollama.py)
+and the app itself under uvicorn, pointed at the mock with the result cache
+disabled, then drives one endpoint with the `samples/` images:
+
+- at a fixed request rate (`--rps`, open loop: requests are sent on schedule
+  whether or not earlier ones have finished, and latency is measured from the
+  scheduled send time so a slow server can't hide its queueing), or
+- with a fixed number of concurrent clients (`--concurrency`, closed loop).
+
+It reports throughput, p50/p95/p99 latency and error rates (and time to the
+first event for the stream endpoint). `--save-baseline` stores the result in a
+JSON file under a key naming the scenario, together with the run parameters
+(load, app settings and mock latency); `--baseline` refuses to compare runs
+whose parameters differ, and otherwise exits non-zero when latency,
+throughput or error rate regressed by more than the allowed margin. Use
+`--url` to test an already running server.
+
+Example:
+    python benchmarks/load_test.py --endpoint analyze --concurrency 4 --duration 20
+    python benchmarks/load_test.py --endpoint analyze --rps 5 --duration 30 \\
+        --baseline benchmarks/baselines/load_test.json
+    python benchmarks/load_test.py --endpoint batch --batch-size 4 --concurrency 2 --requests 20
+"""
+import argparse
+import asyncio
+import glob
+import json
+import mimetypes
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mock_ollama  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = {
+    "analyze": "/api/v1/analyze",
+    "stream": "/api/v1/analyze/stream",
+    "batch": "/api/v1/analyze/batch",
+    "video": "/api/v1/analyze/video",
+}
+# Metrics compared against the baseline: (name, True if higher is worse)
+CHECKED_METRICS = (("p50", True), ("p95", True), ("throughput", False))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, round(fraction * len(ordered)) - 1)] if ordered else None
+
+def load_images(patterns):
+    paths = sorted(path for pattern in patterns for path in glob.glob(pattern)
+                   if path.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')))
+    if not paths:
+        raise SystemExit("No images found")
+    images = []
+    for path in paths:
+        with open(path, 'rb') as image_file:
+            images.append((os.path.basename(path), image_file.read(),
+                           mimetypes.guess_type(path)[0] or 'application/octet-stream'))
+    return images
+
+def start_app(args, ollama_url: str):
+    """Start the app under uvicorn against `ollama_url` and wait until it is ready."""
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_HOSTS": json.dumps([ollama_url]),
+        "CACHE_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    })
+    env.update(dict(item.split("=", 1) for item in args.env))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("The app exited during startup")
+        try:
+            if httpx.get(f"{url}/health/ready", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("The app did not become ready within 60 seconds")
+
+async def send(client: httpx.AsyncClient, args, images, index: int, scheduled: float) -> dict:
+    """Send one request and return its outcome; latency counts from `scheduled`."""
+    if args.endpoint in ("batch", "video"):
+        files = [("files", images[(index * args.batch_size + offset) % len(images)])
+                 for offset in range(args.batch_size)]
+    else:
+        files = {"file": images[index % len(images)]}
+    first_event = None
+    try:
+        async with client.stream("POST", ENDPOINTS[args.endpoint], files=files) as response:
+            async for line in response.aiter_lines():
+                if first_event is None and line:
+                    first_event = time.perf_counter() - scheduled
+            status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return {"status": status, "latency": time.perf_counter() - scheduled, "first_event": first_event}
+
+async def run_load(args, url: str, images) -> tuple:
+    results = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+
+        def more(index: int) -> bool:
+            if args.requests is not None:
+                return index < args.requests
+            return time.perf_counter() - start < args.duration
+
+        if args.rps:
+            tasks = []
+            index = 0
+            while more(index):
+                scheduled = start + index / args.rps
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                tasks.append(asyncio.create_task(send(client, args, images, index, scheduled)))
+                index += 1
+            results = await asyncio.gather(*tasks)
+        else:
+            next_index = 0
+
+            async def worker():
+                nonlocal next_index
+                while more(next_index):
+                    index = next_index
+                    next_index += 1
+                    results.append(await send(client, args, images, index, time.perf_counter()))
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+def summarize(results, elapsed: float) -> dict:
+    ok = [result for result in results if result["status"] == 200]
+    latencies = [result["latency"] for result in ok]
+    first_events = [result["first_event"] for result in ok if result["first_event"] is not None]
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": 1 - len(ok) / len(results) if results else 0.0,
+        "errors": dict(Counter(str(result["status"]) for result in results if result["status"] != 200)),
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "mean": statistics.mean(latencies) if latencies else None,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+    }
+    if first_events:
+        summary["first_event_p50"] = percentile(first_events, 0.50)
+        summary["first_event_p95"] = percentile(first_events, 0.95)
+    return summary
+
+def scenario_name(args) -> str:
+    load = f"rps{args.rps:g}" if args.rps else f"c{args.concurrency}"
+    batch = f"-b{args.batch_size}" if args.endpoint in ("batch", "video") else ""
+    return f"{args.endpoint}{batch}-{load}"
+
+def run_parameters(args) -> dict:
+    """Settings that shape the measured numbers; runs are only comparable when they match."""
+    parameters = {
+        "endpoint": args.endpoint,
+        "rps": args.rps,
+        "concurrency": None if args.rps else args.concurrency,
+        "duration": None if args.requests is not None else args.duration,
+        "requests": args.requests,
+        "batch_size": args.batch_size if args.endpoint in ("batch", "video") else None,
+        "env": sorted(args.env),
+        "url": args.url,
+    }
+    if not args.url:
+        parameters["mock"] = {
+            "latency": args.mock_latency,
+            "latency_distribution": args.mock_latency_distribution,
+            "latency_spread": args.mock_latency_spread,
+            "parallel": args.mock_parallel,
+            "fail_rate": args.mock_fail_rate,
+        }
+    return parameters
+
+def parameter_differences(current: dict, baseline: dict, prefix: str = "") -> list:
+    differences = []
+    for key in sorted(set(current) | set(baseline)):
+        a, b = baseline.get(key), current.get(key)
+        if isinstance(a, dict) and isinstance(b, dict):
+            differences.extend(parameter_differences(b, a, f"{prefix}{key}."))
+        elif a != b:
+            differences.append(f"{prefix}{key}: {a!r} in the baseline, {b!r} now")
+    return differences
+
+def compare(summary: dict, baseline: dict, max_regression: float, max_error_rate_increase: float) -> list:
+    """Return a description of every metric that regressed past the allowed margin."""
+    failures = []
+    for name, higher_is_worse in CHECKED_METRICS:
+        current, reference = summary.get(name), baseline.get(name)
+        if current is None or not reference:
+            continue
+        change = current / reference - 1
+        print(f"  {name:<12}{reference:>10.3f} -> {current:<10.3f}{change:+.1%}")
+        if (change if higher_is_worse else -change) > max_regression:
+            failures.append(f"{name} changed by {change:+.1%}")
+    error_increase = summary["error_rate"] - baseline.get("error_rate", 0.0)
+    print(f"  {'error_rate':<12}{baseline.get('error_rate', 0.0):>10.3f} -> {summary['error_rate']:<10.3f}")
+    if error_increase > max_error_rate_increase:
+        failures.append(f"error rate rose by {error_increase:.1%}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API and compare against a baseline.")
+    parser.add_argument('images', nargs='*', default=[os.path.join(ROOT, 'samples', '*')],
+                        help="Image glob patterns (default: samples/*)")
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='analyze', help="Endpoint to drive (default: analyze)")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--rps', type=float, help="Open-loop request rate")
+    load.add_argument('--concurrency', type=int, default=4, help="Closed-loop concurrent clients (default: 4)")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds to send requests for (default: 20)")
+    parser.add_argument('--requests', type=int, help="Send exactly this many requests instead of using --duration")
+    parser.add_argument('--batch-size', type=int, default=4, help="Images per batch/video request (default: 4)")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Per-request timeout in seconds (default: 300)")
+    parser.add_argument('--url', help="Test this running server instead of starting the app against a mock")
+    parser.add_argument('--env', nargs='*', default=[], metavar="KEY=VALUE", help="Extra settings for the started app")
+    parser.add_argument('--mock-latency', type=float, default=0.2, help="Mean mock seconds per model call (default: 0.2)")
+    parser.add_argument('--mock-latency-distribution', choices=sorted(mock_ollama.LATENCY_DISTRIBUTIONS),
+                        default='fixed', help="Mock latency distribution (default: fixed)")
+    parser.add_argument('--mock-latency-spread', type=float, default=0.25,
+                        help="Mock latency spread as a fraction of the mean (default: 0.25)")
+    parser.add_argument('--mock-parallel', type=int, default=0, help="Mock parallel slots (default: unlimited)")
+    parser.add_argument('--mock-fail-rate', type=float, default=0.0, help="Fraction of mock calls that fail (default: 0)")
+    parser.add_argument('--json', help="Also write the summary to this file")
+    parser.add_argument('--save-baseline', help="Store the summary in this baseline file")
+    parser.add_argument('--baseline', help="Baseline file to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Allowed relative worsening of p50/p95 latency and throughput (default: 0.2)")
+    parser.add_argument('--max-error-rate-increase', type=float, default=0.01,
+                        help="Allowed absolute increase of the error rate (default: 0.01)")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    process = None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        config = mock_ollama.build_parser().parse_args([
+            "--port", "0", "--latency", str(args.mock_latency),
+            "--latency-distribution", args.mock_latency_distribution,
+            "--latency-spread", str(args.mock_latency_spread),
+            "--parallel", str(args.mock_parallel), "--fail-rate", str(args.mock_fail_rate),
+        ])
+        server = mock_ollama.serve(config)
+        process, url = start_app(args, f"http://127.0.0.1:{server.server_address[1]}")
+
+    try:
+        results, elapsed = asyncio.run(run_load(args, url, images))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    scenario = scenario_name(args)
+    summary = summarize(results, elapsed)
+    summary["parameters"] = run_parameters(args)
+    print(f"\n{scenario}: {summary['requests']} requests in {elapsed:.1f}s, "
+          f"{summary['throughput']:.2f} ok/s, error rate {summary['error_rate']:.1%}")
+    if summary["errors"]:
+        print(f"  errors: {summary['errors']}")
+    for name in ("mean", "p50", "p95", "p99", "first_event_p50", "first_event_p95"):
+        if summary.get(name) is not None:
+            print(f"  {name:<16}{summary[name] * 1000:>9.0f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as report:
+            json.dump({scenario: summary}, report, indent=2)
+
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline, encoding='utf-8') as baseline_file:
+                baselines = json.load(baseline_file)
+        baselines[scenario] = summary
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print(f"\nSaved baseline {scenario} to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file).get(scenario)
+        if baseline is None:
+            raise SystemExit(f"No baseline for scenario {scenario} in {args.baseline}")
+        if "parameters" not in baseline:
+            raise SystemExit(f"Baseline {scenario} does not record its run parameters; re-record it with --save-baseline")
+        differences = parameter_differences(summary["parameters"], baseline["parameters"])
+        if differences:
+            raise SystemExit(f"Baseline {scenario} was recorded with different parameters:\n  "
+                             + "\n  ".join(differences))
+        print(f"\nCompared with baseline {scenario}:")
+        failures = compare(summary, baseline, args.max_regression, args.max_error_rate_increase)
+        if failures:
+            raise SystemExit("Regression: " + "; ".join(failures))
+        print("No regression")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Compare micro-batched and unbatched analysis for throughput and tail latency.
+
+Runs the same closed-loop load (a fixed number of concurrent clients, each
+sending its next image as soon as the previous one is answered) through the
+unbatched path and each micro-batching strategy, and prints throughput and
+latency percentiles per variant. The result cache and image preprocessing are
+disabled so only the model calls differ.
+
+By default the calls go to an in-process mock Ollama server whose
+`--parallel`, `--slot-overhead` and `--image-cost` options roughly model a GPU
+server (see benchmarks/mock_ollama.py); pass `--real` to use the configured
+Ollama server(s) instead.
+
+Example:
+    python benchmarks/micro_batching.py --clients 8 --requests 64
+    python benchmarks/micro_batching.py --real --clients 4 --requests 32 --window-ms 20
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_ollama  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.services.image_analysis import analyze_clothing  # noqa: E402
+from app.services.micro_batcher import get_micro_batcher  # noqa: E402
+
+# (label, micro-batching enabled, strategy)
+VARIANTS = [
+    ("unbatched", False, None),
+    ("parallel", True, "parallel"),
+    ("multi_image", True, "multi_image"),
+]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, round(fraction * len(ordered)) - 1)] if ordered else None
+
+async def run_variant(variant, images, clients, requests):
+    label, enabled, strategy = variant
+    settings.micro_batch_enabled = enabled
+    batcher = get_micro_batcher()
+    if strategy is not None:
+        batcher.strategy = strategy
+    calls_before = dict(batcher.stats())
+
+    latencies = []
+    errors = 0
+    next_request = 0
+
+    async def client():
+        nonlocal next_request, errors
+        while next_request < requests:
+            index = next_request
+            next_request += 1
+            start = time.perf_counter()
+            try:
+                await analyze_clothing(images[index % len(images)], f"request {index}", use_cache=False)
+                latencies.append(time.perf_counter() - start)
+            except HTTPException:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    stats = batcher.stats()
+    batches = stats["batches"] - calls_before["batches"]
+    calls = stats["calls"] - calls_before["calls"]
+    return {
+        "variant": label,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "errors": errors,
+        "avg_batch": calls / batches if batches else None,
+    }
+
+async def main_async(args):
+    paths = sorted(path for pattern in args.images for path in glob.glob(pattern)
+                   if path.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')))
+    if not paths:
+        raise SystemExit("No images found")
+    images = []
+    for path in paths:
+        with open(path, 'rb') as image_file:
+            images.append(image_file.read())
+
+    settings.cache_enabled = False
+    settings.image_preprocessing_enabled = False
+    settings.model_warm_up_enabled = False
+    # Let every client reach the model so the batcher, not other limits, shapes the load
+    settings.admission_max_in_flight = max(settings.admission_max_in_flight, args.clients)
+    settings.ollama_max_concurrency = max(settings.ollama_max_concurrency, args.clients)
+    settings.micro_batch_window_ms = args.window_ms
+    settings.micro_batch_max_size = args.max_batch
+    batcher = get_micro_batcher()
+    batcher.window = args.window_ms / 1000
+    batcher.max_size = args.max_batch
+
+    variants = [variant for variant in VARIANTS if not args.variants or variant[0] in args.variants]
+    results = [await run_variant(variant, images, args.clients, args.requests) for variant in variants]
+
+    print(f"\n{args.requests} requests from {args.clients} clients; window {args.window_ms:g} ms, "
+          f"max batch {args.max_batch}\n")
+    print(f"{'variant':<14}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'batch':>7}{'errors':>8}")
+    for result in results:
+        def fmt(value, width, unit=""):
+            return f"{value:>{width}.2f}{unit}" if value is not None else f"{'-':>{width + len(unit)}}"
+        print(f"{result['variant']:<14}{result['throughput']:>8.2f}{fmt(result['p50'], 8, 's')}"
+              f"{fmt(result['p95'], 8, 's')}{fmt(result['p99'], 8, 's')}"
+              f"{fmt(result['avg_batch'], 7)}{result['errors']:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batching against the unbatched path.")
+    parser.add_argument('images', nargs='*', default=['samples/*'], help="Image glob patterns (default: samples/*)")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent clients (default: 8)")
+    parser.add_argument('--requests', type=int, default=64, help="Requests per variant (default: 64)")
+    parser.add_argument('--window-ms', type=float, default=10.0, help="Micro-batch window (default: 10)")
+    parser.add_argument('--max-batch', type=int, default=4, help="Maximum micro-batch size (default: 4)")
+    parser.add_argument('--variants', nargs='+', choices=[variant[0] for variant in VARIANTS],
+                        help="Variants to run (default: all)")
+    parser.add_argument('--real', action='store_true', help="Use the configured Ollama server(s) instead of a mock")
+    parser.add_argument('--mock-latency', type=float, default=0.5, help="Mock seconds per call (default: 0.5)")
+    parser.add_argument('--mock-parallel', type=int, default=4, help="Mock parallel slots (default: 4)")
+    parser.add_argument('--mock-slot-overhead', type=float, default=0.15,
+                        help="Mock slowdown per extra concurrent call (default: 0.15)")
+    parser.add_argument('--mock-image-cost', type=float, default=0.3,
+                        help="Mock cost of each extra image in a multi-image call (default: 0.3)")
+    args = parser.parse_args()
+
+    if not args.real:
+        config = mock_ollama.build_parser().parse_args([
+            "--port", "0", "--latency", str(args.mock_latency), "--parallel", str(args.mock_parallel),
+            "--slot-overhead", str(args.mock_slot_overhead), "--image-cost", str(args.mock_image_cost),
+        ])
+        server = mock_ollama.serve(config)
+        settings.ollama_hosts = [f"http://127.0.0.1:{server.server_address[1]}"]
+        settings.ollama_health_check_interval = 0
+    asyncio.run(main_async(args))
+
+if __name__ == '__main__':
+    main()
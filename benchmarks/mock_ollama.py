@@ -0,0 +1,235 @@
+"""
+Stand-in for an Ollama server, for exercising the API without a GPU.
+
+Implements just enough of the Ollama HTTP API for this app: `/api/chat`
+(streaming and non-streaming), `/api/ps`, `/api/tags`, `/api/show` and
+`/api/version`. Chat responses are canned JSON shaped like the pass that asked
+for them; the first chat "loads" the model (`--load-time`) and `/api/ps` then
+lists it. `--parallel`, `--slot-overhead` and `--image-cost` give a rough model
+of a GPU server's parallel slots and of multi-image requests. Several instances on different ports make a multi-backend pool; use
+`--fail-rate` or `--down` to exercise retries and circuit breaking.
+
+Example:
+    python benchmarks/mock_ollama.py --port 11500 --latency 0.5 --latency-distribution lognormal
+    OLLAMA_HOSTS='["http://127.0.0.1:11500","http://127.0.0.1:11501"]' uvicorn app.main:app
+"""
+import argparse
+import contextlib
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MAIN_PASS_RESPONSE = {
+    "clothing_info": {
+        "upper_body": {"type": "jacket", "sleeve_length": "long"},
+        "lower_body": None,
+        "eyewear": {"wearing": False, "type": "unknown", "frame_style": "unknown"},
+        "headwear": {"wearing": False, "type": "unknown"},
+        "accessories": {"wearing": False, "type": "unknown"},
+    },
+    "general_description": "A person wearing a dark jacket over a light shirt.",
+    "thermal_properties": "Moderately warm",
+    "weather_appropriateness": "Suitable for cool weather, around 10-15°C",
+}
+
+EYEWEAR_PASS_RESPONSE = {"wearing": True, "type": "glasses", "frame_style": "thin"}
+
+DESCRIPTION_PASS_RESPONSE = {
+    "general_description": "The driver wears a dark zip-up jacket over a light cotton shirt.",
+    "thermal_properties": "Moderately warm thanks to the jacket layer",
+    "weather_appropriateness": "Suitable for cool spring or autumn days, approximately 10-15°C",
+}
+
+def _model_tag(name: str) -> str:
+    return name if ":" in name else f"{name}:latest"
+
+def canned_content(request: dict) -> str:
+    """Pick a canned answer matching the pass that sent the request."""
+    schema = json.dumps(request.get("format") or {})
+    prompt = " ".join(message.get("content", "") for message in request.get("messages", []))
+    results = (request.get("format") or {}).get("properties", {}).get("results")
+    if results is not None:
+        # Multi-image call: one answer per image
+        return json.dumps({"results": [EYEWEAR_PASS_RESPONSE] * results.get("minItems", 1)})
+    if "clothing_info" in schema:
+        return json.dumps(MAIN_PASS_RESPONSE)
+    if "frame_style" in schema or ("eyewear" in prompt.lower() and "general_description" not in prompt + schema):
+        return json.dumps(EYEWEAR_PASS_RESPONSE)
+    return json.dumps(DESCRIPTION_PASS_RESPONSE)
+
+def _lognormal(mean: float, spread: float) -> float:
+    # Parameters chosen so the distribution's mean is `mean` and its
+    # coefficient of variation is `spread`, giving a long right tail
+    sigma = math.sqrt(math.log(1 + spread ** 2))
+    return random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+
+LATENCY_DISTRIBUTIONS = {
+    "fixed": lambda mean, spread: mean,
+    "uniform": lambda mean, spread: random.uniform(mean * (1 - spread), mean * (1 + spread)),
+    "normal": lambda mean, spread: max(0.0, random.gauss(mean, mean * spread)),
+    "lognormal": _lognormal,
+    "exponential": lambda mean, spread: random.expovariate(1 / mean),
+}
+
+def make_latency_sampler(mean: float, distribution: str = "fixed", spread: float = 0.25):
+    """Return a function drawing call latencies (in seconds) with the given mean."""
+    if mean <= 0:
+        return lambda: 0.0
+    draw = LATENCY_DISTRIBUTIONS[distribution]
+    return lambda: draw(mean, spread)
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # argparse.Namespace, set in serve()
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _check_up(self) -> bool:
+        if self.config.down:
+            self._send_json(503, {"error": "mock server is down"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._check_up():
+            return
+        if self.path == "/api/ps":
+            self._send_json(200, {"models": [{"name": name, "model": name} for name in sorted(self.config.loaded)]})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.config.model, "model": self.config.model}]})
+        elif self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-mock"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._check_up():
+            return
+        request = self._read_json()
+        if self.path == "/api/show":
+            if _model_tag(request.get("model", "")) != _model_tag(self.config.model):
+                self._send_json(404, {"error": f"model '{request.get('model')}' not found"})
+                return
+            self._send_json(200, {"modelfile": "", "parameters": "", "template": "", "details": {}, "model_info": {}})
+        elif self.path == "/api/chat":
+            self._chat(request)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _chat(self, request: dict) -> None:
+        if self.config.load_time and _model_tag(request.get("model", "")) not in self.config.loaded:
+            time.sleep(self.config.load_time)
+        self.config.loaded.add(_model_tag(request.get("model", "")))
+        images = sum(len(message.get("images") or []) for message in request.get("messages", []))
+        with self.config.slots:
+            with self.config.lock:
+                self.config.running += 1
+                concurrent = self.config.running
+            try:
+                # Requests sharing the GPU slow each other down a little; extra
+                # images in one request cost a fraction of a request each
+                time.sleep(self.config.latency_sampler()
+                           * (1 + self.config.slot_overhead * (concurrent - 1))
+                           * (1 + self.config.image_cost * max(images - 1, 0)))
+            finally:
+                with self.config.lock:
+                    self.config.running -= 1
+        if random.random() < self.config.fail_rate:
+            self._send_json(500, {"error": "mock failure"})
+            return
+
+        content = canned_content(request)
+        base = {
+            "model": request.get("model", self.config.model),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if not request.get("stream", True):
+            self._send_json(200, {**base, "message": {"role": "assistant", "content": content},
+                                  "done": True, "done_reason": "stop"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        for piece in pieces:
+            self._write_chunk({**base, "message": {"role": "assistant", "content": piece}, "done": False})
+        self._write_chunk({**base, "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload: dict) -> None:
+        data = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run a mock Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="llama3.2-vision:11b", help="Model name reported by /api/tags")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean seconds each chat call takes")
+    parser.add_argument("--latency-distribution", choices=sorted(LATENCY_DISTRIBUTIONS), default="fixed",
+                        help="How call latency varies around --latency (default: fixed)")
+    parser.add_argument("--latency-spread", type=float, default=0.25,
+                        help="Spread of the distribution as a fraction of --latency (default: 0.25)")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Extra seconds the first chat call takes, as if loading the model")
+    parser.add_argument("--parallel", type=int, default=0,
+                        help="Requests processed at once, like OLLAMA_NUM_PARALLEL; others queue (default: unlimited)")
+    parser.add_argument("--slot-overhead", type=float, default=0.0,
+                        help="Slowdown per additional request running at the same time, as a fraction of --latency")
+    parser.add_argument("--image-cost", type=float, default=1.0,
+                        help="Cost of each additional image in one request, as a fraction of --latency")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of chat calls answered with HTTP 500")
+    parser.add_argument("--down", action="store_true", help="Answer every request with HTTP 503")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser
+
+def serve(config: argparse.Namespace) -> ThreadingHTTPServer:
+    """Start a mock server in a background thread and return it."""
+    if not hasattr(config, "latency_sampler"):
+        config.latency_sampler = make_latency_sampler(
+            config.latency, getattr(config, "latency_distribution", "fixed"), getattr(config, "latency_spread", 0.25)
+        )
+    config.loaded = set()  # Models "loaded" by a chat call, as reported by /api/ps
+    config.slots = threading.BoundedSemaphore(config.parallel) if getattr(config, "parallel", 0) else contextlib.nullcontext()
+    config.lock = threading.Lock()
+    config.running = 0
+    for name, default in (("slot_overhead", 0.0), ("image_cost", 1.0), ("load_time", 0.0)):
+        if not hasattr(config, name):
+            setattr(config, name, default)
+    handler = type("ConfiguredMockOllamaHandler", (MockOllamaHandler,), {"config": config})
+    server = ThreadingHTTPServer((config.host, config.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    config = build_parser().parse_args()
+    server = serve(config)
+    print(f"Mock Ollama listening on http://{config.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,261 @@
-import os
-import glob
-from app.services.image_analysis import analyze_clothing
+"""
+Bulk clothing analysis from the command line.
+
+Analyzes every image under the given directories, files or glob patterns with
+N concurrent workers and appends one record per image, keyed by the SHA-256 of
+the file, to a JSONL file or a directory of Parquet parts. Rerunning with the
+same output skips images that were already analyzed successfully, so an
+interrupted run resumes where it stopped.
+
+Example:
+    python demo_image_analysis.py datasets/fashionpedia/val --output val.jsonl --workers 4
+"""
+import argparse
 import asyncio
+import glob
+import hashlib
+import json
+import math
+import os
+import time
+from collections import Counter, defaultdict
+from fastapi import HTTPException
 from tqdm import tqdm
+from app.core.config import settings
+from app.core.prompts import prompts
+from app.services.image_analysis import analyze_clothing
+from app.services.trace import AnalysisTrace
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+def find_images(inputs):
+    """Expand directories, files and glob patterns into a sorted list of image paths."""
+    paths = set()
+    for pattern in inputs:
+        matches = glob.glob(pattern, recursive=True) or [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                for root, _, files in os.walk(match):
+                    paths.update(os.path.join(root, name) for name in files)
+            elif os.path.isfile(match):
+                paths.add(match)
+    return sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS))
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class JsonlWriter:
+    """Appends records to a JSONL file, flushing after every line."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def completed(self):
+        done = set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as output:
+                for line in output:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partially written last line from an interrupted run
+                    if record.get('status') == 'ok':
+                        done.add(record['sha256'])
+        return done
+
+    def open(self):
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class ParquetWriter:
+    """Writes records as a directory of Parquet part files (requires pyarrow)."""
+
+    def __init__(self, path, rows_per_part):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow: pip install pyarrow")
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self._rows = []
+
+    def completed(self):
+        import pyarrow.parquet as pq
+        done = set()
+        for part in glob.glob(os.path.join(self.path, 'part-*.parquet')):
+            table = pq.read_table(part, columns=['sha256', 'status'])
+            for sha256, status in zip(table['sha256'].to_pylist(), table['status'].to_pylist()):
+                if status == 'ok':
+                    done.add(sha256)
+        return done
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def write(self, record):
+        self._rows.append({
+            'sha256': record['sha256'],
+            'path': record['path'],
+            'status': record['status'],
+            'error': record.get('error'),
+            'status_code': record.get('status_code'),
+            'prompt_version': record.get('prompt_version'),
+            'result': json.dumps(record['result']) if record.get('result') else None,
+            'timings': json.dumps(record['timings']),
+        })
+        if len(self._rows) >= self.rows_per_part:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        part = os.path.join(self.path, f"part-{time.time_ns()}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._rows), part + '.tmp')
+        os.replace(part + '.tmp', part)  # Never leave a truncated part behind
+        self._rows = []
+
+    def close(self):
+        self._flush()
+
+# Latencies are counted in logarithmic buckets 5% apart, from 1 ms up, so the
+# summary needs constant memory however many images a run processes
+_BUCKET_BASE = 0.001
+_BUCKET_GROWTH = 1.05
+
+class RunSummary:
+    """Running counters and per-stage latency histograms for the end-of-run summary."""
+
+    def __init__(self):
+        self.processed = 0
+        self.succeeded = 0
+        self.errors = Counter()
+        self.stage_counts = Counter()
+        self.stage_sums = defaultdict(float)
+        self.stage_buckets = defaultdict(Counter)
+
+    def add(self, record):
+        self.processed += 1
+        if record['status'] != 'ok':
+            self.errors[f"{record.get('status_code')}: {record.get('error', '')[:80]}"] += 1
+            return
+        self.succeeded += 1
+        for stage, seconds in record['timings'].items():
+            self.stage_counts[stage] += 1
+            self.stage_sums[stage] += seconds
+            bucket = max(0, math.ceil(math.log(max(seconds, _BUCKET_BASE) / _BUCKET_BASE, _BUCKET_GROWTH)))
+            self.stage_buckets[stage][bucket] += 1
+
+    def percentile(self, stage, pct):
+        # Upper edge of the bucket holding the pct-th percentile
+        target = max(1, round(pct / 100 * self.stage_counts[stage]))
+        seen = 0
+        for bucket, count in sorted(self.stage_buckets[stage].items()):
+            seen += count
+            if seen >= target:
+                return _BUCKET_BASE * _BUCKET_GROWTH ** bucket
+        return 0.0
+
+    def print(self, elapsed, skipped):
+        print(f"\nProcessed {self.processed} images in {elapsed:.1f}s "
+              f"({self.processed / elapsed if elapsed else 0:.2f} images/sec), skipped {skipped} already done")
+        print(f"Succeeded: {self.succeeded}  Failed: {self.processed - self.succeeded}")
+
+        if self.stage_counts:
+            print(f"\n{'stage':<18}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+            for stage in sorted(self.stage_counts):
+                count = self.stage_counts[stage]
+                print(f"{stage:<18}{count:>7}{self.stage_sums[stage] / count:>8.2f}s"
+                      f"{self.percentile(stage, 50):>8.2f}s{self.percentile(stage, 95):>8.2f}s"
+                      f"{self.percentile(stage, 99):>8.2f}s")
+            print("(percentiles are accurate to within 5%)")
+        if self.errors:
+            print("\nErrors:")
+            for error, count in self.errors.most_common():
+                print(f"  {count:>5}  {error}")
+
+async def process_images(paths, writer, workers, use_cache):
+    done = await asyncio.to_thread(writer.completed)
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    summary = RunSummary()
+    skipped = 0
+    progress = tqdm(total=len(paths), desc='Processing Images', unit='image')
+
+    async def worker():
+        nonlocal skipped
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            sha256 = await asyncio.to_thread(file_sha256, path)
+            if sha256 in done:
+                skipped += 1
+                progress.update()
+                continue
+            done.add(sha256)  # Identical files later in the run are skipped too
+
+            trace = AnalysisTrace()
+            record = {'sha256': sha256, 'path': path}
+            try:
+                with open(path, 'rb') as image_file:
+                    image_data = image_file.read()
+                result = await analyze_clothing(
+                    image_data, os.path.basename(path), use_cache=use_cache, trace=trace, priority="bulk"
+                )
+                record.update(status='ok', result=result.model_dump(), prompt_version=prompts.version)
+            except HTTPException as e:
+                record.update(status='error', error=str(e.detail), status_code=e.status_code)
+            except Exception as e:
+                record.update(status='error', error=str(e), status_code=None)
+            record['timings'] = trace.timings
+            writer.write(record)
+            summary.add(record)
+            progress.update()
+
+    start_time = time.time()
+    writer.open()
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        writer.close()
+        progress.close()
+    summary.print(time.time() - start_time, skipped)
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze clothing in many images with the configured Ollama model.")
+    parser.add_argument('inputs', nargs='+', help="Image files, directories or glob patterns")
+    parser.add_argument('-o', '--output', required=True, help="JSONL file, or directory for --format parquet")
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl', help="Output format (default: jsonl)")
+    parser.add_argument('-w', '--workers', type=int, default=4, help="Number of images analyzed concurrently (default: 4)")
+    parser.add_argument('--rows-per-part', type=int, default=500, help="Rows per Parquet part file (default: 500)")
+    parser.add_argument('--no-cache', action='store_true', help="Ignore cached results")
+    args = parser.parse_args()
+
+    paths = find_images(args.inputs)
+    if not paths:
+        raise SystemExit("No images found")
+
+    # Let every worker's passes reach Ollama instead of queueing behind the API default
+    settings.ollama_max_concurrency = max(settings.ollama_max_concurrency, args.workers)
+    settings.admission_max_in_flight = max(settings.admission_max_in_flight, args.workers)
+
+    writer = ParquetWriter(args.output, args.rows_per_part) if args.format == 'parquet' else JsonlWriter(args.output)
+    asyncio.run(process_images(paths, writer, args.workers, not args.no_cache))
 
-async def process_images():
-    # Directory containing images
-    image_dir = 'C:/Users/ahosny/Documents/Projects/datasets/fashionpedia/val/'
-    image_paths = glob.glob(os.path.join(image_dir, '*'))
-    # Loop through each image file in the directory with a progress bar
-    for image_path in tqdm(image_paths, desc='Processing Images', unit='image'):
-        if image_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-            with open(image_path, 'rb') as image_file:
-                image_data = image_file.read()
-                image_name = os.path.basename(image_path)
-                
-                # Analyze the clothing in the image
-                try:
-                    analysis_result = await analyze_clothing(image_data, image_name)
-                    print(f'Analysis for {image_name}:', analysis_result)
-                except Exception as e:
-                    print(f'Error analyzing {image_name}: {str(e)}')
-
-# Call the async function
-asyncio.run(process_images())
+if __name__ == '__main__':
+    main()